@@ -0,0 +1,128 @@
+import numpy as np
+import math
+
+from filter_cache import FILTER_CACHE
+
+LFE_SPEAKER_NAME = "LFE"
+# The source of the mono bass bus, it sits in front of the head and turns with it
+BASS_SOURCE_NAME = "Bass"
+
+
+def get_butterworth_section(crossover_hz, samplerate, highpass):
+    # Second order Butterworth from the Audio EQ Cookbook, as (b0, b1, b2, a1, a2) with a0 = 1
+    omega = 2 * math.pi * crossover_hz / samplerate
+    alpha = math.sin(omega) / (2 * math.sqrt(0.5))
+    a0 = 1 + alpha
+    if highpass:
+        b = [(1 + math.cos(omega)) / 2, -(1 + math.cos(omega)), (1 + math.cos(omega)) / 2]
+    else:
+        b = [(1 - math.cos(omega)) / 2, 1 - math.cos(omega), (1 - math.cos(omega)) / 2]
+    return b[0] / a0, b[1] / a0, b[2] / a0, -2 * math.cos(omega) / a0, (1 - alpha) / a0
+
+
+def get_linkwitz_riley_sections(crossover_hz, samplerate, highpass):
+    # Two Butterworth sections make a 4th order Linkwitz-Riley, its low and high halves add up flat
+    section = get_butterworth_section(crossover_hz, samplerate, highpass)
+    return [section, section]
+
+
+def sections_to_state_space(sections):
+    # Transposed direct form II of every section, the sections are chained in series
+    order = 2 * len(sections)
+    a = np.zeros((order, order))
+    b = np.zeros(order)
+    c = np.zeros(order)
+    d = 1.0
+    for i, (b0, b1, b2, a1, a2) in enumerate(sections):
+        state = slice(2 * i, 2 * i + 2)
+        section_a = np.array([[-a1, 1.0], [-a2, 0.0]])
+        section_b = np.array([b1 - a1 * b0, b2 - a2 * b0])
+        # The section input is the output of the sections before it
+        a[state] = np.outer(section_b, c)
+        a[state, state] = section_a
+        b[state] = section_b * d
+        c = b0 * c
+        c[state] = [1.0, 0.0]
+        d = b0 * d
+    return a, b, c, d
+
+
+class BlockFilter:
+    # An IIR cascade run exactly one block at a time on every channel at once: the response to the block
+    # is an FFT convolution with the impulse response and the state carried over adds its decay
+    def __init__(self, sections, channels):
+        self.__sections = sections
+        self.__a, self.__b, self.__c, self.__d = sections_to_state_space(sections)
+        self.__state = np.zeros((len(self.__a), channels))
+        self.__block_tables = {}
+
+    def __build_block_tables(self, frames):
+        # One row per frame of the block: impulse response, response to the carried state, weight of the input in the next state
+        order = len(self.__a)
+        impulse_response = np.empty(frames)
+        state_response = np.empty((frames, order))
+        state_inputs = np.empty((order, frames))
+        power = np.identity(order)
+        impulse_response[0] = self.__d
+        for n in range(frames):
+            state_response[n] = self.__c @ power
+            state_inputs[:, frames - 1 - n] = power @ self.__b
+            if n + 1 < frames:
+                impulse_response[n + 1] = state_response[n] @ self.__b
+            power = power @ self.__a
+        return np.column_stack((impulse_response, state_response, state_inputs.T))
+
+    def __get_block_tables(self, frames):
+        if frames not in self.__block_tables:
+            # The block size is the partition size of the cached tables
+            tables = FILTER_CACHE.load("crossover_blocks", {"sections": self.__sections, "frames": frames},
+                                       lambda: self.__build_block_tables(frames))
+            order = len(self.__a)
+            self.__block_tables[frames] = (np.fft.rfft(tables[:, 0], 2 * frames)[:, np.newaxis], np.array(tables[:, 1:1 + order]),
+                                           np.array(tables[:, 1 + order:].T), np.linalg.matrix_power(self.__a, frames))
+        return self.__block_tables[frames]
+
+    def __call__(self, block):
+        frames = len(block)
+        impulse_spectrum, state_response, state_inputs, block_power = self.__get_block_tables(frames)
+        output = np.fft.irfft(np.fft.rfft(block, 2 * frames, axis=0) * impulse_spectrum, 2 * frames, axis=0)[:frames]
+        output += state_response @ self.__state
+        self.__state = block_power @ self.__state + state_inputs @ block
+        return output
+
+
+class BassManager:
+    # The lows of every speaker and the LFE channel go to one mono bus that isn't spatialized,
+    # the speakers keep only what is above the crossover
+    def __init__(self, samplerate, speaker_names, dtype, crossover_hz=None):
+        self.__dtype = dtype
+        self.__lfe_indexes = [i for i, speaker_name in enumerate(speaker_names) if speaker_name == LFE_SPEAKER_NAME]
+        self.__speaker_indexes = [i for i, speaker_name in enumerate(speaker_names) if speaker_name != LFE_SPEAKER_NAME]
+        self.__source_names = [speaker_names[i] for i in self.__speaker_indexes] + [BASS_SOURCE_NAME]
+        self.__gains = np.ones(len(speaker_names))
+
+        self.__highpass = None
+        self.__lowpass = None
+        if crossover_hz is not None:
+            self.__highpass = BlockFilter(get_linkwitz_riley_sections(crossover_hz, samplerate, True), len(self.__speaker_indexes))
+            # Filtering is linear, so the speakers are summed first and their lows filtered once
+            self.__lowpass = BlockFilter(get_linkwitz_riley_sections(crossover_hz, samplerate, False), 1)
+
+    def get_source_names(self):
+        return self.__source_names
+
+    def set_gains(self, gains):
+        # The speaker volumes, the bus carries them itself because its source plays at full gain
+        self.__gains = np.asarray(gains, dtype=np.float64)
+
+    def process(self, channels_data):
+        block = np.stack(channels_data, axis=1).astype(np.float64)
+        speakers = block[:, self.__speaker_indexes]
+        bass = block[:, self.__lfe_indexes] @ self.__gains[self.__lfe_indexes]
+        if self.__lowpass is not None:
+            bass += self.__lowpass(speakers @ self.__gains[self.__speaker_indexes, np.newaxis])[:, 0]
+            speakers = self.__highpass(speakers)
+
+        limits = np.iinfo(self.__dtype)
+        sources = np.clip(np.column_stack((speakers, bass)), limits.min, limits.max).astype(self.__dtype)
+        return [np.ascontiguousarray(sources[:, i]) for i in range(sources.shape[1])]
@@ -0,0 +1,169 @@
+import socketserver
+import numpy as np
+import threading
+import socket
+import json
+import time
+import os
+
+import face_tracker
+
+SOCKET_PATH = os.path.join(os.environ.get("XDG_RUNTIME_DIR", "/tmp"), "virtual_surround.sock")
+CLIENT_TIMEOUT = 2.0
+STATUS_CACHE_SECONDS = 0.02
+
+
+class ControlError(Exception):
+    pass
+
+
+class ControlRequestHandler(socketserver.StreamRequestHandler):
+    # One JSON request per line, answered by one JSON response per line
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                response = {"ok": True, "result": self.server.execute(request.pop("command"), request)}
+            except Exception as error:
+                response = {"ok": False, "error": f"{type(error).__name__}: {error}"}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, commands, socket_path=SOCKET_PATH):
+        if ControlClient(socket_path).is_available():
+            raise ControlError(f"Another instance is already listening on {socket_path}")
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+        self.__commands = commands
+        self.__socket_path = socket_path
+        super().__init__(socket_path, ControlRequestHandler)
+        os.chmod(socket_path, 0o600)
+
+    def execute(self, command, parameters):
+        if command not in self.__commands:
+            raise ControlError(f"Unknown command: {command}")
+        return self.__commands.get(command)(**parameters)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.__socket_path):
+            os.remove(self.__socket_path)
+
+
+class ControlClient:
+    def __init__(self, socket_path=SOCKET_PATH, timeout=CLIENT_TIMEOUT):
+        self.__socket_path = socket_path
+        self.__timeout = timeout
+        self.__lock = threading.Lock()
+        self.__socket = None
+        self.__file = None
+
+    def __connect(self):
+        client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client_socket.settimeout(self.__timeout)
+        try:
+            client_socket.connect(self.__socket_path)
+        except OSError:
+            client_socket.close()
+            raise
+        self.__socket = client_socket
+        self.__file = client_socket.makefile("rwb")
+
+    def is_available(self):
+        try:
+            self.request("ping")
+            return True
+        except OSError:
+            self.close()
+            return False
+
+    def request(self, command, **parameters):
+        try:
+            with self.__lock:
+                if self.__socket is None:
+                    self.__connect()
+
+                self.__file.write(json.dumps({"command": command, **parameters}).encode("utf-8") + b"\n")
+                self.__file.flush()
+                line = self.__file.readline()
+
+            if not line:
+                raise ConnectionResetError("Control socket closed the connection")
+        except OSError:
+            self.close()
+            raise
+
+        response = json.loads(line)
+        if not response.get("ok"):
+            raise ControlError(response.get("error"))
+        return response.get("result")
+
+    def close(self):
+        with self.__lock:
+            if self.__socket is not None:
+                self.__file.close()
+                self.__socket.close()
+            self.__socket = None
+            self.__file = None
+
+
+class RemoteFaceTracker:
+    # Stands in for FaceTracker in the GUI when the daemon owns the camera
+    def __init__(self, control_client, width=320, height=240):
+        self.__control_client = control_client
+        self.__width = width
+        self.__height = height
+        self.__status = None
+        self.__status_time = 0.0
+
+    def __get_status(self):
+        if self.__status is None or time.monotonic() - self.__status_time >= STATUS_CACHE_SECONDS:
+            self.__status = self.__control_client.request("status")
+            self.__status_time = time.monotonic()
+        return self.__status
+
+    def open_camera(self):
+        pass
+
+    def load_model(self):
+        pass
+
+    def is_ready(self):
+        return self.__get_status().get("tracking_ready")
+
+    def find_offset_rotation_matrix(self):
+        self.__control_client.request("recenter")
+        self.__status = None
+
+    def reset_rotation_offset(self):
+        self.__control_client.request("reset_center")
+        self.__status = None
+
+    def get_offset_rotation_matrix(self):
+        return np.array(self.__get_status().get("offset_rotation_matrix"))
+
+    def set_offset_rotation_matrix(self, offset_rotation_matrix):
+        self.__control_client.request("set_offset_rotation_matrix", offset_rotation_matrix=np.asarray(offset_rotation_matrix).tolist())
+        self.__status = None
+
+    def get_current_yaw_angle(self, rotation_matrix=None):
+        return self.__get_status().get("yaw")
+
+    def get_current_offset_yaw_angle(self):
+        return self.__get_status().get("offset_yaw")
+
+    def check_camera_angle(self, angle):
+        return abs(angle) <= face_tracker.MAXIMUM_ANGLE_FOR_OPTIMAL_SETTING
+
+    def get_current_frame_with_positional_arrow(self):
+        # Frames stay in the daemon, only the pose crosses the socket
+        return np.zeros((self.__height, self.__width, 3), dtype=np.uint8)
+
+    def cleanup(self):
+        pass
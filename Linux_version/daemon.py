@@ -0,0 +1,246 @@
+import numpy as np
+import copy
+import threading
+import asyncio
+import pulsectl
+import signal
+
+import virtual_player as vp
+import pulse_events
+import face_tracker
+import performance_profiles
+import settings
+import control
+import metrics
+from pipeline import Pipeline
+
+
+class SurroundDaemon:
+    def __init__(self, socket_path=control.SOCKET_PATH, settings_file_name=settings.SAVE_FILE_NAME, tracker_options=None,
+                 player_options=None):
+        self.__settings_file_name = settings_file_name
+        self.__player_options = dict(player_options or {})
+        self.__socket_path = socket_path
+
+        restored_settings = settings.restore_settings(self.__settings_file_name)
+        self.__media_name = restored_settings.get("media.name")
+        self.__selected_surround_system = restored_settings.get("selected_surround_system")
+        self.__speakers_parameters = restored_settings.get("speakers_parameters")
+        self.__headset_name = restored_settings.get("headset_name")
+        self.__listener_headsets = restored_settings.get("listener_headsets", [])
+
+        # Commands arrive on several connection threads, but player and pulse calls have to be serial
+        self.__lock = threading.RLock()
+        self.__stop_event = threading.Event()
+
+        # What this headset and these cameras sustained in earlier sessions, the tracker and the player start from there
+        self.__profiles_file_name = performance_profiles.get_profiles_file_name(settings_file_name)
+        self.__tracker_profile = performance_profiles.TrackerProfile((tracker_options or {}).get("cameras") or [0], 320, 240,
+                                                                     self.__profiles_file_name)
+
+        self.__face_tracker = face_tracker.create_face_tracker(width=320, height=240, seconds_before_recenter=10,
+                                                               max_faces=1 + len(self.__listener_headsets),
+                                                               **self.__tracker_profile.apply(tracker_options or {}))
+        self.__face_tracker.set_offset_rotation_matrix(np.array(restored_settings.get("offset_rotation_matrix")))
+        self.__player_options.setdefault("pose_update_rate", self.__tracker_profile.get_pose_update_rate(vp.POSE_UPDATE_RATE))
+        self.__audio_profile = None
+
+        self.__pulse = pulsectl.Pulse()
+        self.__pulse_events = pulse_events.PulseEventListener()
+        self.__pulse_events.start()
+
+        self.__virtual_player = None
+        self.__server = None
+        # Startup and the control socket are stages too, the player and the cameras run pipelines of their own
+        self.__pipeline = Pipeline("daemon")
+        self.__pipeline.add_executor("startup")
+        self.__pipeline.add_executor("control")
+
+    def __get_headset_names(self):
+        return [sink.name for sink in self.__pulse_events.get_sinks() if not vp.is_virtual_sink_name(sink.name, settings.SINK_NAME)]
+
+    def __find_headset_name(self, headset):
+        for sink in self.__pulse_events.get_sinks():
+            if not vp.is_virtual_sink_name(sink.name, settings.SINK_NAME) and headset in (sink.name, sink.description):
+                return sink.name
+        raise ValueError(f"Unknown headset: {headset}")
+
+    def __choose_headset_name(self):
+        headset_names = self.__get_headset_names()
+        if self.__headset_name in headset_names:
+            return self.__headset_name
+
+        default_sink_name = self.__pulse.server_info().default_sink_name
+        if default_sink_name in headset_names:
+            return default_sink_name
+        # After a crash the default is still the old virtual sink, the player cleans it up once it starts
+        saved_headset_name = vp.get_saved_headset_name()
+        if saved_headset_name in headset_names:
+            return saved_headset_name
+        return headset_names[0]
+
+    def get_commands(self):
+        return {
+            "ping": lambda: "pong",
+            "status": self.status,
+            "metrics": metrics.METRICS.render,
+            "get_settings": self.get_settings,
+            "save_settings": self.save_settings,
+            "list_headsets": self.list_headsets,
+            "recenter": self.recenter,
+            "reset_center": self.reset_center,
+            "set_offset_rotation_matrix": self.set_offset_rotation_matrix,
+            "configure": self.configure,
+            "set_speaker": self.set_speaker,
+            "set_speakers_parameters": self.set_speakers_parameters,
+            "set_object_parameters": self.set_object_parameters
+        }
+
+    def status(self):
+        with self.__lock:
+            speakers_parameters = copy.deepcopy(self.__speakers_parameters)
+            objects_parameters = {} if self.__virtual_player is None else self.__virtual_player.get_objects_parameters()
+        return {
+            "headset_name": self.__headset_name,
+            "selected_surround_system": self.__selected_surround_system,
+            "playing": self.__virtual_player is not None,
+            "tracking_ready": self.__face_tracker.is_ready(),
+            "yaw": self.__face_tracker.get_current_yaw_angle(),
+            "pitch": self.__face_tracker.get_current_pitch_angle(),
+            "roll": self.__face_tracker.get_current_roll_angle(),
+            "offset_yaw": self.__face_tracker.get_current_offset_yaw_angle(),
+            "offset_rotation_matrix": self.__face_tracker.get_offset_rotation_matrix().tolist(),
+            "speakers_parameters": speakers_parameters,
+            "listener_headsets": self.__listener_headsets,
+            "object_names": list(objects_parameters),
+            "objects_parameters": objects_parameters,
+            "listeners_yaw": [self.__face_tracker.get_current_yaw_angle(self.__face_tracker.get_current_orientation(face_index=i))
+                              for i in range(self.__face_tracker.get_max_faces())]
+        }
+
+    def get_settings(self):
+        with self.__lock:
+            speakers_parameters = copy.deepcopy(self.__speakers_parameters)
+        return {
+            "media.name": self.__media_name,
+            "offset_rotation_matrix": self.__face_tracker.get_offset_rotation_matrix().tolist(),
+            "selected_surround_system": self.__selected_surround_system,
+            "speakers_parameters": speakers_parameters,
+            "headset_name": self.__headset_name,
+            "listener_headsets": self.__listener_headsets
+        }
+
+    def save_settings(self):
+        with self.__lock:
+            settings.save_settings(self.get_settings(), self.__settings_file_name)
+
+    def list_headsets(self):
+        return [{"name": sink.name, "description": sink.description} for sink in self.__pulse_events.get_sinks()
+                if not vp.is_virtual_sink_name(sink.name, settings.SINK_NAME)]
+
+    def recenter(self):
+        self.__face_tracker.find_offset_rotation_matrix()
+
+    def reset_center(self):
+        self.__face_tracker.reset_rotation_offset()
+
+    def set_offset_rotation_matrix(self, offset_rotation_matrix):
+        self.__face_tracker.set_offset_rotation_matrix(np.array(offset_rotation_matrix))
+
+    def configure(self, surround_system=None, headset=None):
+        with self.__lock:
+            if surround_system is not None:
+                if surround_system not in settings.SURROUND_SYSTEM_DICT_SOUNDDEVICE_ORDER:
+                    raise ValueError(f"Unknown surround system: {surround_system}")
+                self.__selected_surround_system = surround_system
+            old_headset_name = self.__headset_name
+            if headset is not None:
+                self.__headset_name = self.__find_headset_name(headset)
+
+            self.__virtual_player.reconfigure(channels_number=settings.get_channels_number(self.__selected_surround_system),
+                                              headset_name=self.__headset_name,
+                                              objects=self.__selected_surround_system == settings.OBJECTS_SURROUND_SYSTEM)
+
+            # The buffers stay, but the dropouts from now on belong to the new headset
+            if self.__headset_name != old_headset_name:
+                self.__audio_profile.save(self.__virtual_player.get_buffers_number())
+                self.__audio_profile = performance_profiles.AudioProfile(self.__headset_name, self.__profiles_file_name)
+
+    def set_speaker(self, speaker_name, volume=None, angle=None):
+        with self.__lock:
+            speaker = self.__speakers_parameters.get(speaker_name)
+            if speaker is None:
+                raise ValueError(f"Unknown speaker: {speaker_name}")
+
+            if volume is not None:
+                speaker["volume"] = int(min(max(volume, 0), 100))
+            if angle is not None:
+                lowest_angle = min(speaker.get("min_angle"), speaker.get("max_angle"))
+                highest_angle = max(speaker.get("min_angle"), speaker.get("max_angle"))
+                speaker["angle"] = int(min(max(angle, lowest_angle), highest_angle))
+            return dict(speaker)
+
+    def set_speakers_parameters(self, speakers_parameters):
+        # The player reads this dict live, so it is updated in place
+        with self.__lock:
+            for speaker_name, speaker in speakers_parameters.items():
+                if speaker_name in self.__speakers_parameters:
+                    self.__speakers_parameters[speaker_name].update(speaker)
+
+    def set_object_parameters(self, object_name, parameters):
+        # Applications are placed by the player and forgotten when they close, nothing of them is saved
+        with self.__lock:
+            self.__virtual_player.set_object_parameters(object_name, parameters)
+
+    def run(self):
+        # Binding first makes a second daemon fail before it touches the audio setup
+        self.__server = control.ControlServer(self.get_commands(), self.__socket_path)
+
+        self.__pipeline.add_stage("tracker startup", self.__pipeline.run, "startup", self.__face_tracker.initialize)
+        self.__pipeline.add_stage("profiling", self.__sample_tracker_profile)
+        self.__pipeline.start()
+
+        with self.__lock:
+            self.__headset_name = self.__choose_headset_name()
+            self.__audio_profile = performance_profiles.AudioProfile(self.__headset_name, self.__profiles_file_name)
+            self.__virtual_player = vp.VirtualPlayer(pulse=self.__pulse, pulse_events=self.__pulse_events, face_tracker=self.__face_tracker,
+                                                     headset_name=self.__headset_name, media_name=self.__media_name,
+                                                     channels_number=settings.get_channels_number(self.__selected_surround_system),
+                                                     speakers_parameters=self.__speakers_parameters, sink_name=settings.SINK_NAME,
+                                                     listener_headset_names=self.__listener_headsets,
+                                                     objects=self.__selected_surround_system == settings.OBJECTS_SURROUND_SYSTEM,
+                                                     **self.__audio_profile.apply(self.__player_options))
+            self.__virtual_player.start_playing()
+
+        self.__pipeline.add_stage("control", self.__pipeline.run, "control", self.__server.serve_forever)
+        print(f"Virtual Surround is listening on: {self.__socket_path}.")
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.__stop_event.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: self.__stop_event.set())
+        self.__stop_event.wait()
+
+        self.stop()
+
+    async def __sample_tracker_profile(self):
+        while True:
+            await asyncio.sleep(performance_profiles.PROFILE_SAMPLE_SECONDS)
+            self.__tracker_profile.sample()
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__pipeline.stop()
+
+        with self.__lock:
+            self.save_settings()
+            self.__audio_profile.save(self.__virtual_player.get_buffers_number())
+            self.__tracker_profile.save()
+            self.__virtual_player.stop()
+            self.__virtual_player = None
+
+        self.__pulse_events.stop()
+        self.__face_tracker.cleanup()
+
+
+def main(socket_path=control.SOCKET_PATH, tracker_options=None, player_options=None):
+    SurroundDaemon(socket_path=socket_path, tracker_options=tracker_options, player_options=player_options).run()
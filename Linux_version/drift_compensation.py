@@ -0,0 +1,59 @@
+import numpy as np
+
+from metrics import METRICS
+
+FILL_SMOOTHING = 0.02
+PROPORTIONAL_GAIN = 0.1
+INTEGRAL_GAIN = 0.01
+# 1000 ppm is below 2 cents of pitch, far under what anyone hears
+MAXIMUM_CORRECTION = 0.001
+
+
+class DriftEstimator:
+    # The ring buffer fill drifts when the capture and the headset clocks disagree,
+    # a PI controller on its smoothed error gives the resampling ratio that holds it on target
+    def __init__(self, target_frames, samplerate):
+        self.__target_frames = target_frames
+        self.__samplerate = samplerate
+        self.__smoothed_fill = None
+        self.__integral = 0.0
+
+    def update(self, fill_frames, block_frames):
+        if self.__smoothed_fill is None:
+            self.__smoothed_fill = float(fill_frames)
+        self.__smoothed_fill += FILL_SMOOTHING * (fill_frames - self.__smoothed_fill)
+
+        error_seconds = (self.__smoothed_fill - self.__target_frames) / self.__samplerate
+        correction = PROPORTIONAL_GAIN * error_seconds + INTEGRAL_GAIN * self.__integral
+        # The integral only grows while the correction isn't clamped, so it can't wind up
+        if abs(correction) < MAXIMUM_CORRECTION:
+            self.__integral += error_seconds * block_frames / self.__samplerate
+        correction = min(max(correction, -MAXIMUM_CORRECTION), MAXIMUM_CORRECTION)
+
+        METRICS.set_gauge("output_latency_error_seconds", error_seconds)
+        METRICS.set_gauge("drift_correction_ppm", -correction * 1e6)
+        # A fuller buffer than wanted means the headset is slower, so fewer frames are produced
+        return 1.0 - correction
+
+
+class AdaptiveResampler:
+    # Catmull-Rom interpolation, the read position and the last three input frames carry over between blocks
+    def __init__(self, channels):
+        self.__history = np.zeros((3, channels), dtype=np.float32)
+        self.__position = 1.0
+
+    def process(self, frames, ratio):
+        data = np.concatenate((self.__history, frames))
+        step = 1.0 / ratio
+        # Every output frame needs one input frame before and two after its position
+        count = int(np.ceil((len(data) - 2 - self.__position) / step))
+        positions = self.__position + step * np.arange(count)
+
+        indexes = np.floor(positions).astype(int)
+        t = (positions - indexes)[:, np.newaxis]
+        p0, p1, p2, p3 = data[indexes - 1], data[indexes], data[indexes + 1], data[indexes + 2]
+        output = p1 + 0.5 * t * (p2 - p0 + t * (2.0 * p0 - 5.0 * p1 + 4.0 * p2 - p3 + t * (3.0 * (p1 - p2) + p3 - p0)))
+
+        self.__position += step * count - len(frames)
+        self.__history = data[-3:]
+        return output.astype(np.float32)
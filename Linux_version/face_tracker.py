@@ -1,23 +1,78 @@
-import mediapipe as mp
 import numpy as np
+import threading
+import asyncio
+import importlib
 import copy
 import time
 import math
-import cv2
+
+from pose_filter import OneEuroFilter, POSE_FILTER_SETTINGS, save_pose_recording
+from realtime import INFERENCE_SETTINGS
+from pipeline import Pipeline
+from metrics import METRICS, RateGauge, RATE_SMOOTHING
+from tracing import traced
 
 ARROW_MARGIN = 50
 MAXIMUM_ANGLE_FOR_OPTIMAL_SETTING = 15
+MODEL_DELEGATES = ["cpu", "gpu"]
+# Largest nose movement between two processed frames, as a share of the frame, that still counts as the same face
+MAXIMUM_FACE_JUMP = 0.25
+CAMERA_WAIT_SECONDS = 0.1
+# A camera stage slower than this misses its deadline, the fused pose then lags behind the head
+CAMERA_FRAME_DEADLINE = 1 / 15
+
+# Imported on first use, they take most of the application startup time
+cv2 = None
+mp = None
+
+
+def import_opencv():
+    global cv2
+    if cv2 is None:
+        cv2 = importlib.import_module("cv2")
+        if INFERENCE_SETTINGS.get("threads") is not None:
+            cv2.setNumThreads(INFERENCE_SETTINGS.get("threads"))
+    return cv2
+
+
+def import_mediapipe():
+    global mp
+    if mp is None:
+        mp = importlib.import_module("mediapipe")
+    return mp
+
+
+def parse_camera_indexes(text):
+    return [int(part) for part in text.split(",") if part.strip()]
+
+
+def create_face_tracker(cameras=None, **tracker_options):
+    if cameras is None or len(cameras) == 1:
+        return FaceTracker(camera_index=cameras[0] if cameras else 0, **tracker_options)
+    return MultiCameraFaceTracker(cameras, **tracker_options)
 
 
 class FaceTracker:
 
-    def __init__(self, width=640, height=480, seconds_before_recenter=10):
+    def __init__(self, width=640, height=480, seconds_before_recenter=10, refine_landmarks=True,
+                 model_path=None, model_delegate="cpu", target_fps=None, max_faces=1, camera_index=0,
+                 pose_filter_settings=POSE_FILTER_SETTINGS, pose_recording_file=None):
 
+        self.__camera_index = camera_index
         self.__width = width
         self.__height = height
 
         self.__seconds_before_recenter = seconds_before_recenter
 
+        # Inference budget: the legacy FaceMesh solution has no delegate or thread options,
+        # a FaceLandmarker task model (model_path) can run on the GPU delegate. The OpenCV threads are capped by --inference-threads
+        self.__refine_landmarks = refine_landmarks
+        self.__model_path = model_path
+        self.__model_delegate = model_delegate
+        self.__frame_interval = 1.0 / target_fps if target_fps else 0.0
+        self.__last_frame_time = 0.0
+        self.__last_timestamp_ms = 0
+
         self.__default_rotation_matrix = np.array([
             [1.0, 0.0, 0.0],
             [0.0, -1.0, 0.0],
@@ -26,17 +81,29 @@ class FaceTracker:
 
         self.__offset_rotation_matrix = np.identity(3)
 
-        self.__current_rotation_matrix = self.__default_rotation_matrix
-        self.__lost_face_time = None
+        # One slot per listener, a face keeps its slot for as long as it is tracked
+        self.__max_faces = max_faces
+        self.__rotation_matrices = [self.__default_rotation_matrix] * max_faces
+        self.__clean_rotation_matrices = [None] * max_faces
+        self.__lost_face_times = [None] * max_faces
+        self.__faces_noses = [None] * max_faces
+
+        # None turns the smoothing off, the recording keeps the raw poses of the first face for the filter benchmark
+        self.__pose_filters = None
+        if pose_filter_settings is not None:
+            self.__pose_filters = [OneEuroFilter(**pose_filter_settings) for _ in range(max_faces)]
+        self.__pose_recording_file = pose_recording_file
+        self.__pose_recording = []
 
         self.__current_frame = None
 
-        self.__cap = cv2.VideoCapture(0)
-        self.__cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-        self.__cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.__cap = None
+        self.__camera_ready = threading.Event()
+
+        self.__mp_face_mesh = None
+        self.__face_mesh = None
+        self.__model_ready = threading.Event()
 
-        self.__mp_face_mesh = mp.solutions.face_mesh
-        self.__face_mesh = self.__mp_face_mesh.FaceMesh(static_image_mode=False, max_num_faces=1, refine_landmarks=True)
         self.__face_3d = np.array([
             [0.0, 0.0, 0.0],  # Nose
             [0.0, -73.6, -12.0],  # Chin
@@ -46,58 +113,195 @@ class FaceTracker:
             [18.0, -28.9, -24.0]  # Right corner of the mouth
         ], dtype=np.float64)
 
-        self.__face_2d = None
+        self.__faces_2d = [None] * max_faces
 
         self.__face_marks_idxs = [1, 199, 33, 263, 61, 291]
 
         self.__current_frame_with_positional_arrow = None
 
-    def __calculate_rotation_matrix(self, frame_rgb):
-        results = self.__face_mesh.process(frame_rgb)
-
-        if results.multi_face_landmarks:
-            face_landmarks = results.multi_face_landmarks[0]
-            self.__face_2d = np.array([
-                np.array(
-                    [face_landmarks.landmark[idx].x * self.__width, face_landmarks.landmark[idx].y * self.__height])
-                for idx in self.__face_marks_idxs
-            ], dtype=np.float32)
-
-            focal_length = self.__width
-            cam_matrix = np.array([
-                [focal_length, 0, self.__width / 2],
-                [0, focal_length, self.__height / 2],
-                [0, 0, 1]
-            ], dtype=np.float64)
-
-            dist_coeffs = np.zeros((4, 1))
-            success, rot_vec, trans_vec = cv2.solvePnP(self.__face_3d, self.__face_2d, cam_matrix, dist_coeffs,
-                                                       flags=cv2.SOLVEPNP_SQPNP)
-
-            if success:
-                clean_rotation_matrix, _ = cv2.Rodrigues(rot_vec)
-                self.__current_rotation_matrix = self.__offset_rotation_matrix @ clean_rotation_matrix
-                self.__lost_face_time = None
+        self.__fps_gauge = RateGauge(METRICS, "tracker_fps", camera=str(camera_index))
+        self.__face_lost_ratio = 0.0
+
+    def open_camera(self):
+        import_opencv()
+
+        self.__cap = cv2.VideoCapture(self.__camera_index)
+        self.__cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.__width)
+        self.__cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.__height)
+        if self.__frame_interval:
+            # Frames skipped by the budget must not pile up in the driver queue
+            self.__cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.__camera_ready.set()
+
+    def load_model(self):
+        import_opencv()
+        import_mediapipe()
+        if self.__model_path is None:
+            self.__mp_face_mesh = mp.solutions.face_mesh
+            self.__face_mesh = self.__mp_face_mesh.FaceMesh(static_image_mode=False, max_num_faces=self.__max_faces,
+                                                            refine_landmarks=self.__refine_landmarks)
+        else:
+            delegates = {"cpu": mp.tasks.BaseOptions.Delegate.CPU, "gpu": mp.tasks.BaseOptions.Delegate.GPU}
+            options = mp.tasks.vision.FaceLandmarkerOptions(
+                base_options=mp.tasks.BaseOptions(model_asset_path=self.__model_path,
+                                                  delegate=delegates.get(self.__model_delegate)),
+                running_mode=mp.tasks.vision.RunningMode.VIDEO,
+                num_faces=self.__max_faces)
+            self.__face_mesh = mp.tasks.vision.FaceLandmarker.create_from_options(options)
+        self.__model_ready.set()
+
+    def __detect_faces_landmarks(self, frame_rgb):
+        if self.__model_path is None:
+            results = self.__face_mesh.process(frame_rgb)
+            return [face_landmarks.landmark for face_landmarks in results.multi_face_landmarks or []]
+
+        # Video mode needs strictly increasing timestamps
+        self.__last_timestamp_ms = max(self.__last_timestamp_ms + 1, int(time.monotonic() * 1000))
+        image = mp.Image(image_format=mp.ImageFormat.SRGB, data=frame_rgb)
+        return self.__face_mesh.detect_for_video(image, self.__last_timestamp_ms).face_landmarks
+
+    def initialize(self):
+        self.open_camera()
+        self.load_model()
+
+    def is_ready(self):
+        return self.__camera_ready.is_set() and self.__model_ready.is_set()
+
+    def __is_face_slot_free(self, face_index):
+        lost_face_time = self.__lost_face_times[face_index]
+        return self.__faces_noses[face_index] is None or (
+            lost_face_time is not None and time.time() - lost_face_time >= self.__seconds_before_recenter)
+
+    def __assign_faces(self, faces_landmarks):
+        # A face keeps its slot by staying the closest one to where that slot's nose was seen last
+        noses = [np.array([face_landmarks[1].x, face_landmarks[1].y]) for face_landmarks in faces_landmarks]
+        unassigned_faces = list(range(len(noses)))
+        assignments = {}
+
+        for face_index, last_nose in enumerate(self.__faces_noses):
+            if last_nose is None or not unassigned_faces:
+                continue
+            nearest_face = min(unassigned_faces, key=lambda i: np.linalg.norm(noses[i] - last_nose))
+            if np.linalg.norm(noses[nearest_face] - last_nose) <= MAXIMUM_FACE_JUMP:
+                assignments[face_index] = nearest_face
+                unassigned_faces.remove(nearest_face)
+
+        # New faces go left to right, to free slots first and then to slots whose face just went missing
+        unassigned_faces.sort(key=lambda i: noses[i][0])
+        unmatched_slots = [face_index for face_index in range(self.__max_faces) if face_index not in assignments]
+        unmatched_slots.sort(key=lambda face_index: not self.__is_face_slot_free(face_index))
+        for face_index, face in zip(unmatched_slots, unassigned_faces):
+            assignments[face_index] = face
+
+        for face_index, face in assignments.items():
+            self.__faces_noses[face_index] = noses[face]
+        return {face_index: faces_landmarks[face] for face_index, face in assignments.items()}
+
+    def __solve_face_rotation_matrix(self, face_index, face_landmarks):
+        self.__faces_2d[face_index] = np.array([
+            np.array(
+                [face_landmarks[idx].x * self.__width, face_landmarks[idx].y * self.__height])
+            for idx in self.__face_marks_idxs
+        ], dtype=np.float32)
+
+        focal_length = self.__width
+        cam_matrix = np.array([
+            [focal_length, 0, self.__width / 2],
+            [0, focal_length, self.__height / 2],
+            [0, 0, 1]
+        ], dtype=np.float64)
 
-        elif self.__lost_face_time is None:
-            self.__lost_face_time = time.time()
+        dist_coeffs = np.zeros((4, 1))
+        success, rot_vec, trans_vec = cv2.solvePnP(self.__face_3d, self.__faces_2d[face_index], cam_matrix, dist_coeffs,
+                                                   flags=cv2.SOLVEPNP_SQPNP)
+
+        if success:
+            clean_rotation_matrix, _ = cv2.Rodrigues(rot_vec)
+            clean_rotation_matrix = self.__filter_rotation_matrix(face_index, clean_rotation_matrix)
+            self.__clean_rotation_matrices[face_index] = clean_rotation_matrix
+            self.__rotation_matrices[face_index] = self.__offset_rotation_matrix @ clean_rotation_matrix
+            self.__lost_face_times[face_index] = None
+
+    def __filter_rotation_matrix(self, face_index, clean_rotation_matrix):
+        # Relative to looking straight into the camera the rotation vector stays far from its 180 degree wrap
+        relative_rotation_vector, _ = cv2.Rodrigues(self.__default_rotation_matrix.T @ clean_rotation_matrix)
+        relative_rotation_vector = relative_rotation_vector.ravel()
+        timestamp = time.monotonic()
+
+        if self.__pose_recording_file is not None and face_index == 0:
+            self.__pose_recording.append([timestamp, *relative_rotation_vector.tolist()])
+        if self.__pose_filters is None:
+            return clean_rotation_matrix
+
+        filtered_rotation_vector = self.__pose_filters[face_index](relative_rotation_vector, timestamp)
+        filtered_rotation_matrix, _ = cv2.Rodrigues(filtered_rotation_vector)
+        return self.__default_rotation_matrix @ filtered_rotation_matrix
+
+    @traced("FaceTracker.calculate_rotation_matrix")
+    def __calculate_rotation_matrix(self, frame_rgb):
+        # All faces come out of one inference pass, only the pose solving is done per face
+        faces_landmarks = self.__detect_faces_landmarks(frame_rgb)
+        assigned_faces = self.__assign_faces(faces_landmarks) if faces_landmarks else {}
+
+        for face_index in range(self.__max_faces):
+            if face_index in assigned_faces:
+                self.__solve_face_rotation_matrix(face_index, assigned_faces.get(face_index))
+            elif self.__lost_face_times[face_index] is None:
+                self.__lost_face_times[face_index] = time.time()
+                # The next face in this slot may be someone else, it must not be blended with this one
+                if self.__pose_filters is not None:
+                    self.__pose_filters[face_index].reset()
+
+        return self.__rotation_matrices[0]
+
+    @traced("FaceTracker.calculate_current_orientation")
+    def calculate_current_orientation(self):
+        # Until the camera and the model are up, the listener keeps looking forward
+        if not self.is_ready():
+            return self.__rotation_matrices[0]
 
-        return self.__current_rotation_matrix
+        # Over budget the previous pose is reused and the camera isn't touched
+        frame_start = time.perf_counter()
+        if frame_start - self.__last_frame_time < self.__frame_interval:
+            return self.__rotation_matrices[0]
+        self.__last_frame_time = frame_start
+        cpu_start = time.thread_time()
 
-    def calculate_current_orientation(self):
         ret, frame = self.__cap.read()
         if not ret:
-            self.__lost_face_time = time.time()
-            return self.__current_rotation_matrix
+            self.__lost_face_times = [lost_face_time or time.time() for lost_face_time in self.__lost_face_times]
+            return self.__rotation_matrices[0]
 
         h, w, _ = frame.shape
         frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         frame_rgb = cv2.flip(frame_rgb, 1)
         self.__current_frame = frame_rgb
 
-        return self.__calculate_rotation_matrix(frame_rgb)
+        inference_start = time.perf_counter()
+        rotation_matrix = self.__calculate_rotation_matrix(frame_rgb)
+        self.__update_metrics(time.perf_counter() - inference_start, time.thread_time() - cpu_start)
+
+        return rotation_matrix
+
+    def __update_metrics(self, inference_seconds, cpu_seconds):
+        face_lost = self.__lost_face_times[0] is not None
+        self.__face_lost_ratio += RATE_SMOOTHING * (float(face_lost) - self.__face_lost_ratio)
+
+        camera = str(self.__camera_index)
+        self.__fps_gauge.tick()
+        METRICS.increment("tracker_frames_total", camera=camera)
+        if face_lost:
+            METRICS.increment("tracker_face_lost_frames_total", camera=camera)
+        METRICS.set_gauge("tracker_face_lost_ratio", self.__face_lost_ratio, camera=camera)
+        METRICS.set_gauge("tracker_inference_seconds", inference_seconds, camera=camera)
+        # Thread time, other tracker threads and the audio don't count. Neither do the pools MediaPipe and OpenCV run
+        # inference on, so with those the frame costs more than this
+        METRICS.set_gauge("tracker_cpu_seconds_per_frame", cpu_seconds, camera=camera)
+        METRICS.increment("tracker_cpu_seconds_total", cpu_seconds, camera=camera)
 
     def find_offset_rotation_matrix(self):
+        if not self.is_ready():
+            return
         self.__offset_rotation_matrix = self.__calculate_rotation_matrix(self.__current_frame).T * (-1)
 
     def reset_rotation_offset(self):
@@ -110,13 +314,35 @@ class FaceTracker:
         return -self.get_current_yaw_angle(rotation_matrix=self.__offset_rotation_matrix)
 
     def set_offset_rotation_matrix(self, offset_rotation_matrix):
+        # Settings saved with several cameras hold one matrix per camera, the first one is this camera's
+        if offset_rotation_matrix.ndim == 3:
+            offset_rotation_matrix = offset_rotation_matrix[0]
         self.__offset_rotation_matrix = offset_rotation_matrix
 
-    def get_current_orientation(self):
-        if self.__lost_face_time and time.time() - self.__lost_face_time >= self.__seconds_before_recenter:
+    def get_max_faces(self):
+        return self.__max_faces
+
+    def get_camera_index(self):
+        return self.__camera_index
+
+    def get_face_confidence(self, face_index=0):
+        # Landmarks are most reliable on a face looking into the camera and useless on a lost one
+        if self.__lost_face_times[face_index] is not None or self.__clean_rotation_matrices[face_index] is None:
+            return 0.0
+        clean_rotation_matrix = self.__clean_rotation_matrices[face_index]
+        yaw_angle = math.radians(self.get_current_yaw_angle(rotation_matrix=clean_rotation_matrix))
+        pitch_angle = math.radians(self.get_current_pitch_angle(rotation_matrix=clean_rotation_matrix))
+        return max(math.cos(yaw_angle) * math.cos(pitch_angle), 0.0) ** 2
+
+    def get_seconds_until_next_frame(self):
+        return max(self.__last_frame_time + self.__frame_interval - time.perf_counter(), 0.0)
+
+    def get_current_orientation(self, face_index=0):
+        lost_face_time = self.__lost_face_times[face_index]
+        if lost_face_time and time.time() - lost_face_time >= self.__seconds_before_recenter:
             return copy.deepcopy(self.__default_rotation_matrix)
 
-        return copy.deepcopy(self.__current_rotation_matrix)
+        return copy.deepcopy(self.__rotation_matrices[face_index])
 
     def get_current_yaw_angle(self, rotation_matrix=None):
         if rotation_matrix is None:
@@ -134,6 +360,9 @@ class FaceTracker:
         return np.degrees(math.atan2(rotation_matrix[1, 0], rotation_matrix[0, 0]))
 
     def get_current_frame(self):
+        if not self.__camera_ready.is_set():
+            return np.zeros((self.__height, self.__width, 3), dtype=np.uint8)
+
         if self.__current_frame is None:
             ret, frame = self.__cap.read()
             if ret:
@@ -149,14 +378,17 @@ class FaceTracker:
     def get_current_frame_with_positional_arrow(self, arrow_top_margin=ARROW_MARGIN):
         self.__current_frame_with_positional_arrow = copy.deepcopy(self.__current_frame)
 
-        if self.__face_2d is None:
+        if not self.__camera_ready.is_set():
+            return np.zeros((self.__height, self.__width, 3), dtype=np.uint8)
+
+        if self.__faces_2d[0] is None:
             no_signal_frame = np.zeros((self.__height, self.__width, 3), dtype=np.uint8)
             cv2.putText(no_signal_frame, "NO CAMERA SIGNAL....", (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (229, 0, 70), 2)
             cv2.putText(no_signal_frame, "CONNECT CAMERA AND", (20, 80), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (229, 0, 70), 2)
             cv2.putText(no_signal_frame, "RESTART  APPLICATION", (20, 120), cv2.FONT_HERSHEY_SIMPLEX,0.8, (229, 0, 70), 2)
             return no_signal_frame
 
-        nose_2d_coordinates = self.__face_2d[0]
+        nose_2d_coordinates = self.__faces_2d[0][0]
 
         yaw_angle = self.get_current_yaw_angle()
         pitch_angle = self.get_current_pitch_angle()
@@ -172,4 +404,157 @@ class FaceTracker:
         return self.__current_frame_with_positional_arrow
 
     def cleanup(self):
-        self.__cap.release()
+        if self.__cap is not None:
+            self.__cap.release()
+        if self.__pose_recording_file is not None:
+            save_pose_recording(self.__pose_recording, self.__pose_recording_file)
+
+
+class MultiCameraFaceTracker:
+    # Every camera has its own FaceTracker, run as a stage of one pipeline with its own executor, the poses are fused on demand
+    def __init__(self, camera_indexes, seconds_before_recenter=10, max_faces=1, pose_recording_file=None, **tracker_options):
+        self.__seconds_before_recenter = seconds_before_recenter
+        # Only the first camera records, the others would overwrite its file
+        self.__trackers = [FaceTracker(seconds_before_recenter=seconds_before_recenter, max_faces=max_faces,
+                                       camera_index=camera_index, pose_recording_file=pose_recording_file if i == 0 else None,
+                                       **tracker_options)
+                           for i, camera_index in enumerate(camera_indexes)]
+
+        self.__default_rotation_matrix = self.__trackers[0].get_current_orientation()
+        self.__rotation_matrices = [self.__default_rotation_matrix] * max_faces
+        # A camera that missed the last recenter has a front of its own, it stays out of the fusion until the next one
+        self.__calibrated = [True] * len(self.__trackers)
+        # Every camera numbers the faces left to right from where it stands, so with several people face n can be
+        # someone else in each camera. Only the first camera tracks them then, the poses of one person are never mixed
+        self.__fused_cameras_number = len(self.__trackers) if max_faces == 1 else 1
+        if max_faces > 1 and len(self.__trackers) > 1:
+            print(f"With {max_faces} listeners only camera {camera_indexes[0]} tracks the faces, the poses aren't fused.")
+        self.__lost_face_times = [None] * max_faces
+
+        self.__pipeline = Pipeline("cameras")
+        for tracker in self.__trackers:
+            camera_name = f"camera {tracker.get_camera_index()}"
+            self.__pipeline.add_executor(camera_name, "tracker")
+            self.__pipeline.add_stage(camera_name, self.__track_camera, tracker, camera_name)
+        self.__pipeline.start()
+
+    async def __track_camera(self, tracker, camera_name):
+        while True:
+            if not tracker.is_ready():
+                await asyncio.sleep(CAMERA_WAIT_SECONDS)
+                continue
+            with self.__pipeline.deadline(camera_name, CAMERA_FRAME_DEADLINE):
+                await self.__pipeline.run(camera_name, tracker.calculate_current_orientation)
+            await asyncio.sleep(tracker.get_seconds_until_next_frame())
+
+    def open_camera(self):
+        for tracker in self.__trackers:
+            tracker.open_camera()
+
+    def load_model(self):
+        for tracker in self.__trackers:
+            tracker.load_model()
+
+    def initialize(self):
+        self.open_camera()
+        self.load_model()
+
+    def is_ready(self):
+        return any(tracker.is_ready() for tracker in self.__trackers)
+
+    def __fuse_orientation(self, face_index):
+        weights = [tracker.get_face_confidence(face_index) if calibrated and i < self.__fused_cameras_number else 0.0
+                   for i, (tracker, calibrated) in enumerate(zip(self.__trackers, self.__calibrated))]
+        if face_index == 0:
+            for tracker, weight in zip(self.__trackers, weights):
+                METRICS.set_gauge("tracker_camera_weight", weight, camera=str(tracker.get_camera_index()))
+        if sum(weights) == 0.0:
+            return None
+
+        # The closest orthogonal matrix to the weighted mean keeps the improper offsets of calibrated cameras
+        weighted_sum = sum(weight * tracker.get_current_orientation(face_index)
+                           for tracker, weight in zip(self.__trackers, weights) if weight > 0.0)
+        u, _, vt = np.linalg.svd(weighted_sum)
+        return u @ vt
+
+    @traced("MultiCameraFaceTracker.calculate_current_orientation")
+    def calculate_current_orientation(self):
+        # Only fuses what the workers found, the cameras keep their own frame rate
+        for face_index in range(len(self.__rotation_matrices)):
+            rotation_matrix = self.__fuse_orientation(face_index)
+            if rotation_matrix is not None:
+                self.__rotation_matrices[face_index] = rotation_matrix
+                self.__lost_face_times[face_index] = None
+            elif self.__lost_face_times[face_index] is None:
+                self.__lost_face_times[face_index] = time.time()
+        return self.__rotation_matrices[0]
+
+    def find_offset_rotation_matrix(self):
+        # Every camera that sees the face now learns where the front is, the others are left out until they do
+        seeing = [tracker.get_face_confidence() > 0.0 for tracker in self.__trackers]
+        if not any(seeing):
+            return
+        for i, tracker in enumerate(self.__trackers):
+            if seeing[i]:
+                tracker.find_offset_rotation_matrix()
+        self.__calibrated = seeing
+
+    def reset_rotation_offset(self):
+        for tracker in self.__trackers:
+            tracker.reset_rotation_offset()
+        self.__calibrated = [True] * len(self.__trackers)
+
+    def get_offset_rotation_matrix(self):
+        return np.array([tracker.get_offset_rotation_matrix() for tracker in self.__trackers])
+
+    def get_current_offset_yaw_angle(self):
+        return self.__trackers[0].get_current_offset_yaw_angle()
+
+    def set_offset_rotation_matrix(self, offset_rotation_matrix):
+        if offset_rotation_matrix.ndim == 2:
+            offset_rotation_matrix = offset_rotation_matrix[np.newaxis]
+        for tracker, camera_offset_rotation_matrix in zip(self.__trackers, offset_rotation_matrix):
+            tracker.set_offset_rotation_matrix(camera_offset_rotation_matrix)
+        # Cameras added since the offsets were saved have never been recentered
+        self.__calibrated = [i < len(offset_rotation_matrix) for i in range(len(self.__trackers))]
+
+    def get_max_faces(self):
+        return len(self.__rotation_matrices)
+
+    def get_current_orientation(self, face_index=0):
+        lost_face_time = self.__lost_face_times[face_index]
+        if lost_face_time and time.time() - lost_face_time >= self.__seconds_before_recenter:
+            return copy.deepcopy(self.__default_rotation_matrix)
+
+        return copy.deepcopy(self.__rotation_matrices[face_index])
+
+    def get_current_yaw_angle(self, rotation_matrix=None):
+        if rotation_matrix is None:
+            rotation_matrix = self.get_current_orientation()
+        return self.__trackers[0].get_current_yaw_angle(rotation_matrix=rotation_matrix)
+
+    def get_current_pitch_angle(self, rotation_matrix=None):
+        if rotation_matrix is None:
+            rotation_matrix = self.get_current_orientation()
+        return self.__trackers[0].get_current_pitch_angle(rotation_matrix=rotation_matrix)
+
+    def get_current_roll_angle(self, rotation_matrix=None):
+        if rotation_matrix is None:
+            rotation_matrix = self.get_current_orientation()
+        return self.__trackers[0].get_current_roll_angle(rotation_matrix=rotation_matrix)
+
+    # The calibration preview shows the first camera
+    def get_current_frame(self):
+        return self.__trackers[0].get_current_frame()
+
+    def check_camera_angle(self, angle):
+        return self.__trackers[0].check_camera_angle(angle)
+
+    def get_current_frame_with_positional_arrow(self, arrow_top_margin=ARROW_MARGIN):
+        return self.__trackers[0].get_current_frame_with_positional_arrow(arrow_top_margin)
+
+    def cleanup(self):
+        # A camera read in progress finishes within a frame, stop() waits for it before the cameras are released
+        self.__pipeline.stop()
+        for tracker in self.__trackers:
+            tracker.cleanup()
@@ -0,0 +1,88 @@
+import numpy as np
+import tempfile
+import hashlib
+import json
+import os
+
+from metrics import METRICS
+
+# Bumped whenever the layout of a cached array changes, old entries then simply stop matching
+CACHE_VERSION = 1
+CACHE_DIRECTORY = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "virtual_surround", "filters")
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def get_dataset_hash(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class FilterCache:
+    # Filter banks saved as .npy files and mapped read-only, so every process shares the same pages.
+    # Entries are written to a temporary file and renamed, a reader never sees half of one
+    def __init__(self, directory=CACHE_DIRECTORY, max_bytes=CACHE_MAX_BYTES):
+        self.__directory = directory
+        self.__max_bytes = max_bytes
+
+    def configure(self, directory=None, max_bytes=None):
+        if directory is not None:
+            self.__directory = directory
+        if max_bytes is not None:
+            self.__max_bytes = max_bytes
+
+    def __get_path(self, name, key):
+        return os.path.join(self.__directory, f"{name}-{get_dataset_hash(CACHE_VERSION, name, key)}.npy")
+
+    def load(self, name, key, build):
+        # key holds everything the array depends on: dataset hash, sample rate, partition size...
+        if self.__max_bytes <= 0:
+            return build()
+
+        path = self.__get_path(name, key)
+        try:
+            array = np.load(path, mmap_mode="r")
+            # Touching the file marks it as recently used, noatime mounts would not keep its access time
+            os.utime(path)
+            METRICS.increment("filter_cache_hits_total", filters=name)
+            return array
+        except (OSError, ValueError):
+            pass
+
+        METRICS.increment("filter_cache_misses_total", filters=name)
+        array = build()
+        try:
+            self.__save(path, array)
+            self.__evict(keep=path)
+        except OSError as e:
+            print(f"Filter cache is not writable, {name} will be computed again next time: {e}")
+        return array
+
+    def __save(self, path, array):
+        os.makedirs(self.__directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=self.__directory, suffix=".tmp", delete=False) as file:
+            np.save(file, array)
+        os.replace(file.name, path)
+
+    def __evict(self, keep):
+        entries = []
+        for file_name in os.listdir(self.__directory):
+            path = os.path.join(self.__directory, file_name)
+            try:
+                entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+            except OSError:
+                continue
+
+        # Least recently used first, a process that still maps an evicted file keeps its pages
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.__max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= size
+
+
+FILTER_CACHE = FilterCache()
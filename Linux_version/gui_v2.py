@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageTk, ImageDraw
 from screeninfo import get_monitors
 import customtkinter as ctk
@@ -5,14 +6,21 @@ import sounddevice as sd
 import soundfile as sf
 import tkinter as tk
 import numpy as np
+import collections
+import traceback
 import pulsectl
 import math
 import copy
-import json
-import os
 
 import virtual_player as vp
+import object_capture
+import performance_profiles
+import startup_timing
+import pulse_events
 import face_tracker
+import settings
+import control
+from tracing import traced
 
 
 MIN_APP_WIDTH = 820
@@ -27,24 +35,32 @@ RIGHT_FRAME_WIDTH = 355
 FONT_SIZE = 15
 
 SPEAKER_CLICK_SOUNDFILE_PATH = "sound/speaker_click.wav"
-SINK_NAME = "Virtual_Surround_by_nixpl"
-SAVE_FILE_NAME = "Virtual_Surround_settings.json"
+OBJECTS_REFRESH_MS = 500
 
 
-def find_sink_by_name(pulse, sink_name):
-    for sink in pulse.sink_list():
+def find_sink_by_name(sinks, sink_name):
+    for sink in sinks:
         if sink.name == sink_name:
             return sink
     return None
 
 
-def find_sink_by_description(pulse, sink_description):
-    for sink in pulse.sink_list():
+def find_sink_by_description(sinks, sink_description):
+    for sink in sinks:
         if sink.description == sink_description:
             return sink
     return None
 
 
+def is_virtual_sink(sink):
+    return vp.is_virtual_sink_name(sink.name, settings.SINK_NAME)
+
+
+def print_future_exception(future):
+    if future.exception() is not None:
+        traceback.print_exception(future.exception())
+
+
 def get_appearance_mode_idx():
     return 1 if ctk.get_appearance_mode() == "Dark" else 0
 
@@ -131,6 +147,7 @@ class CameraCalibrationFrame(ctk.CTkFrame):
         self.__reset_to_default_button.grid(row=0, column=1, padx=(PADDING_X * 2 / 3, 0), pady=0,
                                             sticky="nsew")
 
+    @traced("CameraCalibrationFrame.update_image")
     def __update_image(self):
         if self.__active:
             self.__current_frame = self.__face_tracker.get_current_frame_with_positional_arrow()
@@ -191,7 +208,7 @@ class SpeakerCompasFrame(ctk.CTkFrame):
         self.__speaker_icon_size = None
 
         self.__selected_surround_system = master.get_selected_surround_system()
-        self.__speakers_parameters = master.get_speakers_parameters()
+        self.__speakers_parameters = master.get_channels_parameters()
         self.__surround_system_dict_sounddevice_order = master.get_surround_system_dict_sounddevice_order()
         self.__options_frame = options_frame
 
@@ -264,6 +281,7 @@ class SpeakerCompasFrame(ctk.CTkFrame):
     def set_camera_calibration(self, state):
         self.__camera_calibration = bool(state)
 
+    @traced("SpeakerCompasFrame.draw_speaker_compas")
     def draw_speaker_compas(self):
         appearance_mode = get_appearance_mode_idx()
         self.__speaker_compas_canvas.configure(bg=self.cget("fg_color")[appearance_mode])
@@ -374,6 +392,8 @@ class SpeakerCompasFrame(ctk.CTkFrame):
 
     def __play_click_sound_on_speaker(self, speaker_name, sound_file_path="./sound/speaker_click.wav"):
         speakers_sounddevice_order_list = list(self.__surround_system_dict_sounddevice_order.get("LCR + Rear"))
+        if speaker_name not in speakers_sounddevice_order_list:
+            return
         num_channels = len(speakers_sounddevice_order_list)
         speaker_channel_index = speakers_sounddevice_order_list.index(speaker_name)
         multi_channel_signal = np.zeros((len(self.__speaker_click_sound_data), num_channels))
@@ -406,23 +426,51 @@ class OptionsFrame(ctk.CTkFrame):
 
         self.__selected_surround_system = master.get_selected_surround_system()
         self.__speakers_parameters = master.get_speakers_parameters()
+        self.__objects_parameters = master.get_objects_parameters()
+        self.__channels_parameters = master.get_channels_parameters()
         self.__all_speakers_names = [key for key in self.__speakers_parameters.keys()]
         self.__surround_system_dict_sounddevice_order = master.get_surround_system_dict_sounddevice_order()
         self.__default_settings = master.get_default_settings()
         self.__surround_system_options = [key for key in self.__surround_system_dict_sounddevice_order.keys()]
         self.__speaker_compas_frame = speaker_compas_frame
         self.__media_name = master.get_media_name()
+        self.__listener_headsets = master.get_listener_headsets()
+        self.__player_options = master.get_player_options()
+
+        self.__startup_timer = master.get_startup_timer()
 
+        # When a daemon owns the player, this frame only forwards the settings to it
+        self.__control_client = master.get_control_client()
+
+        # Player calls go through a single worker, so the window never waits for PulseAudio or OpenAL
         self.__virtual_player = None
+        self.__player_executor = ThreadPoolExecutor(max_workers=1)
+        self.__player_future = None
+        self.__objects_parameters_future = None
+        self.__audio_profile = None
+        self.__audio_profile_headset_name = None
 
         self.__selected_speaker_name = None
         self.__mirroring_on = ctk.BooleanVar(value=True)
 
-        self.__pulse = pulsectl.Pulse()
-        self.__output_devices_descriptions = [sink.description for sink in self.__pulse.sink_list() if
-                                              sink.name != SINK_NAME]
-        default_sink_name = self.__pulse.server_info().default_sink_name
-        default_sink_description = find_sink_by_name(self.__pulse, default_sink_name).description
+        with self.__startup_timer.phase("pulse setup"):
+            self.__pulse = pulsectl.Pulse()
+            self.__pulse_events = pulse_events.PulseEventListener()
+            self.__pulse_events.start()
+        self.__output_devices_descriptions = [sink.description for sink in self.__pulse_events.get_sinks() if
+                                              not is_virtual_sink(sink)]
+        if self.__control_client is None:
+            default_sink_name = self.__pulse.server_info().default_sink_name
+            # After a crash the default is still the old virtual sink, the player cleans it up once it starts
+            if vp.is_virtual_sink_name(default_sink_name, settings.SINK_NAME):
+                default_sink_name = vp.get_saved_headset_name()
+        else:
+            default_sink_name = self.__control_client.request("status").get("headset_name")
+        default_sink = find_sink_by_name(self.__pulse_events.get_sinks(), default_sink_name)
+        if default_sink is None or is_virtual_sink(default_sink):
+            default_sink_description = self.__output_devices_descriptions[0]
+        else:
+            default_sink_description = default_sink.description
 
         self.__selected_output_device = ctk.StringVar(value=default_sink_description)
 
@@ -490,6 +538,8 @@ class OptionsFrame(ctk.CTkFrame):
                                                  hover_color="#B4003A")
         self.__reset_changes_btn.grid(row=0, column=1, padx=(PADDING_X * 2 / 3, 0), pady=0, sticky="ew")
 
+        self.__refresh_objects()
+
         self.__start_playing()
 
     def __open_camera_calibration_frame(self):
@@ -503,12 +553,34 @@ class OptionsFrame(ctk.CTkFrame):
 
     def __handle_reset_btn(self):
         self.__selected_speaker_name = None
-        default = copy.deepcopy(self.__default_settings.get("speakers_parameters"))
-        self.__speakers_parameters.clear()
-        self.__speakers_parameters.update(default)
+        # The player reads the speakers from its own thread, so every entry is replaced instead of clearing the dict
+        for speaker_name, speaker in copy.deepcopy(self.__default_settings.get("speakers_parameters")).items():
+            self.__speakers_parameters[speaker_name] = speaker
+        self.handle_speakers_parameters_change()
+        # Applications that are playing go back to their default places
+        for i, object_name in enumerate(list(self.__objects_parameters)):
+            self.__objects_parameters[object_name] = object_capture.get_default_object_parameters(i)
+            self.handle_speakers_parameters_change(object_name)
         self.__speaker_compas_frame.draw_speaker_compas()
         self.draw_speaker_settings()
 
+    def handle_speakers_parameters_change(self, speaker_name=None):
+        # Applications belong to the player, it gets a copy of the one that changed
+        if speaker_name in self.__objects_parameters:
+            future = self.__player_executor.submit(self.__set_object_parameters, speaker_name,
+                                                   dict(self.__objects_parameters.get(speaker_name)))
+            future.add_done_callback(print_future_exception)
+            return
+        # A local player reads the shared dict by itself
+        if self.__control_client is not None:
+            self.__control_client.request("set_speakers_parameters", speakers_parameters=self.__speakers_parameters)
+
+    def __set_object_parameters(self, object_name, parameters):
+        if self.__control_client is not None:
+            self.__control_client.request("set_object_parameters", object_name=object_name, parameters=parameters)
+        elif self.__virtual_player is not None:
+            self.__virtual_player.set_object_parameters(object_name, parameters)
+
     def __handle_mirror_click(self, value=None):
         if self.__mirroring_on.get():
             leading_side_name = "right"
@@ -532,21 +604,97 @@ class OptionsFrame(ctk.CTkFrame):
 
     def __update_headset_dropdown_values(self, event):
         self.__headset_dropdown_menu.configure(
-            values=[sink.description for sink in self.__pulse.sink_list() if sink.name != SINK_NAME])
+            values=[sink.description for sink in self.__pulse_events.get_sinks() if not is_virtual_sink(sink)])
 
     def __start_playing(self, value=None):
-        self.close_player()
+        headset_name = find_sink_by_description(self.__pulse_events.get_sinks(), self.__selected_output_device.get()).name
+        surround_system = self.__selected_surround_system.get()
 
-        headset_name = find_sink_by_description(self.__pulse, self.__selected_output_device.get()).name
-        channels_number = len(self.__surround_system_dict_sounddevice_order.get(self.__selected_surround_system.get()))
-        self.__virtual_player = vp.VirtualPlayer(pulse=self.__pulse, face_tracker=self.__face_tracker,
-                                                 headset_name=headset_name, media_name=self.__media_name, channels_number=channels_number,
-                                                 speakers_parameters=self.__speakers_parameters, sink_name=SINK_NAME)
-        self.__virtual_player.start_playing()
+        self.__player_future = self.__player_executor.submit(self.__apply_player_settings, headset_name, surround_system)
+        self.__player_future.add_done_callback(print_future_exception)
 
-    def close_player(self):
+    def __apply_player_settings(self, headset_name, surround_system):
+        if self.__control_client is not None:
+            self.__control_client.request("configure", surround_system=surround_system, headset=headset_name)
+            return
+
+        channels_number = settings.get_channels_number(surround_system)
+        objects = surround_system == settings.OBJECTS_SURROUND_SYSTEM
         if self.__virtual_player is not None:
+            self.__virtual_player.reconfigure(channels_number=channels_number, headset_name=headset_name, objects=objects)
+            self.__switch_audio_profile(headset_name)
+            return
+
+        # The player starts from what this headset sustained in earlier sessions
+        self.__audio_profile = performance_profiles.AudioProfile(headset_name)
+        self.__audio_profile_headset_name = headset_name
+        with self.__startup_timer.phase("audio player"):
+            self.__virtual_player = vp.VirtualPlayer(pulse=self.__pulse, pulse_events=self.__pulse_events, face_tracker=self.__face_tracker,
+                                                     headset_name=headset_name, media_name=self.__media_name, channels_number=channels_number,
+                                                     speakers_parameters=self.__speakers_parameters, sink_name=settings.SINK_NAME,
+                                                     listener_headset_names=self.__listener_headsets, objects=objects,
+                                                     **self.__audio_profile.apply(self.__player_options))
+            self.__virtual_player.start_playing()
+
+    def __switch_audio_profile(self, headset_name):
+        # The buffers stay, but the dropouts from now on belong to the new headset
+        if headset_name == self.__audio_profile_headset_name:
+            return
+        self.__audio_profile.save(self.__virtual_player.get_buffers_number())
+        self.__audio_profile = performance_profiles.AudioProfile(headset_name)
+        self.__audio_profile_headset_name = headset_name
+
+    def __get_objects_parameters(self):
+        if self.__control_client is not None:
+            return self.__control_client.request("status").get("objects_parameters")
+        if self.__virtual_player is None:
+            return {}
+        return self.__virtual_player.get_objects_parameters()
+
+    def __update_objects(self, objects_parameters):
+        # The player places new applications, edits made here stay until the player has them
+        for object_name in list(self.__objects_parameters):
+            if object_name not in objects_parameters:
+                del self.__objects_parameters[object_name]
+        for object_name, parameters in objects_parameters.items():
+            self.__objects_parameters.setdefault(object_name, parameters)
+        if self.__selected_speaker_name is not None and self.__selected_speaker_name not in self.__channels_parameters:
+            self.__selected_speaker_name = None
+            self.draw_speaker_settings()
+
+        object_names = list(objects_parameters)
+        if object_names != self.__surround_system_dict_sounddevice_order.get(settings.OBJECTS_SURROUND_SYSTEM):
+            self.__surround_system_dict_sounddevice_order[settings.OBJECTS_SURROUND_SYSTEM] = object_names
+            self.__speaker_compas_frame.draw_speaker_compas()
+
+    def __refresh_objects(self):
+        # The applications are fetched on the player worker, the window only picks up the last answer
+        future = self.__objects_parameters_future
+        if future is not None and future.done():
+            self.__objects_parameters_future = None
+            if future.exception() is None:
+                self.__update_objects(future.result())
+
+        if self.__objects_parameters_future is None and self.__selected_surround_system.get() == settings.OBJECTS_SURROUND_SYSTEM:
+            self.__objects_parameters_future = self.__player_executor.submit(self.__get_objects_parameters)
+        self.after(OBJECTS_REFRESH_MS, self.__refresh_objects)
+
+    def __stop_player(self):
+        if self.__virtual_player is not None:
+            self.__audio_profile.save(self.__virtual_player.get_buffers_number())
             self.__virtual_player.stop()
+            self.__virtual_player = None
+
+    def get_player_future(self):
+        return self.__player_future
+
+    def close_player(self):
+        self.__player_executor.submit(self.__stop_player).result()
+
+    def cleanup(self):
+        self.close_player()
+        self.__player_executor.shutdown()
+        self.__pulse_events.stop()
 
     def __handle_surround_selection(self, value=None):
         self.__selected_speaker_name = None
@@ -577,8 +725,8 @@ class OptionsFrame(ctk.CTkFrame):
     def get_mirroring_info(self):
         return self.__mirroring_on
 
-    def get_speakers_parameters(self):
-        return self.__speakers_parameters
+    def get_channels_parameters(self):
+        return self.__channels_parameters
 
     def get_surround_system_dict_sounddevice_order(self):
         return self.__surround_system_dict_sounddevice_order
@@ -591,7 +739,7 @@ class SpeakerSettingsFrame(ctk.CTkFrame):
         self.__mirroring_on = master.get_mirroring_info()
         self.__speaker_name = speaker_name
         self.__surround_system_dict_sounddevice_order = master.get_surround_system_dict_sounddevice_order()
-        self.__speakers_parameters = master.get_speakers_parameters()
+        self.__speakers_parameters = master.get_channels_parameters()
         self.__options_frame = options_frame
         self.__speaker_compas_frame = speaker_compas_frame
         self.__selected_surround_system = options_frame.get_selected_surround_system()
@@ -641,6 +789,9 @@ class SpeakerSettingsFrame(ctk.CTkFrame):
             self.__select_speaker_label.grid(row=0, column=0, padx=0, pady=PADDING_Y, sticky="nsew")
 
     def __find_mirror_speaker_name(self, speaker_name):
+        # Applications have no pair, even when their name says left or right
+        if self.__speakers_parameters.get(speaker_name).get("object"):
+            return speaker_name
         return speaker_name.replace("left", "right") if "left" in speaker_name else speaker_name.replace("right",
                                                                                                          "left")
 
@@ -648,6 +799,7 @@ class SpeakerSettingsFrame(ctk.CTkFrame):
         self.__speakers_parameters[speaker_name]["volume"] = int(value)
         if self.__mirroring_on.get():
             self.__speakers_parameters[self.__find_mirror_speaker_name(speaker_name)]["volume"] = int(value)
+        self.__options_frame.handle_speakers_parameters_change(speaker_name)
 
     def set_speaker_angle_parameter(self, value, speaker_name):
         self.__speakers_parameters[speaker_name]["angle"] = int(
@@ -656,6 +808,7 @@ class SpeakerSettingsFrame(ctk.CTkFrame):
             mirror_speaker_name = self.__find_mirror_speaker_name(speaker_name)
             self.__speakers_parameters[mirror_speaker_name]["angle"] = int(
                 math.copysign(value, self.__speakers_parameters.get(mirror_speaker_name).get("angle")))
+        self.__options_frame.handle_speakers_parameters_change(speaker_name)
 
     def handle_volume_slider(self, value, speaker_name):
         self.set_speaker_volume_parameter(value, speaker_name)
@@ -669,9 +822,15 @@ class SpeakerSettingsFrame(ctk.CTkFrame):
 
 
 class App(ctk.CTk):
-    def __init__(self):
+    def __init__(self, startup_timer=None, control_client=None, tracker_options=None, player_options=None):
         super().__init__()
 
+        self.__player_options = dict(player_options or {})
+
+        self.__control_client = control_client
+
+        self.__startup_timer = startup_timer if startup_timer is not None else startup_timing.StartupTimer()
+
         self.title("Virtual Surround by nixpl")
         self.geometry("850x520")
         self.minsize(MIN_APP_WIDTH, MIN_APP_HEIGHT)
@@ -679,34 +838,44 @@ class App(ctk.CTk):
         self.grid_columnconfigure(0, weight=1)
         self.grid_columnconfigure(1, weight=0, minsize=RIGHT_FRAME_WIDTH)
 
-        self.__face_tracker = face_tracker.FaceTracker(width=320, height=240, seconds_before_recenter=10)
-
-        self.__default_settings = {
-            "media.name": "Playback Stream",
-            "offset_rotation_matrix": [[1.0, 0.0, 0.0],
-                                       [0.0, 1.0, 0.0],
-                                       [0.0, 0.0, 1.0]],
-            "selected_surround_system": "LCR",
-            "speakers_parameters": {
-                "Front left": {"volume": 100, "angle": -35, "min_angle": -20, "max_angle": -70},
-                "Front right": {"volume": 100, "angle": 35, "min_angle": 20, "max_angle": 70},
-                "Front center": {"volume": 100, "angle": 0, "min_angle": 0, "max_angle": 0},
-                "Rear left": {"volume": 50, "angle": -130, "min_angle": -90, "max_angle": -160},
-                "Rear right": {"volume": 50, "angle": 130, "min_angle": 90, "max_angle": 160}
-            }
-        }
+        self.__default_settings = settings.get_default_settings()
+
+        if self.__control_client is None:
+            restored_settings = settings.restore_settings()
+        else:
+            restored_settings = self.__control_client.request("get_settings")
+        self.__listener_headsets = restored_settings.get("listener_headsets", [])
+
+        # The camera and the model come up in the background, the window and the audio don't wait for them
+        self.__tracker_profile = None
+        if self.__control_client is None:
+            # Frames are processed and poses asked for no faster than these cameras delivered them last time
+            self.__tracker_profile = performance_profiles.TrackerProfile((tracker_options or {}).get("cameras") or [0], 320, 240)
+            self.__face_tracker = face_tracker.create_face_tracker(width=320, height=240, seconds_before_recenter=10,
+                                                                   max_faces=1 + len(self.__listener_headsets),
+                                                                   **self.__tracker_profile.apply(tracker_options or {}))
+            self.__player_options.setdefault("pose_update_rate", self.__tracker_profile.get_pose_update_rate(vp.POSE_UPDATE_RATE))
+            self.after(performance_profiles.PROFILE_SAMPLE_SECONDS * 1000, self.__sample_tracker_profile)
+        else:
+            self.__face_tracker = control.RemoteFaceTracker(self.__control_client, width=320, height=240)
+        self.__startup_executor = ThreadPoolExecutor(max_workers=2)
+        self.__startup_futures = [
+            self.__startup_executor.submit(self.__run_startup_phase, "camera", self.__face_tracker.open_camera),
+            self.__startup_executor.submit(self.__run_startup_phase, "face model", self.__face_tracker.load_model)
+        ]
+        for future in self.__startup_futures:
+            future.add_done_callback(print_future_exception)
 
-        restored_settings = self.__restore_settings()
         self.__media_name = restored_settings.get("media.name")
         self.__face_tracker.set_offset_rotation_matrix(np.array(restored_settings.get("offset_rotation_matrix")))
         self.__selected_surround_system = ctk.StringVar(value=restored_settings.get("selected_surround_system"))
         self.__speakers_parameters = restored_settings.get("speakers_parameters")
+        # Applications of the Objects mode, only this thread touches them and they are never saved
+        self.__objects_parameters = {}
+        self.__channels_parameters = collections.ChainMap(self.__objects_parameters, self.__speakers_parameters)
 
-        self.__surround_system_dict_sounddevice_order = {
-            "Stereo": ["Front left", "Front right"],
-            "LCR": ["Front right", "Front left", "Front center"],
-            "LCR + Rear": ["Front left", "Front right", "Rear left", "Rear right", "Front center"]
-        }
+        # The Objects entry is replaced as applications come and go, the module's dict stays as it is
+        self.__surround_system_dict_sounddevice_order = dict(settings.SURROUND_SYSTEM_DICT_SOUNDDEVICE_ORDER)
         self.__camera_calibration_frame = CameraCalibrationFrame(self, face_tracker=self.__face_tracker,
                                                                  width=RIGHT_FRAME_WIDTH, corner_radius=CORNER_RADIUS)
 
@@ -728,6 +897,24 @@ class App(ctk.CTk):
 
         self.protocol("WM_DELETE_WINDOW", self.__on_close)
 
+        self.__startup_timer.mark("window built")
+        self.after(0, lambda: self.__startup_timer.mark("window shown"))
+        self.after(100, self.__report_startup_when_done)
+
+    def __run_startup_phase(self, name, function):
+        with self.__startup_timer.phase(name):
+            function()
+
+    def __report_startup_when_done(self):
+        if all(future.done() for future in self.__startup_futures + [self.__options_frame.get_player_future()]):
+            print(self.__startup_timer.report())
+            return
+        self.after(100, self.__report_startup_when_done)
+
+    def __sample_tracker_profile(self):
+        self.__tracker_profile.sample()
+        self.after(performance_profiles.PROFILE_SAMPLE_SECONDS * 1000, self.__sample_tracker_profile)
+
     def activate_camera_calibration_frame(self):
         self.__face_tracker.reset_rotation_offset()
         self.__speaker_compas_frame.set_camera_calibration(state=True)
@@ -777,6 +964,12 @@ class App(ctk.CTk):
     def get_speakers_parameters(self):
         return self.__speakers_parameters
 
+    def get_objects_parameters(self):
+        return self.__objects_parameters
+
+    def get_channels_parameters(self):
+        return self.__channels_parameters
+
     def get_surround_system_dict_sounddevice_order(self):
         return self.__surround_system_dict_sounddevice_order
 
@@ -786,31 +979,38 @@ class App(ctk.CTk):
     def get_media_name(self):
         return self.__media_name
 
-    def __restore_settings(self):
-        if os.path.exists(SAVE_FILE_NAME):
-            try:
-                with open(SAVE_FILE_NAME, "r", encoding="utf-8") as file:
-                    data = json.load(file)
-                return data
-            except json.JSONDecodeError:
-                return self.__default_settings
-        else:
-            return self.__default_settings
+    def get_listener_headsets(self):
+        return self.__listener_headsets
+
+    def get_player_options(self):
+        return self.__player_options
+
+    def get_startup_timer(self):
+        return self.__startup_timer
+
+    def get_control_client(self):
+        return self.__control_client
 
     def __on_close(self):
         offset_rotation_matrix = self.__face_tracker.get_offset_rotation_matrix().tolist()
 
-        self.__options_frame.close_player()
+        self.__options_frame.cleanup()
+        self.__startup_executor.shutdown()
         self.__face_tracker.cleanup()
 
-        data = {
-            "media.name": self.__media_name,
-            "offset_rotation_matrix": offset_rotation_matrix,
-            "selected_surround_system": self.__selected_surround_system.get(),
-            "speakers_parameters": self.__speakers_parameters
-        }
-        with open(SAVE_FILE_NAME, "w", encoding="utf-8") as file:
-            json.dump(data, file, indent=4)
-        print(f"Settings have been saved to: {SAVE_FILE_NAME}.")
+        if self.__control_client is None:
+            data = {
+                "media.name": self.__media_name,
+                "offset_rotation_matrix": offset_rotation_matrix,
+                "selected_surround_system": self.__selected_surround_system.get(),
+                "speakers_parameters": self.__speakers_parameters,
+                "listener_headsets": self.__listener_headsets
+            }
+            settings.save_settings(data)
+            self.__tracker_profile.save()
+        else:
+            # The daemon keeps running, it owns the settings file
+            self.__control_client.request("save_settings")
+            self.__control_client.close()
         self.destroy()
 
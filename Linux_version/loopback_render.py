@@ -0,0 +1,153 @@
+import soundfile
+import argparse
+import numpy as np
+import time
+import math
+
+import virtual_player as vp
+import parametric_spatializer
+import bass_management
+import room_reverb
+import pose_filter
+import settings
+
+DEFAULT_ROTATION_MATRIX = np.array([
+    [1.0, 0.0, 0.0],
+    [0.0, -1.0, 0.0],
+    [0.0, 0.0, -1.0]
+])
+
+
+def create_test_signal(channels_number, samplerate, seconds, seed=0):
+    # Every channel gets its own noise bursts, so each virtual speaker can be told apart in the output
+    frames = int(samplerate * seconds)
+    noise = np.random.default_rng(seed).normal(0.0, 0.2, (frames, channels_number))
+    burst_seconds = 0.5
+    active_channel = (np.arange(frames) / (samplerate * burst_seconds)).astype(int) % channels_number
+    noise[np.arange(channels_number) != active_channel[:, np.newaxis]] = 0.0
+    return (np.clip(noise, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def get_listener_orientation(rotation_matrix_opencv):
+    return np.array([rotation_matrix_opencv[0], -rotation_matrix_opencv[1], rotation_matrix_opencv[2]])
+
+
+def create_pose_source(recording_file_name, sweep_degrees, sweep_seconds):
+    if recording_file_name is not None:
+        timestamps, rotation_vectors = pose_filter.load_pose_recording(recording_file_name)
+        timestamps = timestamps - timestamps[0]
+
+        def get_recorded_pose(block_time):
+            index = min(np.searchsorted(timestamps, block_time % timestamps[-1]), len(rotation_vectors) - 1)
+            return DEFAULT_ROTATION_MATRIX @ pose_filter.rotation_vector_to_matrix(rotation_vectors[index])
+        return get_recorded_pose
+
+    def get_swept_pose(block_time):
+        yaw_angle = math.radians(sweep_degrees) * math.sin(2 * math.pi * block_time / sweep_seconds)
+        return DEFAULT_ROTATION_MATRIX @ pose_filter.rotation_vector_to_matrix([0.0, yaw_angle, 0.0])
+    return get_swept_pose
+
+
+parser = argparse.ArgumentParser(description="Renders the head tracked mix through a loopback device, "
+                                             "as fast as the machine allows and without any sound device")
+parser.add_argument("input", nargs="?", default=None, help="2, 3 or 5 channel sound file in front-left, front-right, "
+                                                           "front-center, rear-left, rear-right order, noise bursts without it")
+parser.add_argument("--output", metavar="FILE", default=None, help="where the binaural stereo goes, it is only timed without it")
+parser.add_argument("--surround-system", choices=[surround_system for surround_system in settings.SURROUND_SYSTEM_DICT_SOUNDDEVICE_ORDER
+                                                  if surround_system != settings.OBJECTS_SURROUND_SYSTEM], default="LCR + Rear",
+                    help="layout of the generated noise bursts")
+parser.add_argument("--seconds", type=float, default=30.0, help="length of the generated noise bursts")
+parser.add_argument("--samplerate", type=int, default=44100)
+parser.add_argument("--buffer-size", type=int, default=1024, help="frames per block, as in VirtualPlayer")
+parser.add_argument("--renderer", choices=vp.RENDERERS, default="hrtf", help="parametric uses the spherical head model instead of OpenAL")
+parser.add_argument("--bass-crossover", type=float, default=None, metavar="HZ", help="sends the lows to one mono bass source, as in main.py")
+parser.add_argument("--room-level", type=float, default=None, metavar="GAIN", help="adds the shared room reverb, as in main.py")
+parser.add_argument("--room-decay", type=float, default=room_reverb.ROOM_DECAY_SECONDS, metavar="SECONDS")
+parser.add_argument("--poses", metavar="FILE", default=None, help="head poses saved with main.py --record-poses, a yaw sweep without it")
+parser.add_argument("--sweep-degrees", type=float, default=60.0)
+parser.add_argument("--sweep-seconds", type=float, default=4.0)
+args = parser.parse_args()
+
+if args.input is None:
+    samplerate = args.samplerate
+    samples = create_test_signal(settings.get_channels_number(args.surround_system), samplerate, args.seconds)
+else:
+    samples, samplerate = soundfile.read(args.input, dtype="int16", always_2d=True)
+channels_number = samples.shape[1]
+speaker_names = vp.get_pulse_channel_order_list(channels_number)
+speakers_parameters = settings.get_default_settings().get("speakers_parameters")
+get_pose = create_pose_source(args.poses, args.sweep_degrees, args.sweep_seconds)
+
+bass_manager = None
+source_names = speaker_names
+if args.bass_crossover is not None or bass_management.LFE_SPEAKER_NAME in speaker_names:
+    bass_manager = bass_management.BassManager(samplerate, speaker_names, np.int16, crossover_hz=args.bass_crossover)
+    bass_manager.set_gains([speakers_parameters.get(speaker_name).get("volume") / 100 for speaker_name in speaker_names])
+    source_names = bass_manager.get_source_names()
+
+reverb = None
+if args.room_level is not None:
+    reverb = room_reverb.RoomReverb(samplerate, speaker_names, np.int16, decay_seconds=args.room_decay)
+    reverb.set_speakers([(speakers_parameters.get(speaker_name).get("volume") / 100, speakers_parameters.get(speaker_name).get("angle"))
+                         for speaker_name in speaker_names])
+    source_names = source_names + reverb.get_source_names()
+
+if args.renderer == "parametric":
+    listener = parametric_spatializer.ParametricSpatializer("loopback", samplerate, np.int16, args.buffer_size)
+    latency_blocks = 0
+else:
+    # As in VirtualPlayer, OpenAL renders the previous block while the new one waits behind it
+    listener = vp.OpenALListener("loopback", samplerate, np.int16, args.buffer_size, vp.LOOPBACK_BUFFERS_NUMBER, loopback=True)
+    latency_blocks = 1
+listener.add_virtual_speakers(len(source_names))
+
+
+def get_source_gain_and_position(source_name):
+    if source_name == bass_management.BASS_SOURCE_NAME:
+        return 1.0, None
+    if reverb is not None and source_name in reverb.get_source_names():
+        return args.room_level, vp.get_speaker_position(reverb.get_source_angle(source_name), 1.0)
+    return speakers_parameters.get(source_name).get("volume") / 100, vp.get_speaker_position(speakers_parameters.get(source_name).get("angle"), 1.0)
+
+
+listener.set_speakers_parameters([get_source_gain_and_position(source_name) for source_name in source_names])
+listener.play()
+
+output = None
+if args.output is not None:
+    output = soundfile.SoundFile(args.output, "w", samplerate=samplerate, channels=2, subtype="FLOAT")
+
+# The queued silence is played first, so the mix runs latency_blocks blocks behind the input and is flushed at the end
+blocks_number = math.ceil(len(samples) / args.buffer_size)
+silence = np.zeros((args.buffer_size, channels_number), dtype=np.int16)
+block_seconds = []
+for block_index in range(blocks_number + latency_blocks):
+    block = samples[block_index * args.buffer_size:(block_index + 1) * args.buffer_size]
+    if len(block) < args.buffer_size:
+        block = np.concatenate((block, silence[len(block):]))
+
+    start = time.perf_counter()
+    listener.set_orientation(get_listener_orientation(get_pose(block_index * args.buffer_size / samplerate)))
+    channels_data = [np.ascontiguousarray(block[:, i]) for i in range(channels_number)]
+    room_data = [] if reverb is None else reverb.process(channels_data)
+    if bass_manager is not None:
+        channels_data = bass_manager.process(channels_data)
+    channels_data = channels_data + room_data
+    listener.queue_block(channels_data, source_names)
+    rendered = listener.render(args.buffer_size)
+    block_seconds.append(time.perf_counter() - start)
+
+    if output is not None and block_index >= latency_blocks:
+        output.write(rendered)
+
+listener.close()
+if output is not None:
+    output.close()
+    print(f"Binaural mix has been saved to: {args.output}.")
+
+block_seconds = np.array(block_seconds)
+audio_seconds = len(block_seconds) * args.buffer_size / samplerate
+print(f"{len(block_seconds)} blocks of {args.buffer_size} frames, {channels_number} channels at {samplerate} Hz")
+print(f"Faster than real time: {audio_seconds / block_seconds.sum():.1f}x")
+print(f"Per block: mean {block_seconds.mean() * 1e6:.0f} us, p99 {np.percentile(block_seconds, 99) * 1e6:.0f} us, "
+      f"max {block_seconds.max() * 1e6:.0f} us, budget {args.buffer_size / samplerate * 1e6:.0f} us")
@@ -1,4 +1,138 @@
-import gui_v2
+import startup_timing
 
-app = gui_v2.App()
-app.mainloop()
\ No newline at end of file
+startup_timer = startup_timing.StartupTimer()
+
+import argparse
+import face_tracker
+import pose_filter
+import control
+import metrics
+import realtime
+import filter_cache
+import tracing
+import atexit
+
+parser = argparse.ArgumentParser(description="Virtual Surround with Head Tracking")
+parser.add_argument("--headless", action="store_true",
+                    help="run the player and the face tracker without a window, controlled through a local socket")
+parser.add_argument("--socket", default=control.SOCKET_PATH, help="path of the control socket")
+parser.add_argument("--metrics-port", type=int, default=None,
+                    help=f"serve Prometheus metrics on http://{metrics.METRICS_HOST}:<port>/metrics")
+parser.add_argument("--trace", metavar="FILE", default=None,
+                    help="record spans of the hot functions and save them as Chrome trace JSON on exit")
+for role in realtime.THREAD_SETTINGS:
+    parser.add_argument(f"--{role}-policy", choices=realtime.SCHEDULING_POLICIES, default="other",
+                        help=f"scheduling policy of the {role} thread, real-time ones need CAP_SYS_NICE or an rtprio limit")
+    parser.add_argument(f"--{role}-priority", type=int, default=10, help=f"real-time priority of the {role} thread")
+    parser.add_argument(f"--{role}-nice", type=int, default=None, help=f"nice value of the {role} thread")
+    parser.add_argument(f"--{role}-cpus", type=realtime.parse_cpus, default=None,
+                        help=f"CPUs the {role} thread is pinned to, for example 2,3 or 4-7")
+parser.add_argument("--pose-min-cutoff", type=float, default=pose_filter.POSE_FILTER_SETTINGS.get("min_cutoff"),
+                    help="cutoff frequency of the head pose smoothing while the head is still, lower is smoother")
+parser.add_argument("--pose-beta", type=float, default=pose_filter.POSE_FILTER_SETTINGS.get("beta"),
+                    help="how fast the smoothing cutoff rises with head speed, higher lags less on fast turns")
+parser.add_argument("--pose-derivative-cutoff", type=float, default=pose_filter.POSE_FILTER_SETTINGS.get("derivative_cutoff"),
+                    help="cutoff frequency of the head speed estimate")
+parser.add_argument("--no-pose-filter", action="store_true", help="use the solved head poses without smoothing")
+parser.add_argument("--record-poses", metavar="FILE", default=None,
+                    help="save the raw head poses on exit, for pose_filter_benchmark.py")
+parser.add_argument("--pose-update-rate", type=float, default=None,
+                    help="head poses per second handed to the renderer (default 25), it interpolates between them on every audio block")
+parser.add_argument("--loopback-file", metavar="FILE", default=None,
+                    help="render the head tracked mix into a sound file through an OpenAL loopback device instead of the headset")
+parser.add_argument("--output-backend", choices=["openal", "portaudio"], default=None,
+                    help="portaudio renders through an OpenAL loopback device and lets a PortAudio callback on the headset pull the frames")
+parser.add_argument("--no-drift-compensation", action="store_true",
+                    help="don't resample the portaudio backend output to follow the headset clock")
+parser.add_argument("--renderer", choices=["hrtf", "parametric"], default=None,
+                    help="parametric replaces the OpenAL HRTF of the main listener with a cheap spherical head model, for low-end machines")
+parser.add_argument("--bass-crossover", type=float, default=None, metavar="HZ",
+                    help="sends everything below HZ (80 is usual) to one mono bass source instead of the spatialized speakers")
+parser.add_argument("--room-level", type=float, default=None, metavar="GAIN",
+                    help="adds a shared room reverb at GAIN (0.3 is subtle), so the sound is less inside the head")
+parser.add_argument("--room-decay", type=float, default=None, metavar="SECONDS", help="reverb time of the room, 0.4 by default")
+parser.add_argument("--filter-cache-mb", type=float, default=None, metavar="MB",
+                    help="size of the on-disk cache of precomputed filters in ~/.cache/virtual_surround, 0 turns it off")
+parser.add_argument("--lock-memory", action="store_true", help="lock the process memory to avoid page faults in the audio path")
+parser.add_argument("--inference-threads", type=int, default=None,
+                    help="thread pool size of OpenCV and the OpenMP and BLAS libraries, MediaPipe keeps its own")
+parser.add_argument("--no-refine-landmarks", action="store_true", help="skip iris refinement, cheaper and a bit less stable")
+parser.add_argument("--face-model", metavar="FILE", default=None,
+                    help="MediaPipe FaceLandmarker .task model, needed for --face-model-delegate")
+parser.add_argument("--face-model-delegate", choices=face_tracker.MODEL_DELEGATES, default="cpu",
+                    help="device the FaceLandmarker model runs on")
+parser.add_argument("--cameras", type=face_tracker.parse_camera_indexes, default=None,
+                    help="comma separated camera indexes, the poses of several cameras are fused")
+parser.add_argument("--tracker-fps", type=float, default=None, help="frames per second the face tracker may process")
+args = parser.parse_args()
+
+tracker_options = {
+    "refine_landmarks": not args.no_refine_landmarks,
+    "model_path": args.face_model,
+    "model_delegate": args.face_model_delegate,
+    "target_fps": args.tracker_fps,
+    "cameras": args.cameras,
+    "pose_filter_settings": None if args.no_pose_filter else {
+        "min_cutoff": args.pose_min_cutoff,
+        "beta": args.pose_beta,
+        "derivative_cutoff": args.pose_derivative_cutoff
+    },
+    "pose_recording_file": args.record_poses
+}
+
+# The audio modules are imported later, so only the options that were given are passed on
+player_options = {}
+if args.pose_update_rate is not None:
+    player_options["pose_update_rate"] = args.pose_update_rate
+if args.loopback_file is not None:
+    player_options["loopback_file"] = args.loopback_file
+if args.output_backend is not None:
+    player_options["output_backend"] = args.output_backend
+if args.no_drift_compensation:
+    player_options["drift_compensation"] = False
+if args.renderer is not None:
+    player_options["renderer"] = args.renderer
+if args.bass_crossover is not None:
+    player_options["bass_crossover"] = args.bass_crossover
+if args.room_level is not None:
+    player_options["room_level"] = args.room_level
+if args.room_decay is not None:
+    player_options["room_decay"] = args.room_decay
+
+for role, thread_settings in realtime.THREAD_SETTINGS.items():
+    thread_settings.update({
+        "policy": getattr(args, f"{role}_policy"),
+        "priority": getattr(args, f"{role}_priority"),
+        "nice": getattr(args, f"{role}_nice"),
+        "cpus": getattr(args, f"{role}_cpus")
+    })
+if args.lock_memory:
+    realtime.lock_memory()
+if args.inference_threads is not None:
+    realtime.limit_inference_threads(args.inference_threads)
+if args.filter_cache_mb is not None:
+    filter_cache.FILTER_CACHE.configure(max_bytes=int(args.filter_cache_mb * 1024 * 1024))
+
+if args.trace is not None:
+    tracing.TRACER.enable()
+    atexit.register(tracing.TRACER.export_chrome_trace, args.trace)
+
+if args.metrics_port is not None:
+    metrics.MetricsServer(metrics.METRICS, port=args.metrics_port).start()
+
+if args.headless:
+    import daemon
+
+    daemon.main(socket_path=args.socket, tracker_options=tracker_options, player_options=player_options)
+else:
+    # A running daemon keeps the audio, the window only becomes its remote control
+    control_client = control.ControlClient(args.socket)
+    if not control_client.is_available():
+        control_client = None
+
+    with startup_timer.phase("gui imports"):
+        import gui_v2
+
+    app = gui_v2.App(startup_timer=startup_timer, control_client=control_client, tracker_options=tracker_options,
+                     player_options=player_options)
+    app.mainloop()
@@ -0,0 +1,171 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import threading
+import resource
+import time
+import os
+
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9477
+RATE_SMOOTHING = 0.1
+
+METRIC_DESCRIPTIONS = {
+    "tracker_frames_total": ("counter", "Camera frames processed by the face tracker"),
+    "tracker_face_lost_frames_total": ("counter", "Camera frames in which no face was found"),
+    "tracker_face_lost_ratio": ("gauge", "Smoothed share of recent frames in which no face was found"),
+    "tracker_fps": ("gauge", "Smoothed rate of processed camera frames"),
+    "tracker_inference_seconds": ("gauge", "Face mesh and pose solving time of the last frame"),
+    "tracker_cpu_seconds_per_frame": ("gauge", "CPU time of the tracker thread for the last frame, a lower bound: the MediaPipe and OpenCV worker threads are not counted"),
+    "tracker_cpu_seconds_total": ("counter", "CPU time of the tracker thread spent on frames, a lower bound: the MediaPipe and OpenCV worker threads are not counted"),
+    "tracker_camera_weight": ("gauge", "Share of a camera in the fused head pose, 0 when it doesn't see the face"),
+    "listener_updates_per_second": ("gauge", "Smoothed rate of OpenAL listener orientation updates"),
+    "capture_blocks_total": ("counter", "Blocks read from the parec monitor capture"),
+    "capture_duplicate_blocks_total": ("counter", "Blocks skipped because they repeated the previous block"),
+    "openal_buffer_underruns_total": ("counter", "Times a source played out its whole buffer queue"),
+    "openal_source_restarts_total": ("counter", "Times alSourcePlay had to restart a stopped source"),
+    "openal_dropped_blocks_total": ("counter", "Blocks not queued because the source had no free buffer"),
+    "openal_queue_depth": ("gauge", "Buffers waiting to be played on a source"),
+    "output_underruns_total": ("counter", "Device callbacks that found the ring buffer short of frames"),
+    "output_underrun_frames_total": ("counter", "Frames replaced by silence because the ring buffer ran dry"),
+    "output_device_underflows_total": ("counter", "Output underflows reported by PortAudio itself"),
+    "output_overflow_frames_total": ("counter", "Rendered frames dropped because the ring buffer stayed full"),
+    "output_ring_fill_frames": ("gauge", "Rendered frames waiting in the ring buffer when the device asked for more"),
+    "output_latency_seconds": ("gauge", "Time until the frames of the current callback reach the DAC"),
+    "output_latency_error_seconds": ("gauge", "Smoothed ring buffer fill minus its target, in seconds"),
+    "drift_correction_ppm": ("gauge", "Resampling correction between the capture and the headset clocks"),
+    "filter_cache_hits_total": ("counter", "Filter banks mapped from the on-disk cache"),
+    "filter_cache_misses_total": ("counter", "Filter banks computed because the on-disk cache didn't have them"),
+    "object_streams": ("gauge", "Applications recorded from the virtual device in the Objects mode"),
+    "object_sources": ("gauge", "Applications loud enough to have a source in the last block"),
+    "object_dropped_blocks_total": ("counter", "Blocks of an application dropped because it ran ahead of the capture"),
+    "pipeline_stage_seconds": ("gauge", "Duration of the last pass of a pipeline stage"),
+    "pipeline_deadline_misses_total": ("counter", "Passes of a pipeline stage that took longer than its deadline"),
+    "pipeline_queue_depth": ("gauge", "Items waiting in a bounded queue between two pipeline stages"),
+    "pipeline_stage_failures_total": ("counter", "Times a pipeline stage failed on an error and was started over"),
+    "process_cpu_seconds_total": ("counter", "User and system CPU time used by the process"),
+    "process_resident_memory_bytes": ("gauge", "Resident set size of the process"),
+    "process_memory_locked": ("gauge", "1 when mlockall succeeded"),
+    "realtime_scheduling_applied": ("gauge", "1 when the requested real-time policy was granted, 0 when it fell back"),
+    "thread_scheduling_policy": ("gauge", "Scheduling policy in effect (0 other, 1 fifo, 2 rr)"),
+    "thread_scheduling_priority": ("gauge", "Real-time priority in effect"),
+    "thread_nice": ("gauge", "Nice value in effect"),
+    "thread_cpu_count": ("gauge", "Number of CPUs the thread may run on"),
+    "inference_threads_limit": ("gauge", "Thread cap for the OpenCV, OpenMP and BLAS thread pools"),
+}
+
+
+def escape_label_value(value):
+    # Application names end up in labels, the text format only allows these three escaped
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label_value(value)}"' for key, value in labels) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__values = {}
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.__lock:
+            self.__values[key] = self.__values.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.__lock:
+            self.__values[key] = value
+
+    def get(self, name, **labels):
+        with self.__lock:
+            return self.__values.get((name, tuple(sorted(labels.items()))))
+
+    def get_total(self, name, **labels):
+        # Sum over every label set that includes the given labels
+        wanted_labels = set(labels.items())
+        with self.__lock:
+            return sum(value for (metric_name, metric_labels), value in self.__values.items()
+                       if metric_name == name and wanted_labels <= set(metric_labels))
+
+    def __update_process_metrics(self):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        self.set_gauge("process_cpu_seconds_total", usage.ru_utime + usage.ru_stime)
+        with open("/proc/self/statm", "r") as file:
+            resident_pages = int(file.read().split()[1])
+        self.set_gauge("process_resident_memory_bytes", resident_pages * os.sysconf("SC_PAGE_SIZE"))
+
+    def render(self):
+        self.__update_process_metrics()
+        with self.__lock:
+            values = sorted(self.__values.items())
+
+        lines = []
+        described = set()
+        for (name, labels), value in values:
+            if name not in described and name in METRIC_DESCRIPTIONS:
+                metric_type, description = METRIC_DESCRIPTIONS.get(name)
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                described.add(name)
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class RateGauge:
+    # Exponentially smoothed events per second, written to a gauge on every tick
+    def __init__(self, registry, name, smoothing=RATE_SMOOTHING, **labels):
+        self.__registry = registry
+        self.__name = name
+        self.__labels = labels
+        self.__smoothing = smoothing
+        self.__last_tick = None
+        self.__rate = 0.0
+
+    def tick(self):
+        now = time.perf_counter()
+        if self.__last_tick is not None and now > self.__last_tick:
+            current_rate = 1.0 / (now - self.__last_tick)
+            if self.__rate == 0.0:
+                self.__rate = current_rate
+            else:
+                self.__rate += self.__smoothing * (current_rate - self.__rate)
+            self.__registry.set_gauge(self.__name, self.__rate, **self.__labels)
+        self.__last_tick = now
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, registry, host=METRICS_HOST, port=METRICS_PORT):
+        self.registry = registry
+        super().__init__((host, port), MetricsRequestHandler)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+METRICS = MetricsRegistry()
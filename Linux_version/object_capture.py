@@ -0,0 +1,179 @@
+import numpy as np
+import subprocess
+import threading
+import os
+
+import realtime
+from metrics import METRICS
+
+# Peak below which a block counts as silence, and how long a stream stays silent before its source is dropped
+SILENCE_PEAK = 16
+SILENT_SECONDS = 1.0
+# A stream that delivers faster than the sink capture is read loses its oldest blocks, so its latency stays bounded
+MAXIMUM_PENDING_BLOCKS = 3
+READ_SIZE = 65536
+# New applications take turns on either side, the compass keeps every one on its side like the speakers
+OBJECT_ANGLES = [-30, 30, -60, 60, -90, 90, -120, 120, -150, 150]
+
+
+def get_default_object_parameters(object_index):
+    angle = OBJECT_ANGLES[object_index % len(OBJECT_ANGLES)]
+    side = 1 if angle > 0 else -1
+    return {"volume": 100, "angle": angle, "min_angle": side, "max_angle": 179 * side, "object": True}
+
+
+class ApplicationStream:
+    # parec records one sink input, downmixed to mono, without moving it off the virtual sink
+    def __init__(self, sink_input_index, name, samplerate, dtype):
+        self.__name = name
+        self.__dtype = dtype
+        command = ["parec", "--latency-msec=1", f"--monitor-stream={sink_input_index}", "--channels=1", f"--rate={samplerate}",
+                   "--format=s16le"]
+        self.__process = subprocess.Popen(command, stdout=subprocess.PIPE)
+        realtime.apply_thread_settings("audio", pid=self.__process.pid)
+        os.set_blocking(self.__process.stdout.fileno(), False)
+        self.__pending = bytearray()
+        self.__silent_blocks = None
+
+    def get_name(self):
+        return self.__name
+
+    def read_available(self, block_bytes):
+        while True:
+            try:
+                data = os.read(self.__process.stdout.fileno(), READ_SIZE)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            self.__pending += data
+        overflow_bytes = len(self.__pending) - MAXIMUM_PENDING_BLOCKS * block_bytes
+        if overflow_bytes > 0:
+            del self.__pending[:overflow_bytes - overflow_bytes % block_bytes]
+            METRICS.increment("object_dropped_blocks_total", overflow_bytes // block_bytes, source=self.__name)
+
+    def pop_block(self, frames):
+        # Paused streams deliver nothing, a missing block is played as silence
+        block_bytes = frames * np.dtype(self.__dtype).itemsize
+        if len(self.__pending) < block_bytes:
+            block = np.zeros(frames, dtype=self.__dtype)
+        else:
+            block = np.frombuffer(bytes(self.__pending[:block_bytes]), dtype=self.__dtype)
+            del self.__pending[:block_bytes]
+
+        if max(int(block.max()), -int(block.min())) >= SILENCE_PEAK:
+            self.__silent_blocks = 0
+        elif self.__silent_blocks is not None:
+            self.__silent_blocks += 1
+        return block
+
+    def is_audible(self, silent_blocks_limit):
+        # A stream that never made a sound doesn't get a source yet
+        return self.__silent_blocks is not None and self.__silent_blocks < silent_blocks_limit
+
+    def close(self):
+        self.__process.terminate()
+        self.__process.wait()
+
+
+class ObjectMixer:
+    # Every application on the virtual sink becomes one positioned source. All streams are read without blocking
+    # in the audio thread, once per block of the sink capture, so dozens of them need no thread of their own
+    def __init__(self, pulse_events, samplerate, dtype):
+        self.__pulse_events = pulse_events
+        self.__samplerate = samplerate
+        self.__dtype = dtype
+        self.__sink_index = None
+        self.__streams = {}
+        # Volume and place of every recorded application, kept apart from the speakers and never saved
+        self.__objects_parameters = {}
+        self.__streams_lock = threading.Lock()
+        self.__closed = False
+
+    def set_sink_index(self, sink_index):
+        # Streams of the old sink are recorded again from the new one
+        if sink_index != self.__sink_index:
+            self.__sink_index = sink_index
+            self.__close_streams()
+
+    def __get_object_name(self, sink_input, used_names):
+        name = sink_input.proplist.get("application.name") or f"Application {sink_input.index}"
+        unique_name, count = name, 1
+        while unique_name in used_names:
+            count += 1
+            unique_name = f"{name} {count}"
+        return unique_name
+
+    def __get_free_angle_index(self):
+        used_angles = {parameters.get("angle") for parameters in self.__objects_parameters.values()}
+        for i, angle in enumerate(OBJECT_ANGLES):
+            if angle not in used_angles:
+                return i
+        return len(self.__objects_parameters)
+
+    def get_object_parameters(self, name):
+        with self.__streams_lock:
+            return dict(self.__objects_parameters.get(name))
+
+    def set_object_parameters(self, name, parameters):
+        with self.__streams_lock:
+            if name not in self.__objects_parameters:
+                raise ValueError(f"Unknown object: {name}")
+            self.__objects_parameters[name] = {**self.__objects_parameters.get(name), **parameters}
+
+    def update_streams(self):
+        # Runs outside the audio thread, starting parec takes a while
+        process_id = str(os.getpid())
+        sink_inputs = {sink_input.index: sink_input for sink_input in self.__pulse_events.get_sink_inputs()
+                       if sink_input.sink == self.__sink_index and sink_input.proplist.get("application.process.id") != process_id}
+
+        with self.__streams_lock:
+            removed_streams = [self.__streams.pop(index) for index in list(self.__streams) if index not in sink_inputs]
+            new_indexes = [index for index in sink_inputs if index not in self.__streams]
+        for stream in removed_streams:
+            stream.close()
+
+        for index in new_indexes:
+            with self.__streams_lock:
+                used_names = {stream.get_name() for stream in self.__streams.values()}
+            name = self.__get_object_name(sink_inputs[index], used_names)
+            stream = ApplicationStream(index, name, self.__samplerate, self.__dtype)
+            with self.__streams_lock:
+                if not self.__closed:
+                    self.__streams[index] = stream
+                    if name not in self.__objects_parameters:
+                        self.__objects_parameters[name] = get_default_object_parameters(self.__get_free_angle_index())
+                    continue
+            stream.close()
+        METRICS.set_gauge("object_streams", len(sink_inputs))
+
+    def read_block(self, frames):
+        block_bytes = frames * np.dtype(self.__dtype).itemsize
+        silent_blocks_limit = SILENT_SECONDS * self.__samplerate / frames
+        object_names = []
+        channels_data = []
+        with self.__streams_lock:
+            streams = list(self.__streams.values())
+            # Applications that are gone lose their parameters here, in step with the names this block returns
+            if len(self.__objects_parameters) > len(streams):
+                self.__objects_parameters = {stream.get_name(): self.__objects_parameters.get(stream.get_name()) for stream in streams}
+        for stream in streams:
+            stream.read_available(block_bytes)
+            block = stream.pop_block(frames)
+            # Silent streams cost nothing further down, they have no source
+            if stream.is_audible(silent_blocks_limit):
+                object_names.append(stream.get_name())
+                channels_data.append(block)
+        METRICS.set_gauge("object_sources", len(object_names))
+        return object_names, channels_data
+
+    def __close_streams(self):
+        with self.__streams_lock:
+            streams, self.__streams = list(self.__streams.values()), {}
+        for stream in streams:
+            stream.close()
+
+    def close(self):
+        with self.__streams_lock:
+            self.__closed = True
+        self.__close_streams()
@@ -0,0 +1,136 @@
+import numpy as np
+import math
+
+from filter_cache import FILTER_CACHE, get_dataset_hash
+
+HEAD_RADIUS = 0.0875
+SPEED_OF_SOUND = 343.0
+# Head shadow of Brown and Duda's spherical head model, strongest a bit behind the ear
+MINIMUM_SHADOW = 0.1
+MINIMUM_SHADOW_ANGLE = 150.0
+KERNEL_TAPS = 64
+TABLE_ANGLES = 181
+
+
+def create_kernel_table(samplerate, taps=KERNEL_TAPS, angles=TABLE_ANGLES):
+    # One impulse response per whole degree between the ear axis (0) and the opposite side (180),
+    # the interaural delay and the head shadow filter are folded into it
+    fft_size = 4 * taps
+    incidence = np.radians(np.linspace(0.0, 180.0, angles))[:, np.newaxis]
+    frequencies = np.fft.rfftfreq(fft_size, 1.0 / samplerate)[np.newaxis, :]
+
+    head_delay = HEAD_RADIUS / SPEED_OF_SOUND
+    delay_seconds = np.where(incidence < np.pi / 2, -head_delay * np.cos(incidence), head_delay * (incidence - np.pi / 2)) + head_delay
+    shadow = (1 + MINIMUM_SHADOW / 2) + (1 - MINIMUM_SHADOW / 2) * np.cos(incidence / math.radians(MINIMUM_SHADOW_ANGLE) * np.pi)
+
+    # The shadow filter is discretised with the bilinear transform, its corner is where the wavelength meets the head
+    corner = 2 * SPEED_OF_SOUND / HEAD_RADIUS
+    warped = 2 * samplerate * np.tan(np.pi * frequencies / samplerate)
+    response = (1 + 1j * shadow * warped / corner) / (1 + 1j * warped / corner)
+    response = response * np.exp(-2j * np.pi * frequencies * delay_seconds)
+
+    kernels = np.fft.irfft(response, fft_size, axis=1)[:, :taps]
+    fade_out = np.cos(np.linspace(0.0, np.pi / 2, taps // 4)) ** 2
+    kernels[:, -len(fade_out):] *= fade_out
+    return kernels.astype(np.float32)
+
+
+class ParametricSpatializer:
+    # Stands in for a loopback OpenALListener: a block is queued, render() returns its stereo right away
+    def __init__(self, name, samplerate, dtype, buffer_size, taps=KERNEL_TAPS):
+        self.__name = name
+        self.__dtype = dtype
+        self.__buffer_size = buffer_size
+        self.__taps = taps
+        model_hash = get_dataset_hash(HEAD_RADIUS, SPEED_OF_SOUND, MINIMUM_SHADOW, MINIMUM_SHADOW_ANGLE, TABLE_ANGLES)
+        self.__kernel_table = FILTER_CACHE.load("parametric_kernels", {"model": model_hash, "samplerate": samplerate, "taps": taps},
+                                                lambda: create_kernel_table(samplerate, taps))
+        self.__fft_size = 1 << math.ceil(math.log2(buffer_size + taps - 1))
+
+        self.__channels_number = 0
+        self.__gains = np.zeros(0, dtype=np.float32)
+        self.__directions = np.zeros((0, 3))
+        self.__orientation = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, -1.0]])
+        self.__history = np.zeros((0, taps - 1), dtype=np.float32)
+        self.__pending_block = None
+        self.__kernels_spectrum = None
+
+    def is_loopback(self):
+        return True
+
+    def add_virtual_speakers(self, count, play=False):
+        self.__resize(self.__channels_number + count)
+
+    def remove_virtual_speakers(self, count):
+        self.__resize(self.__channels_number - count)
+
+    def reset_virtual_speakers(self, indexes, play=False):
+        self.__history[indexes] = 0.0
+
+    def __resize(self, channels_number):
+        history = np.zeros((channels_number, self.__taps - 1), dtype=np.float32)
+        kept = min(channels_number, self.__channels_number)
+        history[:kept] = self.__history[:kept]
+        self.__history = history
+        self.__gains = np.resize(self.__gains, channels_number)
+        self.__directions = np.resize(self.__directions, (channels_number, 3))
+        self.__channels_number = channels_number
+        self.__pending_block = None
+        self.__kernels_spectrum = None
+
+    def set_speakers_parameters(self, speakers_gains_and_positions):
+        for i, (gain, position) in enumerate(speakers_gains_and_positions[:self.__channels_number]):
+            self.__gains[i] = gain
+            # A source without a position stays in front of the head, both ears hear it alike
+            self.__directions[i] = np.asarray(position) / np.linalg.norm(position) if position else 0.0
+
+    def set_orientation(self, listener_orientation):
+        self.__orientation = listener_orientation
+
+    def play(self):
+        pass
+
+    def __get_kernels_spectrum(self):
+        # The right ear points along at x up, the left one the other way
+        at, up = self.__orientation[2], self.__orientation[1]
+        right_ear = np.cross(at, up)
+        right_ear /= np.linalg.norm(right_ear)
+        lateral = np.clip(self.__directions @ right_ear, -1.0, 1.0)
+        incidence = np.degrees(np.arccos(np.stack((-lateral, lateral))))
+
+        # Angles between the whole degrees of the table are interpolated linearly
+        lower = np.minimum(incidence.astype(int), len(self.__kernel_table) - 2)
+        fraction = (incidence - lower)[..., np.newaxis]
+        kernels = (1 - fraction) * self.__kernel_table[lower] + fraction * self.__kernel_table[lower + 1]
+        return np.fft.rfft(kernels * self.__gains[np.newaxis, :, np.newaxis], self.__fft_size, axis=-1)
+
+    def queue_block(self, channels_data, speaker_names):
+        if not channels_data:
+            return
+        self.__pending_block = np.stack(channels_data).astype(np.float32) / np.iinfo(self.__dtype).max
+
+    def render(self, frames):
+        if self.__pending_block is None or self.__channels_number == 0:
+            return np.zeros((frames, 2), dtype=np.float32)
+
+        # Overlap-save over every channel at once, both ears are summed over the channels in the frequency domain
+        block = np.concatenate((self.__history, self.__pending_block), axis=1)
+        self.__history = block[:, -(self.__taps - 1):]
+        block_spectrum = np.fft.rfft(block, self.__fft_size, axis=-1)
+
+        previous_kernels_spectrum = self.__kernels_spectrum
+        self.__kernels_spectrum = self.__get_kernels_spectrum()
+        output = np.fft.irfft((block_spectrum * self.__kernels_spectrum).sum(axis=1), self.__fft_size, axis=-1)
+        output = output[:, self.__taps - 1:self.__taps - 1 + frames]
+
+        # A head turn is crossfaded across the block instead of switching the filters at its start
+        if previous_kernels_spectrum is not None:
+            previous_output = np.fft.irfft((block_spectrum * previous_kernels_spectrum).sum(axis=1), self.__fft_size, axis=-1)
+            fade_in = np.linspace(0.0, 1.0, frames, dtype=np.float32)
+            output = previous_output[:, self.__taps - 1:self.__taps - 1 + frames] * (1 - fade_in) + output * fade_in
+
+        self.__pending_block = None
+        return output.T.astype(np.float32)
+
+    def close(self):
+        pass
@@ -0,0 +1,133 @@
+import json
+import time
+import os
+
+import settings
+from metrics import METRICS
+
+PROFILES_FILE_NAME = "Virtual_Surround_profiles.json"
+MINIMUM_BUFFERS_NUMBER = 2
+MAXIMUM_BUFFERS_NUMBER = 12
+# A clean session shorter than this proves nothing, the depth is only lowered after a long one
+CLEAN_SESSION_SECONDS = 600
+# Weight of the last session in the tracker averages, so one bad evening doesn't rewrite the profile
+TRACKER_SMOOTHING = 0.5
+# The pose rate starts a bit above what the tracker sustained, or a slow session could never be outgrown
+TRACKER_HEADROOM = 1.25
+PROFILE_SAMPLE_SECONDS = 5
+
+
+def get_profiles_file_name(settings_file_name=settings.SAVE_FILE_NAME):
+    # Next to the settings, one file for every headset and camera this machine has used
+    return os.path.join(os.path.dirname(settings_file_name), PROFILES_FILE_NAME)
+
+
+def load_profiles(file_name):
+    profiles = {"headsets": {}, "cameras": {}}
+    if os.path.exists(file_name):
+        try:
+            with open(file_name, "r", encoding="utf-8") as file:
+                profiles.update(json.load(file))
+        except json.JSONDecodeError:
+            print(f"Performance profiles in {file_name} are unreadable, they will be learned again.")
+    return profiles
+
+
+def save_profile(file_name, section, key, profile):
+    # The file is read again first, the audio and the tracker profiles are saved at different times
+    profiles = load_profiles(file_name)
+    profiles.get(section)[key] = profile
+    with open(file_name, "w", encoding="utf-8") as file:
+        json.dump(profiles, file, indent=4)
+
+
+def get_camera_key(cameras, width, height):
+    return f"cameras {','.join(str(camera) for camera in cameras)} at {width}x{height}"
+
+
+class AudioProfile:
+    # The smallest buffer depth a headset sink plays without dropouts. Every session moves it one step:
+    # up after a dropout, down after a long clean session, never back to a depth that dropped out
+    def __init__(self, headset_name, file_name=None):
+        self.__headset_name = headset_name
+        self.__file_name = file_name if file_name is not None else get_profiles_file_name()
+        self.__profile = load_profiles(self.__file_name).get("headsets").get(headset_name, {})
+        self.__start_time = time.monotonic()
+        self.__start_dropouts = self.__get_dropouts()
+
+    def __get_dropouts(self):
+        # Only the main listener plays on this headset
+        return (METRICS.get_total("openal_buffer_underruns_total", listener="0")
+                + METRICS.get_total("output_underruns_total"))
+
+    def apply(self, player_options):
+        if "buffers_number" not in self.__profile or "buffers_number" in player_options:
+            return player_options
+        print(f"Starting {self.__headset_name} with {self.__profile.get('buffers_number')} buffers from its performance profile.")
+        return dict(player_options, buffers_number=self.__profile.get("buffers_number"))
+
+    def save(self, buffers_number):
+        session_seconds = time.monotonic() - self.__start_time
+        dropouts = self.__get_dropouts() - self.__start_dropouts
+
+        profile = dict(self.__profile)
+        if dropouts > 0:
+            profile["dropout_buffers_number"] = max(profile.get("dropout_buffers_number", 0), buffers_number)
+            profile["buffers_number"] = min(buffers_number + 1, MAXIMUM_BUFFERS_NUMBER)
+        elif session_seconds >= CLEAN_SESSION_SECONDS:
+            profile["buffers_number"] = max(buffers_number - 1, profile.get("dropout_buffers_number", 0) + 1, MINIMUM_BUFFERS_NUMBER)
+        else:
+            profile.setdefault("buffers_number", buffers_number)
+        profile["sessions"] = profile.get("sessions", 0) + 1
+        save_profile(self.__file_name, "headsets", self.__headset_name, profile)
+
+
+class TrackerProfile:
+    # The frame rate and the inference cost a camera set sustains, averaged over the sessions
+    def __init__(self, cameras, width, height, file_name=None):
+        self.__cameras = [str(camera) for camera in cameras]
+        self.__camera_key = get_camera_key(cameras, width, height)
+        self.__file_name = file_name if file_name is not None else get_profiles_file_name()
+        self.__profile = load_profiles(self.__file_name).get("cameras").get(self.__camera_key, {})
+        self.__fps_samples = []
+        self.__inference_samples = []
+
+    def apply(self, tracker_options):
+        # The tracker processes frames no faster than these cameras managed, nor faster than their inference allows
+        if "tracker_fps" not in self.__profile or tracker_options.get("target_fps") is not None:
+            return tracker_options
+        sustained_fps = self.__profile.get("tracker_fps")
+        if self.__profile.get("inference_seconds"):
+            sustained_fps = min(sustained_fps, 1.0 / self.__profile.get("inference_seconds"))
+        target_fps = sustained_fps * TRACKER_HEADROOM
+        print(f"Tracking at up to {target_fps:.1f} frames per second from the performance profile of {self.__camera_key}.")
+        return dict(tracker_options, target_fps=target_fps)
+
+    def get_pose_update_rate(self, default_rate):
+        if "tracker_fps" not in self.__profile:
+            return default_rate
+        return min(default_rate, self.__profile.get("tracker_fps") * TRACKER_HEADROOM)
+
+    def sample(self):
+        # The slowest camera bounds the fused pose rate. Nothing is recorded until every camera has delivered frames
+        fps = [METRICS.get("tracker_fps", camera=camera) for camera in self.__cameras]
+        inference_seconds = [METRICS.get("tracker_inference_seconds", camera=camera) for camera in self.__cameras]
+        if None in fps or None in inference_seconds:
+            return
+        self.__fps_samples.append(min(fps))
+        self.__inference_samples.append(max(inference_seconds))
+
+    def __average(self, name, samples):
+        session_value = sum(samples) / len(samples)
+        if name not in self.__profile:
+            return session_value
+        return self.__profile.get(name) + TRACKER_SMOOTHING * (session_value - self.__profile.get(name))
+
+    def save(self):
+        if not self.__fps_samples:
+            return
+        profile = dict(self.__profile)
+        profile["tracker_fps"] = self.__average("tracker_fps", self.__fps_samples)
+        profile["inference_seconds"] = self.__average("inference_seconds", self.__inference_samples)
+        profile["sessions"] = profile.get("sessions", 0) + 1
+        save_profile(self.__file_name, "cameras", self.__camera_key, profile)
@@ -0,0 +1,166 @@
+import concurrent.futures
+import contextlib
+import threading
+import asyncio
+import queue
+import time
+
+import realtime
+from metrics import METRICS
+
+# How long stop() waits for the blocking calls that were running, before leaving them to their daemon threads
+STOP_TIMEOUT = 1.0
+# A stage that fails starts over after a pause, doubled while it keeps failing soon after each start
+STAGE_RESTART_SECONDS = 0.1
+MAXIMUM_STAGE_RESTART_SECONDS = 5.0
+
+
+class StageQueue:
+    # Bounded, a full queue makes the stage that puts wait, so a slow stage holds back the ones before it
+    def __init__(self, name, maxsize):
+        self.__name = name
+        self.__queue = asyncio.Queue(maxsize)
+
+    async def put(self, item):
+        await self.__queue.put(item)
+        METRICS.set_gauge("pipeline_queue_depth", self.__queue.qsize(), queue=self.__name)
+
+    async def get(self):
+        item = await self.__queue.get()
+        METRICS.set_gauge("pipeline_queue_depth", self.__queue.qsize(), queue=self.__name)
+        return item
+
+
+class StageExecutor:
+    # One daemon thread, unlike ThreadPoolExecutor workers it never keeps the interpreter from exiting on a stuck call
+    def __init__(self, name, role=None):
+        self.__role = role
+        self.__calls = queue.SimpleQueue()
+        self.__thread = threading.Thread(target=self.__run_calls, name=name, daemon=True)
+        self.__thread.start()
+
+    def submit(self, function, *args):
+        future = concurrent.futures.Future()
+        self.__calls.put((future, function, args))
+        return future
+
+    def __run_calls(self):
+        if self.__role is not None:
+            realtime.apply_thread_settings(self.__role)
+        while True:
+            call = self.__calls.get()
+            if call is None:
+                return
+            future, function, args = call
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(function(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def shutdown(self):
+        self.__calls.put(None)
+
+
+class Pipeline:
+    # One event loop schedules every stage. Blocking native calls (pipe reads, camera frames, OpenAL, PortAudio)
+    # run on the executor of their role, one thread each, so a stuck call only holds up the stages that wait for it
+    def __init__(self, name):
+        self.__name = name
+        self.__loop = asyncio.new_event_loop()
+        self.__executors = {}
+        self.__stages = []
+        self.__tasks = []
+        self.__running_calls = set()
+        self.__running_calls_lock = threading.Lock()
+        self.__thread = threading.Thread(target=self.__run_loop, name=name, daemon=True)
+
+    def add_executor(self, name, role=None):
+        # A role takes the scheduling settings of that thread from the command line
+        self.__executors[name] = StageExecutor(f"{self.__name} {name}", role)
+
+    def create_queue(self, name, maxsize):
+        return StageQueue(f"{self.__name} {name}", maxsize)
+
+    def add_stage(self, name, coroutine_function, *args):
+        # Stages can join a running pipeline, they start on the loop thread
+        if self.__thread.is_alive():
+            self.__loop.call_soon_threadsafe(self.__start_stage, name, coroutine_function, args)
+        else:
+            self.__stages.append((name, coroutine_function, args))
+
+    def start(self):
+        self.__thread.start()
+
+    def __start_stage(self, name, coroutine_function, args):
+        self.__tasks.append(self.__loop.create_task(self.__run_stage(name, coroutine_function, args), name=name))
+
+    def __run_loop(self):
+        asyncio.set_event_loop(self.__loop)
+        for name, coroutine_function, args in self.__stages:
+            self.__start_stage(name, coroutine_function, args)
+        self.__loop.run_forever()
+        self.__loop.close()
+
+    async def __run_stage(self, name, coroutine_function, args):
+        # One error, a passing OpenCV or OpenAL failure, must not end tracking or rendering for the whole session
+        restart_seconds = STAGE_RESTART_SECONDS
+        while True:
+            start = time.perf_counter()
+            try:
+                await coroutine_function(*args)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                METRICS.increment("pipeline_stage_failures_total", stage=name)
+                if time.perf_counter() - start > MAXIMUM_STAGE_RESTART_SECONDS:
+                    restart_seconds = STAGE_RESTART_SECONDS
+                print(f"Stage {name} of {self.__name} failed, it starts over in {restart_seconds} s: {e!r}")
+            await asyncio.sleep(restart_seconds)
+            restart_seconds = min(2 * restart_seconds, MAXIMUM_STAGE_RESTART_SECONDS)
+
+    async def run(self, executor_name, function, *args):
+        future = self.__executors.get(executor_name).submit(function, *args)
+        with self.__running_calls_lock:
+            self.__running_calls.add(future)
+        future.add_done_callback(self.__forget_call)
+        return await asyncio.wrap_future(future, loop=self.__loop)
+
+    def __forget_call(self, future):
+        with self.__running_calls_lock:
+            self.__running_calls.discard(future)
+
+    @contextlib.contextmanager
+    def deadline(self, stage_name, seconds):
+        # Every pass of a stage is timed, one that takes longer than its budget is counted as a miss
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        METRICS.set_gauge("pipeline_stage_seconds", elapsed, stage=stage_name)
+        if elapsed > seconds:
+            METRICS.increment("pipeline_deadline_misses_total", stage=stage_name)
+
+    def __cancel_stages(self):
+        for task in self.__tasks:
+            task.cancel()
+        self.__loop.create_task(self.__stop_loop())
+
+    async def __stop_loop(self):
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
+        self.__loop.stop()
+
+    def stop(self):
+        # Stages are cancelled at their next await, a blocking call has to be unblocked by its owner first (closing a pipe...)
+        if self.__thread.is_alive():
+            self.__loop.call_soon_threadsafe(self.__cancel_stages)
+            self.__thread.join()
+
+        with self.__running_calls_lock:
+            running_calls = list(self.__running_calls)
+        _, not_done = concurrent.futures.wait(running_calls, timeout=STOP_TIMEOUT)
+        if not_done:
+            print(f"{len(not_done)} blocking calls of {self.__name} were still running after {STOP_TIMEOUT} s.")
+        for executor in self.__executors.values():
+            executor.shutdown()
@@ -0,0 +1,104 @@
+import sounddevice as sd
+import numpy as np
+import threading
+
+from drift_compensation import DriftEstimator, AdaptiveResampler
+from metrics import METRICS
+
+WRITE_TIMEOUT = 0.5
+
+
+class RingBuffer:
+    # One producer and one consumer, the lock is only held while frames are copied
+    def __init__(self, frames, channels):
+        self.__data = np.zeros((frames, channels), dtype=np.float32)
+        self.__read_index = 0
+        self.__fill = 0
+        self.__lock = threading.Lock()
+        self.__space_available = threading.Condition(self.__lock)
+
+    def get_capacity(self):
+        return len(self.__data)
+
+    def get_fill(self):
+        with self.__lock:
+            return self.__fill
+
+    def write(self, frames, timeout=WRITE_TIMEOUT):
+        # Waits for the consumer, so its clock paces the producer, and returns how many frames didn't fit
+        with self.__space_available:
+            self.__space_available.wait_for(lambda: len(self.__data) - self.__fill >= len(frames), timeout)
+            count = min(len(frames), len(self.__data) - self.__fill)
+            write_index = (self.__read_index + self.__fill) % len(self.__data)
+            first_part = min(count, len(self.__data) - write_index)
+            self.__data[write_index:write_index + first_part] = frames[:first_part]
+            self.__data[:count - first_part] = frames[first_part:count]
+            self.__fill += count
+        return len(frames) - count
+
+    def read_into(self, output):
+        with self.__space_available:
+            count = min(len(output), self.__fill)
+            first_part = min(count, len(self.__data) - self.__read_index)
+            output[:first_part] = self.__data[self.__read_index:self.__read_index + first_part]
+            output[first_part:count] = self.__data[:count - first_part]
+            self.__read_index = (self.__read_index + count) % len(self.__data)
+            self.__fill -= count
+            self.__space_available.notify()
+        return count
+
+
+class PortAudioOutput:
+    # The device callback pulls rendered frames, so the headset clock decides when the next block is needed
+    def __init__(self, samplerate, blocksize, ring_blocks, prefill_blocks, channels=2, drift_compensation=True):
+        self.__ring_buffer = RingBuffer(blocksize * ring_blocks, channels)
+        self.__prefill_frames = blocksize * prefill_blocks
+        # The capture runs on the virtual sink clock, the callback on the headset clock, resampling keeps the fill on the prefill
+        self.__drift_estimator = None
+        self.__resampler = None
+        if drift_compensation:
+            self.__drift_estimator = DriftEstimator(self.__prefill_frames, samplerate)
+            self.__resampler = AdaptiveResampler(channels)
+        self.__priming = True
+        self.__stream = sd.OutputStream(samplerate=samplerate, channels=channels, dtype=np.float32,
+                                        blocksize=blocksize, callback=self.__pull_frames)
+
+    def start(self):
+        self.__stream.start()
+
+    def close(self):
+        self.__stream.close()
+
+    def get_ring_fill(self):
+        return self.__ring_buffer.get_fill()
+
+    def get_ring_capacity(self):
+        return self.__ring_buffer.get_capacity()
+
+    def write(self, frames):
+        if self.__drift_estimator is not None:
+            ratio = self.__drift_estimator.update(self.__ring_buffer.get_fill(), len(frames))
+            frames = self.__resampler.process(frames, ratio)
+        overflow_frames = self.__ring_buffer.write(frames)
+        if overflow_frames:
+            METRICS.increment("output_overflow_frames_total", overflow_frames)
+
+    def __pull_frames(self, outdata, frames, time_info, status):
+        if status.output_underflow:
+            METRICS.increment("output_device_underflows_total")
+        METRICS.set_gauge("output_latency_seconds", time_info.outputBufferDacTime - time_info.currentTime)
+
+        # After an underrun silence is played until the buffer holds the prefill again, not one block at a time
+        fill = self.__ring_buffer.get_fill()
+        METRICS.set_gauge("output_ring_fill_frames", fill)
+        if self.__priming and fill < self.__prefill_frames:
+            outdata.fill(0)
+            return
+        self.__priming = False
+
+        count = self.__ring_buffer.read_into(outdata)
+        if count < frames:
+            outdata[count:] = 0
+            self.__priming = True
+            METRICS.increment("output_underruns_total")
+            METRICS.increment("output_underrun_frames_total", frames - count)
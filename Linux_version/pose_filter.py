@@ -0,0 +1,65 @@
+import numpy as np
+import json
+import math
+
+# Rotation vectors are in radians, so the speed that raises the cutoff is in radians per second
+POSE_FILTER_SETTINGS = {"min_cutoff": 0.5, "beta": 0.7, "derivative_cutoff": 1.0}
+
+
+def get_smoothing_factor(cutoff, elapsed_seconds):
+    time_constant = 1.0 / (2.0 * math.pi * cutoff)
+    return 1.0 / (1.0 + time_constant / elapsed_seconds)
+
+
+class OneEuroFilter:
+    # Heavy smoothing while the value stands still, the cutoff rises with its speed so fast moves don't lag
+    def __init__(self, min_cutoff=0.5, beta=0.7, derivative_cutoff=1.0):
+        self.__min_cutoff = min_cutoff
+        self.__beta = beta
+        self.__derivative_cutoff = derivative_cutoff
+        self.reset()
+
+    def reset(self):
+        self.__value = None
+        self.__derivative = None
+        self.__timestamp = None
+
+    def __call__(self, value, timestamp):
+        value = np.asarray(value, dtype=np.float64)
+        if self.__value is None or timestamp <= self.__timestamp:
+            self.__value = value
+            self.__derivative = np.zeros_like(value)
+            self.__timestamp = timestamp
+            return value
+
+        elapsed_seconds = timestamp - self.__timestamp
+        derivative = (value - self.__value) / elapsed_seconds
+        self.__derivative += get_smoothing_factor(self.__derivative_cutoff, elapsed_seconds) * (derivative - self.__derivative)
+
+        cutoff = self.__min_cutoff + self.__beta * np.linalg.norm(self.__derivative)
+        self.__value = self.__value + get_smoothing_factor(cutoff, elapsed_seconds) * (value - self.__value)
+        self.__timestamp = timestamp
+        return self.__value
+
+
+def rotation_vector_to_matrix(rotation_vector):
+    # Rodrigues' formula, for tools that replay recordings without OpenCV
+    angle = np.linalg.norm(rotation_vector)
+    if angle < 1e-12:
+        return np.identity(3)
+    x, y, z = np.asarray(rotation_vector) / angle
+    cross_product_matrix = np.array([[0.0, -z, y], [z, 0.0, -x], [-y, x, 0.0]])
+    return np.identity(3) + math.sin(angle) * cross_product_matrix + (1.0 - math.cos(angle)) * cross_product_matrix @ cross_product_matrix
+
+
+def load_pose_recording(file_name):
+    # Rows of [timestamp, x, y, z] written by FaceTracker(pose_recording_file=...)
+    with open(file_name, "r", encoding="utf-8") as file:
+        recording = np.array(json.load(file), dtype=np.float64)
+    return recording[:, 0], recording[:, 1:]
+
+
+def save_pose_recording(recording, file_name):
+    with open(file_name, "w", encoding="utf-8") as file:
+        json.dump(recording, file)
+    print(f"Pose recording has been saved to: {file_name}.")
@@ -0,0 +1,75 @@
+import argparse
+import numpy as np
+import math
+
+import pose_filter
+
+REFERENCE_WINDOW = 9
+STILL_SPEED = math.radians(10)
+MAXIMUM_LAG_SECONDS = 0.3
+
+
+def create_synthetic_recording(fps=30, noise_degrees=1.5, seed=0):
+    # Still stretches and quick turns of a head, with the jitter solvePnP usually adds
+    timestamps = np.arange(0, 20, 1.0 / fps)
+    yaw = np.zeros_like(timestamps)
+    for start, end, angle in [(3.0, 3.4, 40), (6.0, 6.3, -30), (10.0, 11.5, 15), (14.0, 14.25, 0)]:
+        previous_angle = yaw[np.searchsorted(timestamps, start) - 1]
+        fraction = np.clip((timestamps - start) / (end - start), 0.0, 1.0)
+        turning = timestamps >= start
+        yaw[turning] = previous_angle + (angle - previous_angle) * (1 - np.cos(np.pi * fraction[turning])) / 2
+
+    rotation_vectors = np.zeros((len(timestamps), 3))
+    rotation_vectors[:, 1] = np.radians(yaw)
+    rotation_vectors += np.random.default_rng(seed).normal(0.0, math.radians(noise_degrees), rotation_vectors.shape)
+    return timestamps, rotation_vectors
+
+
+def get_reference(rotation_vectors):
+    # A centered moving average has no lag, it stands in for the true pose of a real recording
+    kernel = np.ones(REFERENCE_WINDOW) / REFERENCE_WINDOW
+    padded = np.pad(rotation_vectors, ((REFERENCE_WINDOW // 2, REFERENCE_WINDOW // 2), (0, 0)), mode="edge")
+    return np.stack([np.convolve(padded[:, axis], kernel, mode="valid") for axis in range(3)], axis=1)
+
+
+def measure(timestamps, rotation_vectors, reference):
+    frame_seconds = np.median(np.diff(timestamps))
+    reference_speed = np.linalg.norm(np.gradient(reference, timestamps, axis=0), axis=1)
+    still = reference_speed[1:-1] < STILL_SPEED
+
+    # The second difference ignores a slow catch up after a turn and only sees the wobble
+    wobble = np.linalg.norm(np.diff(rotation_vectors, n=2, axis=0), axis=1)
+    jitter_degrees = math.degrees(np.sqrt(np.mean(wobble[still] ** 2))) if still.any() else float("nan")
+
+    errors = [np.mean(np.linalg.norm(rotation_vectors[shift:] - reference[:len(reference) - shift], axis=1))
+              for shift in range(int(MAXIMUM_LAG_SECONDS / frame_seconds) + 1)]
+    lag_milliseconds = int(np.argmin(errors)) * frame_seconds * 1000
+    return jitter_degrees, lag_milliseconds
+
+
+def run_filter(timestamps, rotation_vectors, **filter_settings):
+    one_euro_filter = pose_filter.OneEuroFilter(**filter_settings)
+    return np.array([one_euro_filter(rotation_vector, timestamp) for timestamp, rotation_vector in zip(timestamps, rotation_vectors)])
+
+
+parser = argparse.ArgumentParser(description="Jitter against lag of the head pose smoothing")
+parser.add_argument("recording", nargs="?", default=None, help="file saved with main.py --record-poses, a synthetic head is used without it")
+parser.add_argument("--min-cutoffs", type=float, nargs="+", default=[0.3, 0.5, 1.0, 2.0])
+parser.add_argument("--betas", type=float, nargs="+", default=[0.0, 0.3, 0.7, 1.5])
+parser.add_argument("--derivative-cutoff", type=float, default=pose_filter.POSE_FILTER_SETTINGS.get("derivative_cutoff"))
+args = parser.parse_args()
+
+if args.recording is None:
+    timestamps, rotation_vectors = create_synthetic_recording()
+else:
+    timestamps, rotation_vectors = pose_filter.load_pose_recording(args.recording)
+reference = get_reference(rotation_vectors)
+
+print(f"{'min_cutoff':>10} {'beta':>6} {'jitter [deg]':>13} {'lag [ms]':>9}")
+jitter_degrees, lag_milliseconds = measure(timestamps, rotation_vectors, reference)
+print(f"{'raw':>10} {'':>6} {jitter_degrees:>13.3f} {lag_milliseconds:>9.0f}")
+for min_cutoff in args.min_cutoffs:
+    for beta in args.betas:
+        filtered = run_filter(timestamps, rotation_vectors, min_cutoff=min_cutoff, beta=beta, derivative_cutoff=args.derivative_cutoff)
+        jitter_degrees, lag_milliseconds = measure(timestamps, filtered, reference)
+        print(f"{min_cutoff:>10.2f} {beta:>6.2f} {jitter_degrees:>13.3f} {lag_milliseconds:>9.0f}")
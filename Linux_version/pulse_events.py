@@ -0,0 +1,125 @@
+import threading
+import pulsectl
+
+LISTEN_TIMEOUT = 0.5
+
+
+class PulseEventListener:
+    def __init__(self, client_name="Virtual Surround events"):
+        # pulsectl connections can't be shared with a thread that sits in event_listen()
+        self.__pulse = pulsectl.Pulse(client_name)
+
+        self.__lock = threading.Lock()
+        self.__sinks = {}
+        self.__sink_inputs = {}
+        self.__routes = {}
+        self.__sink_input_routes = {}
+        self.__pending_events = []
+        self.__sweep_requested = False
+
+        self.__stop_event = threading.Event()
+        self.__listen_thread = threading.Thread(target=self.__listen, daemon=True)
+
+    def start(self):
+        for sink in self.__pulse.sink_list():
+            self.__sinks[sink.index] = sink
+        for sink_input in self.__pulse.sink_input_list():
+            self.__sink_inputs[sink_input.index] = sink_input
+
+        self.__pulse.event_mask_set("sink", "sink_input")
+        self.__pulse.event_callback_set(self.__queue_event)
+        self.__listen_thread.start()
+
+    def stop(self):
+        self.__stop_event.set()
+        self.__pulse.event_listen_stop()
+        self.__listen_thread.join()
+        self.__pulse.close()
+
+    def get_sinks(self):
+        with self.__lock:
+            return list(self.__sinks.values())
+
+    def get_sink_inputs(self):
+        # Kept up to date from the events, so the audio thread never has to ask the server
+        with self.__lock:
+            return list(self.__sink_inputs.values())
+
+    def set_route(self, media_name, sink_name):
+        with self.__lock:
+            self.__routes[media_name] = sink_name
+            self.__sweep_requested = True
+        self.__pulse.event_listen_stop()
+
+    def clear_route(self, media_name):
+        with self.__lock:
+            self.__routes.pop(media_name, None)
+
+    def set_sink_input_route(self, sink_input_index, sink_name):
+        # Pins one stream, it wins over a route of its media name
+        with self.__lock:
+            self.__sink_input_routes[sink_input_index] = sink_name
+            self.__sweep_requested = True
+        self.__pulse.event_listen_stop()
+
+    def clear_sink_input_route(self, sink_input_index):
+        with self.__lock:
+            self.__sink_input_routes.pop(sink_input_index, None)
+
+    def __queue_event(self, event):
+        # Pulse can't be queried from inside the callback, events are handled after event_listen() returns
+        self.__pending_events.append(event)
+        raise pulsectl.PulseLoopStop
+
+    def __listen(self):
+        while not self.__stop_event.is_set():
+            self.__pulse.event_listen(timeout=LISTEN_TIMEOUT)
+
+            events, self.__pending_events = self.__pending_events, []
+            for event in events:
+                self.__handle_event(event)
+
+            with self.__lock:
+                sweep_requested, self.__sweep_requested = self.__sweep_requested, False
+            if sweep_requested:
+                for sink_input in self.__pulse.sink_input_list():
+                    self.__route_sink_input(sink_input)
+
+    def __handle_event(self, event):
+        try:
+            if event.facility == "sink":
+                self.__handle_sink_event(event)
+            elif event.facility == "sink_input" and event.t == "remove":
+                with self.__lock:
+                    self.__sink_inputs.pop(event.index, None)
+            elif event.facility == "sink_input":
+                self.__route_sink_input(self.__pulse.sink_input_info(event.index))
+        except pulsectl.PulseIndexError:
+            # The object was removed before we got to it
+            pass
+
+    def __handle_sink_event(self, event):
+        if event.t == "remove":
+            with self.__lock:
+                self.__sinks.pop(event.index, None)
+            return
+
+        sink = self.__pulse.sink_info(event.index)
+        with self.__lock:
+            self.__sinks[sink.index] = sink
+            # Streams that waited for this sink are moved as soon as it shows up
+            if sink.name in self.__routes.values() or sink.name in self.__sink_input_routes.values():
+                self.__sweep_requested = True
+
+    def __route_sink_input(self, sink_input):
+        with self.__lock:
+            self.__sink_inputs[sink_input.index] = sink_input
+            target_sink_name = self.__sink_input_routes.get(sink_input.index, self.__routes.get(sink_input.proplist.get("media.name")))
+            target_sink = next((sink for sink in self.__sinks.values() if sink.name == target_sink_name), None)
+
+        if target_sink is not None and sink_input.sink != target_sink.index:
+            try:
+                self.__pulse.sink_input_move(sink_input.index, target_sink.index)
+            except (pulsectl.PulseOperationFailed, pulsectl.PulseIndexError):
+                # The stream or the sink went away in the meantime, the next event of either routes it again
+                print(f"Sink input {sink_input.index} couldn't be moved to {target_sink.name}.")
@@ -0,0 +1,100 @@
+import ctypes.util
+import threading
+import ctypes
+import os
+
+from metrics import METRICS
+
+SCHEDULING_POLICIES = {
+    "other": os.SCHED_OTHER,
+    "fifo": os.SCHED_FIFO,
+    "rr": os.SCHED_RR
+}
+
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+# OpenMP and BLAS pools, MediaPipe's TFLite runtime sizes its own pool and reads none of these
+INFERENCE_THREADS_ENVIRONMENT = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"]
+
+# Filled from the command line, read by the threads when they start
+THREAD_SETTINGS = {
+    "audio": {"policy": "other", "priority": 0, "nice": None, "cpus": None},
+    "tracker": {"policy": "other", "priority": 0, "nice": None, "cpus": None}
+}
+INFERENCE_SETTINGS = {"threads": None}
+
+
+def parse_cpus(text):
+    cpus = set()
+    for part in text.split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.update(range(int(first), int(last) + 1))
+        elif part.strip():
+            cpus.add(int(part))
+    return cpus
+
+
+def get_metric_labels(role, pid):
+    return {"thread": role} if pid == 0 else {"thread": f"{role} process"}
+
+
+def get_priority_target(pid):
+    # sched_*() take 0 for the calling thread, setpriority() needs its kernel thread id
+    return pid if pid != 0 else threading.get_native_id()
+
+
+def apply_thread_settings(role, pid=0):
+    # On Linux pid 0 means the calling thread only, other threads of the process keep their settings
+    thread_settings = THREAD_SETTINGS.get(role)
+    policy_name = thread_settings.get("policy")
+
+    if policy_name != "other":
+        try:
+            os.sched_setscheduler(pid, SCHEDULING_POLICIES.get(policy_name), os.sched_param(thread_settings.get("priority")))
+            METRICS.set_gauge("realtime_scheduling_applied", 1, **get_metric_labels(role, pid))
+        except OSError as error:
+            METRICS.set_gauge("realtime_scheduling_applied", 0, **get_metric_labels(role, pid))
+            print(f"Could not set {policy_name} scheduling for {role}: {error}.")
+
+    if thread_settings.get("nice") is not None and os.sched_getscheduler(pid) == os.SCHED_OTHER:
+        try:
+            os.setpriority(os.PRIO_PROCESS, get_priority_target(pid), thread_settings.get("nice"))
+        except OSError as error:
+            print(f"Could not set nice value for {role}: {error}.")
+
+    if thread_settings.get("cpus"):
+        try:
+            os.sched_setaffinity(pid, thread_settings.get("cpus"))
+        except OSError as error:
+            print(f"Could not pin {role} to CPUs {sorted(thread_settings.get('cpus'))}: {error}.")
+
+    report_thread_settings(role, pid)
+
+
+def report_thread_settings(role, pid=0):
+    labels = get_metric_labels(role, pid)
+    METRICS.set_gauge("thread_scheduling_policy", os.sched_getscheduler(pid), **labels)
+    METRICS.set_gauge("thread_scheduling_priority", os.sched_getparam(pid).sched_priority, **labels)
+    METRICS.set_gauge("thread_nice", os.getpriority(os.PRIO_PROCESS, get_priority_target(pid)), **labels)
+    METRICS.set_gauge("thread_cpu_count", len(os.sched_getaffinity(pid)), **labels)
+
+
+def lock_memory():
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    if libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+        METRICS.set_gauge("process_memory_locked", 0)
+        print(f"Could not lock memory: {os.strerror(ctypes.get_errno())}, check the memlock limit.")
+        return False
+
+    METRICS.set_gauge("process_memory_locked", 1)
+    return True
+
+
+def limit_inference_threads(threads):
+    # The environment is read when the inference libraries load, so this has to run before the lazy imports
+    INFERENCE_SETTINGS["threads"] = threads
+    for variable in INFERENCE_THREADS_ENVIRONMENT:
+        os.environ[variable] = str(threads)
+    METRICS.set_gauge("inference_threads_limit", threads)
@@ -0,0 +1,88 @@
+import numpy as np
+import math
+
+from bass_management import LFE_SPEAKER_NAME
+
+ROOM_DECAY_SECONDS = 0.4
+# Where the room sources stand and when their first reflection arrives after the direct sound,
+# each one also plays one line of the late reverb
+ROOM_SOURCES = [(-65, 0.0073), (65, 0.0081), (-140, 0.0134), (140, 0.0149)]
+# Lengths without a common ratio so the echoes don't line up, all longer than a block, so a whole block of the network is computed at once
+FDN_DELAYS_SECONDS = [0.0297, 0.0371, 0.0411, 0.0437]
+EARLY_REFLECTIONS_GAIN = 0.5
+LATE_REVERB_GAIN = 0.3
+
+
+def get_room_source_names():
+    return [f"Room {i + 1}" for i in range(len(ROOM_SOURCES))]
+
+
+class FeedbackDelayNetwork:
+    # Four delay lines mixed back through an orthogonal Hadamard matrix, each damped for the same decay time
+    def __init__(self, samplerate, decay_seconds):
+        self.__delays = [int(delay_seconds * samplerate) for delay_seconds in FDN_DELAYS_SECONDS]
+        self.__lines = [np.zeros(delay) for delay in self.__delays]
+        self.__position = [0] * len(self.__delays)
+        # -60 dB after decay_seconds, whatever the length of the line
+        self.__line_gains = np.array([10 ** (-3 * delay / (samplerate * decay_seconds)) for delay in self.__delays])
+        self.__feedback = 0.5 * np.array([[1, 1, 1, 1], [1, -1, 1, -1], [1, 1, -1, -1], [1, -1, -1, 1]], dtype=np.float64)
+        self.__input_gains = np.array([0.5, -0.5, 0.5, -0.5])
+
+    def __process_chunk(self, mono):
+        frames = len(mono)
+        indexes = [(position + np.arange(frames)) % delay for position, delay in zip(self.__position, self.__delays)]
+        # What left the lines now was written one full line length ago, so the whole chunk is read at once
+        outputs = np.stack([line[line_indexes] for line, line_indexes in zip(self.__lines, indexes)], axis=1)
+        feedback = (outputs * self.__line_gains) @ self.__feedback.T + mono[:, np.newaxis] * self.__input_gains
+        for i, (line, line_indexes) in enumerate(zip(self.__lines, indexes)):
+            line[line_indexes] = feedback[:, i]
+            self.__position[i] = (self.__position[i] + frames) % self.__delays[i]
+        return outputs
+
+    def process(self, mono):
+        chunk_frames = min(self.__delays)
+        return np.concatenate([self.__process_chunk(mono[start:start + chunk_frames])
+                               for start in range(0, len(mono), chunk_frames)])
+
+
+class RoomReverb:
+    # One reverb for the whole layout: the speakers are mixed down to first order (omni, front, side) once,
+    # so adding speakers doesn't add reverb work. The room sources stay put in the room while the head turns
+    def __init__(self, samplerate, speaker_names, dtype, decay_seconds=ROOM_DECAY_SECONDS):
+        self.__dtype = dtype
+        self.__speaker_indexes = [i for i, speaker_name in enumerate(speaker_names) if speaker_name != LFE_SPEAKER_NAME]
+        self.__encoder = np.zeros((len(self.__speaker_indexes), 3))
+
+        room_angles = np.radians([angle for angle, _ in ROOM_SOURCES])
+        # A cardioid aimed at every room source, its reflection mostly carries the speakers on its side
+        self.__pickups = 0.5 * np.stack((np.ones(len(room_angles)), np.cos(room_angles), np.sin(room_angles)))
+        self.__reflection_delays = [int(delay_seconds * samplerate) for _, delay_seconds in ROOM_SOURCES]
+        self.__reflections_history = np.zeros((max(self.__reflection_delays), len(ROOM_SOURCES)))
+        self.__fdn = FeedbackDelayNetwork(samplerate, decay_seconds)
+
+    def get_source_names(self):
+        return get_room_source_names()
+
+    def get_source_angle(self, source_name):
+        return ROOM_SOURCES[get_room_source_names().index(source_name)][0]
+
+    def set_speakers(self, speakers_gains_and_angles):
+        # In the speakers' order, the LFE channel is left out of the room
+        gains_and_angles = [speakers_gains_and_angles[i] for i in self.__speaker_indexes]
+        self.__encoder = np.array([[gain, gain * math.cos(math.radians(angle)), gain * math.sin(math.radians(angle))]
+                                   for gain, angle in gains_and_angles]).reshape(-1, 3)
+
+    def process(self, channels_data):
+        block = np.stack([channels_data[i] for i in self.__speaker_indexes], axis=1).astype(np.float64)
+        first_order = block @ self.__encoder
+        frames = len(block)
+
+        reflections = np.concatenate((self.__reflections_history, first_order @ self.__pickups))
+        self.__reflections_history = reflections[-len(self.__reflections_history):]
+        early = np.stack([reflections[len(reflections) - frames - delay:len(reflections) - delay, i]
+                          for i, delay in enumerate(self.__reflection_delays)], axis=1)
+        late = self.__fdn.process(first_order[:, 0])
+
+        limits = np.iinfo(self.__dtype)
+        sources = np.clip(EARLY_REFLECTIONS_GAIN * early + LATE_REVERB_GAIN * late, limits.min, limits.max).astype(self.__dtype)
+        return [np.ascontiguousarray(sources[:, i]) for i in range(sources.shape[1])]
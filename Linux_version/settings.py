@@ -0,0 +1,74 @@
+import copy
+import json
+import os
+
+SINK_NAME = "Virtual_Surround_by_nixpl"
+SAVE_FILE_NAME = "Virtual_Surround_settings.json"
+
+DEFAULT_SETTINGS = {
+    "media.name": "Playback Stream",
+    "offset_rotation_matrix": [[1.0, 0.0, 0.0],
+                               [0.0, 1.0, 0.0],
+                               [0.0, 0.0, 1.0]],
+    "selected_surround_system": "LCR",
+    "speakers_parameters": {
+        "Front left": {"volume": 100, "angle": -35, "min_angle": -20, "max_angle": -70},
+        "Front right": {"volume": 100, "angle": 35, "min_angle": 20, "max_angle": 70},
+        "Front center": {"volume": 100, "angle": 0, "min_angle": 0, "max_angle": 0},
+        "Rear left": {"volume": 50, "angle": -130, "min_angle": -90, "max_angle": -160},
+        "Rear right": {"volume": 50, "angle": 130, "min_angle": 90, "max_angle": 160},
+        # The LFE channel isn't spatialized, its angle only places it on the compass
+        "LFE": {"volume": 100, "angle": 180, "min_angle": 180, "max_angle": 180}
+    },
+    # Sinks of the extra listeners, the second face from the left hears the first one and so on
+    "listener_headsets": []
+}
+
+# Applications take the place of the speakers, the list is filled with the ones that are playing
+OBJECTS_SURROUND_SYSTEM = "Objects"
+# Applications still play to a stereo virtual device, it paces the renderer
+OBJECTS_CHANNELS_NUMBER = 2
+
+SURROUND_SYSTEM_DICT_SOUNDDEVICE_ORDER = {
+    "Stereo": ["Front left", "Front right"],
+    "LCR": ["Front right", "Front left", "Front center"],
+    "LCR + Rear": ["Front left", "Front right", "Rear left", "Rear right", "Front center"],
+    "LCR + Rear + LFE": ["Front left", "Front right", "Front center", "LFE", "Rear left", "Rear right"],
+    OBJECTS_SURROUND_SYSTEM: []
+}
+
+
+def get_default_settings():
+    return copy.deepcopy(DEFAULT_SETTINGS)
+
+
+def get_channels_number(surround_system):
+    if surround_system == OBJECTS_SURROUND_SYSTEM:
+        return OBJECTS_CHANNELS_NUMBER
+    return len(SURROUND_SYSTEM_DICT_SOUNDDEVICE_ORDER.get(surround_system))
+
+
+def restore_settings(file_name=SAVE_FILE_NAME):
+    if os.path.exists(file_name):
+        try:
+            with open(file_name, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            # Older or hand edited files get the defaults of what they lack, down to single speakers
+            for key, value in DEFAULT_SETTINGS.items():
+                data.setdefault(key, copy.deepcopy(value))
+            for speaker_name, speaker in DEFAULT_SETTINGS.get("speakers_parameters").items():
+                data.get("speakers_parameters").setdefault(speaker_name, copy.deepcopy(speaker))
+            # Applications were saved along with the speakers by earlier versions
+            data["speakers_parameters"] = {speaker_name: speaker for speaker_name, speaker in data.get("speakers_parameters").items()
+                                           if not speaker.get("object")}
+            return data
+        except json.JSONDecodeError:
+            return get_default_settings()
+    else:
+        return get_default_settings()
+
+
+def save_settings(data, file_name=SAVE_FILE_NAME):
+    with open(file_name, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=4)
+    print(f"Settings have been saved to: {file_name}.")
@@ -0,0 +1,35 @@
+import contextlib
+import threading
+import time
+
+
+class StartupTimer:
+    def __init__(self):
+        self.__start_time = time.perf_counter()
+        self.__lock = threading.Lock()
+        self.__phases = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        phase_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phase_end = time.perf_counter()
+            with self.__lock:
+                self.__phases.append((name, phase_start - self.__start_time, phase_end - self.__start_time))
+
+    def mark(self, name):
+        moment = time.perf_counter() - self.__start_time
+        with self.__lock:
+            self.__phases.append((name, moment, moment))
+
+    def get_phases(self):
+        with self.__lock:
+            return sorted(self.__phases, key=lambda phase: phase[1])
+
+    def report(self):
+        lines = ["Startup timing:"]
+        for name, start, end in self.get_phases():
+            lines.append(f"  {name:<24} +{start * 1000:8.1f} ms  took {(end - start) * 1000:8.1f} ms")
+        return "\n".join(lines)
@@ -0,0 +1,538 @@
+import multiprocessing
+import numpy as np
+import collections
+import threading
+import tempfile
+import argparse
+import soundfile
+import types
+import json
+import time
+import math
+import sys
+import os
+
+import virtual_player as vp
+import portaudio_output
+import face_tracker
+import pose_filter
+import realtime
+import settings
+from metrics import METRICS
+from tracing import TRACER
+
+PRESSURE_KINDS = ["cpu", "memory", "scheduling"]
+MEMORY_PRESSURE_BYTES = 64 * 1024 * 1024
+SCHEDULING_PRESSURE_THREADS = 16
+STALENESS_SAMPLE_SECONDS = 0.01
+DEVICE_PRIORITY = 20
+FAKE_HEADSET_NAME = "stress_test_headset"
+# A level whose headset blocks stay below this RMS got silence, however clean its underrun counts look
+SILENCE_RMS = 1e-4
+DEFAULT_ROTATION_MATRIX = np.array([
+    [1.0, 0.0, 0.0],
+    [0.0, -1.0, 0.0],
+    [0.0, 0.0, -1.0]
+])
+
+# Stands in for parec on the PATH, it plays the recording in real time and catches up after a stall, as the sound server would
+PAREC_SHIM = """#!{python}
+import numpy as np
+import time
+import sys
+import os
+
+samples = np.load(os.environ["STRESS_CAPTURE_FILE"])
+block_frames = int(os.environ["STRESS_BLOCK_FRAMES"])
+block_seconds = block_frames / int(os.environ["STRESS_SAMPLERATE"])
+position = 0
+next_time = time.monotonic()
+while True:
+    block = np.take(samples, range(position, position + block_frames), axis=0, mode="wrap")
+    position = (position + block_frames) % len(samples)
+    try:
+        sys.stdout.buffer.write(block.tobytes())
+        sys.stdout.buffer.flush()
+    except BrokenPipeError:
+        break
+    next_time += block_seconds
+    time.sleep(max(next_time - time.monotonic(), 0.0))
+"""
+
+
+class FakeSink:
+    def __init__(self, index, name):
+        self.index = index
+        self.name = name
+        self.description = name
+        self.volume = types.SimpleNamespace(value_flat=1.0)
+
+
+class FakePulse:
+    # Just enough of pulsectl.Pulse for VirtualPlayer: null sink modules, sinks and volumes, no sink inputs
+    def __init__(self, headset_name):
+        self.__sinks = [FakeSink(0, headset_name)]
+        self.__modules = []
+        self.__default_sink_name = headset_name
+
+    def server_info(self):
+        return types.SimpleNamespace(default_sink_name=self.__default_sink_name)
+
+    def sink_list(self):
+        return list(self.__sinks)
+
+    def get_sink_by_name(self, name):
+        return next(sink for sink in self.__sinks if sink.name == name)
+
+    def module_list(self):
+        return list(self.__modules)
+
+    def module_load(self, name, argument):
+        module = types.SimpleNamespace(index=len(self.__modules) + 1, name=name, argument=argument)
+        self.__modules.append(module)
+        self.__sinks.append(FakeSink(len(self.__sinks), vp.parse_module_arguments(argument).get("sink_name")))
+        return module.index
+
+    def module_unload(self, index):
+        self.__modules = [module for module in self.__modules if module.index != index]
+
+    def default_set(self, sink):
+        self.__default_sink_name = sink.name
+
+    def volume_set_all_chans(self, sink, volume):
+        sink.volume.value_flat = volume
+
+    def sink_input_list(self):
+        return []
+
+    def sink_input_move(self, sink_input_index, sink_index):
+        pass
+
+
+class FakePulseEvents:
+    def __init__(self, pulse):
+        self.__pulse = pulse
+
+    def get_sinks(self):
+        return self.__pulse.sink_list()
+
+    def get_sink_inputs(self):
+        return []
+
+    def set_route(self, media_name, sink_name):
+        pass
+
+    def clear_route(self, media_name):
+        pass
+
+    def set_sink_input_route(self, sink_input_index, sink_name):
+        pass
+
+    def clear_sink_input_route(self, sink_input_index):
+        pass
+
+
+class FakeOutputStream:
+    # A device clock: the callback is called every block on time, a call that comes a whole block late is an underflow
+    def __init__(self, sink_name, samplerate, channels, dtype, callback, blocksize=0):
+        self.sink_name = sink_name
+        self.__samplerate = samplerate
+        self.__channels = channels
+        self.__dtype = dtype
+        self.__callback = callback
+        self.__blocksize = blocksize or 1024
+        self.__stop_event = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, name="fake device", daemon=True)
+        # Time, ring fill and RMS of every block pulled, the levels pick theirs by time
+        self.pulled_blocks = collections.deque(maxlen=100000)
+
+    def start(self):
+        self.__thread.start()
+
+    def close(self):
+        self.__stop_event.set()
+        self.__thread.join()
+
+    def __run(self):
+        # The sound server runs its clock at a real-time priority, without the capability it only gets a normal thread
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(DEVICE_PRIORITY))
+        except OSError:
+            pass
+        block_seconds = self.__blocksize / self.__samplerate
+        outdata = np.zeros((self.__blocksize, self.__channels), dtype=self.__dtype)
+        next_time = time.perf_counter()
+        while not self.__stop_event.is_set():
+            now = time.perf_counter()
+            status = types.SimpleNamespace(output_underflow=now - next_time > block_seconds)
+            time_info = types.SimpleNamespace(currentTime=now, outputBufferDacTime=now + block_seconds)
+            self.__callback(outdata, self.__blocksize, time_info, status)
+            rms = float(np.sqrt(np.mean(np.square(outdata, dtype=np.float64))))
+            self.pulled_blocks.append((now, METRICS.get("output_ring_fill_frames"), rms))
+            # After an underflow the device doesn't make up for the lost blocks
+            next_time = max(next_time + block_seconds, now)
+            self.__stop_event.wait(next_time - time.perf_counter())
+
+
+class FakeSoundDevice:
+    # As with PortAudio on the pulse plugin, a stream plays on the default sink of the moment it is opened
+    def __init__(self, pulse):
+        self.__pulse = pulse
+        self.streams = []
+
+    def OutputStream(self, samplerate, channels, dtype, callback, blocksize=0):
+        stream = FakeOutputStream(self.__pulse.server_info().default_sink_name, samplerate, channels, dtype, callback, blocksize)
+        self.streams.append(stream)
+        return stream
+
+
+class RecordedCamera:
+    # Plays a video file at its own frame rate, read() waits for the next frame like a camera and drops the ones it missed
+    def __init__(self, opencv, video_file_name):
+        capture = opencv.VideoCapture(video_file_name)
+        self.__fps = capture.get(opencv.CAP_PROP_FPS) or 30.0
+        self.__frames = []
+        while True:
+            ret, frame = capture.read()
+            if not ret:
+                break
+            self.__frames.append(frame)
+        capture.release()
+        if not self.__frames:
+            raise ValueError(f"No frames in {video_file_name}")
+        self.__start_time = time.perf_counter()
+        self.__last_frame_index = -1
+        self.last_frame_time = None
+
+    def set(self, property_id, value):
+        return True
+
+    def read(self):
+        frame_index = max(int((time.perf_counter() - self.__start_time) * self.__fps), self.__last_frame_index + 1)
+        frame_time = self.__start_time + frame_index / self.__fps
+        time.sleep(max(frame_time - time.perf_counter(), 0.0))
+        self.__last_frame_index = frame_index
+        self.last_frame_time = frame_time
+        return True, self.__frames[frame_index % len(self.__frames)].copy()
+
+    def release(self):
+        pass
+
+
+class RecordedOpenCV:
+    # cv2 for FaceTracker, with the camera replaced by the recording
+    def __init__(self, opencv, camera):
+        self.__opencv = opencv
+        self.__camera = camera
+
+    def VideoCapture(self, camera_index):
+        return self.__camera
+
+    def __getattr__(self, name):
+        return getattr(self.__opencv, name)
+
+
+class MeasuredFaceTracker:
+    # Remembers when the frame behind the current pose was taken, that is how stale the pose the renderer gets is
+    def __init__(self, tracker, camera):
+        self.__tracker = tracker
+        self.__camera = camera
+        self.pose_frame_time = None
+
+    def calculate_current_orientation(self):
+        rotation_matrix = self.__tracker.calculate_current_orientation()
+        self.pose_frame_time = self.__camera.last_frame_time
+        return rotation_matrix
+
+    def get_current_orientation(self, face_index=0):
+        return self.__tracker.get_current_orientation(face_index)
+
+    def cleanup(self):
+        self.__tracker.cleanup()
+
+
+class ReplayedFaceTracker:
+    # Recorded or swept head poses at a camera frame rate, with a CPU cost per frame in place of the inference
+    def __init__(self, recording_file_name, fps, inference_seconds, sweep_degrees=60.0, sweep_seconds=4.0):
+        self.__fps = fps
+        self.__inference_seconds = inference_seconds
+        self.__sweep_degrees = sweep_degrees
+        self.__sweep_seconds = sweep_seconds
+        self.__timestamps = None
+        if recording_file_name is not None:
+            self.__timestamps, self.__rotation_vectors = pose_filter.load_pose_recording(recording_file_name)
+            self.__timestamps = self.__timestamps - self.__timestamps[0]
+        self.__start_time = time.perf_counter()
+        self.__last_frame_index = -1
+        self.__rotation_matrix = DEFAULT_ROTATION_MATRIX
+        self.pose_frame_time = None
+
+    def __get_rotation_vector(self, pose_time):
+        if self.__timestamps is None:
+            return [0.0, math.radians(self.__sweep_degrees) * math.sin(2 * math.pi * pose_time / self.__sweep_seconds), 0.0]
+        index = min(np.searchsorted(self.__timestamps, pose_time % self.__timestamps[-1]), len(self.__rotation_vectors) - 1)
+        return self.__rotation_vectors[index]
+
+    def calculate_current_orientation(self):
+        frame_index = max(int((time.perf_counter() - self.__start_time) * self.__fps), self.__last_frame_index + 1)
+        frame_time = self.__start_time + frame_index / self.__fps
+        time.sleep(max(frame_time - time.perf_counter(), 0.0))
+        self.__last_frame_index = frame_index
+
+        busy_until = time.thread_time() + self.__inference_seconds
+        while time.thread_time() < busy_until:
+            pass
+        self.__rotation_matrix = DEFAULT_ROTATION_MATRIX @ pose_filter.rotation_vector_to_matrix(
+            self.__get_rotation_vector(frame_time - self.__start_time))
+        self.pose_frame_time = frame_time
+        return self.__rotation_matrix
+
+    def get_current_orientation(self, face_index=0):
+        return self.__rotation_matrix
+
+    def cleanup(self):
+        pass
+
+
+def run_cpu_pressure(stop_event):
+    value = 1.0
+    while not stop_event.is_set():
+        for _ in range(100000):
+            value = value * 1.0000001 % 7.0
+
+
+def run_memory_pressure(stop_event):
+    # Copies far larger than any cache, so every pass goes through the memory bus
+    source = np.ones(MEMORY_PRESSURE_BYTES // 8)
+    destination = np.empty_like(source)
+    while not stop_event.is_set():
+        np.copyto(destination, source)
+        np.copyto(source, destination)
+
+
+def run_scheduling_pressure(stop_event):
+    # Many threads that wake up all the time, the scheduler has to pick between them and the audio threads
+    def wake_up():
+        while not stop_event.is_set():
+            time.sleep(0.0001)
+            os.sched_yield()
+
+    threads = [threading.Thread(target=wake_up, daemon=True) for _ in range(SCHEDULING_PRESSURE_THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+PRESSURE_FUNCTIONS = {
+    "cpu": run_cpu_pressure,
+    "memory": run_memory_pressure,
+    "scheduling": run_scheduling_pressure
+}
+
+
+def run_pressure_worker(kind, stop_event, nice, cpus):
+    if nice:
+        os.nice(nice)
+    if cpus is not None:
+        os.sched_setaffinity(0, cpus)
+    PRESSURE_FUNCTIONS.get(kind)(stop_event)
+
+
+def start_pressure(level, kinds, nice, cpus):
+    # Forking a process full of audio threads could copy a held lock, the workers start from a clean interpreter
+    context = multiprocessing.get_context("spawn")
+    stop_event = context.Event()
+    workers = [context.Process(target=run_pressure_worker, args=(kind, stop_event, nice, cpus), daemon=True)
+               for kind in kinds for _ in range(level)]
+    for worker in workers:
+        worker.start()
+    return stop_event, workers
+
+
+def stop_pressure(stop_event, workers):
+    stop_event.set()
+    for worker in workers:
+        worker.join()
+
+
+def create_recorded_audio(channels_number, samplerate, seconds, seed=0):
+    noise = np.random.default_rng(seed).normal(0.0, 0.1, (int(samplerate * seconds), channels_number))
+    return (np.clip(noise, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def install_parec_shim(directory, samples, block_frames, samplerate):
+    capture_file_name = os.path.join(directory, "capture.npy")
+    np.save(capture_file_name, samples)
+    shim_file_name = os.path.join(directory, "parec")
+    with open(shim_file_name, "w", encoding="utf-8") as file:
+        file.write(PAREC_SHIM.format(python=sys.executable))
+    os.chmod(shim_file_name, 0o755)
+    os.environ.update({
+        "PATH": directory + os.pathsep + os.environ.get("PATH", ""),
+        "STRESS_CAPTURE_FILE": capture_file_name,
+        "STRESS_BLOCK_FRAMES": str(block_frames),
+        "STRESS_SAMPLERATE": str(samplerate)
+    })
+
+
+def get_metric_totals():
+    return {
+        "underruns": METRICS.get_total("output_underruns_total"),
+        "underrun_frames": METRICS.get_total("output_underrun_frames_total"),
+        "device_underflows": METRICS.get_total("output_device_underflows_total"),
+        "restarts": METRICS.get_total("openal_source_restarts_total"),
+        "stage_failures": METRICS.get_total("pipeline_stage_failures_total"),
+        "render_deadline_misses": METRICS.get_total("pipeline_deadline_misses_total", stage="render"),
+        "tracking_deadline_misses": METRICS.get_total("pipeline_deadline_misses_total", stage="tracking")
+    }
+
+
+def get_span_milliseconds(span_name, start_time, end_time):
+    return [(end_ns - start_ns) / 1e6 for start_ns, end_ns in TRACER.get_spans(span_name, int(start_time * 1e9), int(end_time * 1e9))]
+
+
+def get_pulled_blocks(output_stream, start_time, end_time):
+    return [(fill, rms) for pull_time, fill, rms in list(output_stream.pulled_blocks) if start_time <= pull_time < end_time]
+
+
+def get_distribution(values):
+    if not values:
+        return {"p50": float("nan"), "p99": float("nan"), "max": float("nan")}
+    return {"p50": float(np.percentile(values, 50)), "p99": float(np.percentile(values, 99)), "max": float(np.max(values))}
+
+
+def sample_pose_staleness(tracker, staleness, stop_event):
+    while not stop_event.wait(STALENESS_SAMPLE_SECONDS):
+        if tracker.pose_frame_time is not None:
+            staleness.append((time.perf_counter() - tracker.pose_frame_time) * 1000)
+
+
+def measure_level(level, args, tracker, output_stream, samplerate):
+    totals_before = get_metric_totals()
+    start_time = time.perf_counter()
+    staleness = []
+    staleness_stop_event = threading.Event()
+    staleness_thread = threading.Thread(target=sample_pose_staleness, args=(tracker, staleness, staleness_stop_event), daemon=True)
+
+    pressure_stop_event, workers = start_pressure(level, args.pressure, args.pressure_nice, args.pressure_cpus)
+    staleness_thread.start()
+    time.sleep(args.seconds_per_level)
+    staleness_stop_event.set()
+    staleness_thread.join()
+    stop_pressure(pressure_stop_event, workers)
+
+    end_time = time.perf_counter()
+    totals_after = get_metric_totals()
+    pulled_blocks = get_pulled_blocks(output_stream, start_time, end_time)
+    result = {name: totals_after.get(name) - totals_before.get(name) for name in totals_before}
+    result.update({
+        "level": level,
+        "pose_staleness_ms": get_distribution(staleness),
+        "processing_latency_ms": get_distribution(get_span_milliseconds("VirtualPlayer.handle_playing", start_time, end_time)),
+        "output_latency_ms": get_distribution([fill / samplerate * 1000 for fill, _ in pulled_blocks if fill is not None]),
+        # Underrun counts can't tell a working renderer from one that renders silence, the signal itself can
+        "output_rms": float(np.sqrt(np.mean([rms ** 2 for _, rms in pulled_blocks]))) if pulled_blocks else 0.0,
+        "silent_blocks": sum(1 for _, rms in pulled_blocks if rms < SILENCE_RMS),
+        "pulled_blocks": len(pulled_blocks)
+    })
+    return result
+
+
+def print_results(results):
+    print(f"{'level':>5} {'underruns':>9} {'underflows':>10} {'restarts':>8} {'render misses':>13} {'tracking misses':>15} "
+          f"{'staleness p50/p99 [ms]':>22} {'processing p50/p99 [ms]':>23} {'output p50/p99 [ms]':>19} {'rms':>6} {'silent':>11}")
+    for result in results:
+        staleness = result.get("pose_staleness_ms")
+        processing = result.get("processing_latency_ms")
+        output = result.get("output_latency_ms")
+        print(f"{result.get('level'):>5} {result.get('underruns'):>9} {result.get('device_underflows'):>10} "
+              f"{result.get('restarts') + result.get('stage_failures'):>8} {result.get('render_deadline_misses'):>13} "
+              f"{result.get('tracking_deadline_misses'):>15} "
+              f"{staleness.get('p50'):>10.1f} / {staleness.get('p99'):>9.1f} "
+              f"{processing.get('p50'):>11.2f} / {processing.get('p99'):>9.2f} "
+              f"{output.get('p50'):>9.1f} / {output.get('p99'):>7.1f} "
+              f"{result.get('output_rms'):>6.3f} {result.get('silent_blocks'):>5} / {result.get('pulled_blocks'):<5}")
+    for result in results:
+        if result.get("output_rms") < SILENCE_RMS:
+            print(f"Level {result.get('level')}: the headset only got silence, the run doesn't count however few underruns it had.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs VirtualPlayer and the face tracker from recordings, with fake audio devices, "
+                                                 "under rising CPU, memory bandwidth and scheduling pressure")
+    parser.add_argument("input", nargs="?", default=None, help="sound file played into the virtual device, noise without it")
+    parser.add_argument("--surround-system", choices=[surround_system for surround_system in settings.SURROUND_SYSTEM_DICT_SOUNDDEVICE_ORDER
+                                                      if surround_system != settings.OBJECTS_SURROUND_SYSTEM], default="LCR + Rear",
+                        help="layout of the generated noise")
+    parser.add_argument("--video", metavar="FILE", default=None,
+                        help="video of a face for the real FaceTracker (needs OpenCV and MediaPipe), replayed poses without it")
+    parser.add_argument("--poses", metavar="FILE", default=None, help="head poses saved with main.py --record-poses, a yaw sweep without it")
+    parser.add_argument("--tracker-fps", type=float, default=30.0, help="frame rate of the replayed poses")
+    parser.add_argument("--inference-ms", type=float, default=15.0, help="CPU time every replayed pose costs, in place of the inference")
+    parser.add_argument("--pressure", nargs="+", choices=PRESSURE_KINDS, default=PRESSURE_KINDS, help="kinds of pressure workers")
+    parser.add_argument("--levels", type=int, nargs="+", default=[0, 1, 2, 4, 8], help="workers of every kind at each level")
+    parser.add_argument("--seconds-per-level", type=float, default=20.0)
+    parser.add_argument("--warmup-seconds", type=float, default=3.0)
+    parser.add_argument("--pressure-nice", type=int, default=0, help="nice value of the pressure workers")
+    parser.add_argument("--pressure-cpus", type=realtime.parse_cpus, default=None, help="CPUs the pressure workers are pinned to")
+    parser.add_argument("--samplerate", type=int, default=44100)
+    parser.add_argument("--buffer-size", type=int, default=1024, help="frames per block, as in VirtualPlayer")
+    parser.add_argument("--buffers-number", type=int, default=5, help="buffer depth of the player, as in its performance profile")
+    parser.add_argument("--renderer", choices=vp.RENDERERS, default="hrtf")
+    parser.add_argument("--report", metavar="FILE", default=None, help="saves the results as JSON, to compare pipeline changes")
+    args = parser.parse_args()
+
+    if args.input is None:
+        samplerate = args.samplerate
+        samples = create_recorded_audio(settings.get_channels_number(args.surround_system), samplerate, 10.0)
+    else:
+        samples, samplerate = soundfile.read(args.input, dtype="int16", always_2d=True)
+
+    if args.video is not None:
+        opencv = face_tracker.import_opencv()
+        camera = RecordedCamera(opencv, args.video)
+        face_tracker.cv2 = RecordedOpenCV(opencv, camera)
+        camera_tracker = face_tracker.FaceTracker(width=320, height=240)
+        camera_tracker.initialize()
+        tracker = MeasuredFaceTracker(camera_tracker, camera)
+    else:
+        tracker = ReplayedFaceTracker(args.poses, args.tracker_fps, args.inference_ms / 1000)
+
+    # The devices are faked at the edges only, capture, tracking, rendering and the ring buffer are the real ones
+    pulse = FakePulse(FAKE_HEADSET_NAME)
+    sound_device = FakeSoundDevice(pulse)
+    vp.sd = sound_device
+    portaudio_output.sd = sound_device
+    TRACER.enable()
+
+    with tempfile.TemporaryDirectory() as directory:
+        install_parec_shim(directory, samples, args.buffer_size, samplerate)
+        player = vp.VirtualPlayer(pulse=pulse, pulse_events=FakePulseEvents(pulse), face_tracker=tracker, headset_name=FAKE_HEADSET_NAME,
+                                  media_name="Playback Stream", channels_number=samples.shape[1],
+                                  speakers_parameters=settings.get_default_settings().get("speakers_parameters"),
+                                  sink_name=settings.SINK_NAME, samplerate=samplerate, buffer_size=args.buffer_size,
+                                  buffers_number=args.buffers_number, state_file_name=os.path.join(directory, vp.STATE_FILE_NAME),
+                                  output_backend="portaudio", renderer=args.renderer)
+        player.start_playing()
+        # The other stream keeps the virtual device awake
+        output_stream = next(stream for stream in sound_device.streams if stream.sink_name == FAKE_HEADSET_NAME)
+        time.sleep(args.warmup_seconds)
+
+        results = []
+        for level in args.levels:
+            print(f"Level {level}: {level} {', '.join(args.pressure)} workers each for {args.seconds_per_level:.0f} s")
+            results.append(measure_level(level, args, tracker, output_stream, samplerate))
+        player.stop()
+        tracker.cleanup()
+
+    print_results(results)
+    if args.report is not None:
+        with open(args.report, "w", encoding="utf-8") as file:
+            json.dump({"arguments": {key: value if not isinstance(value, set) else sorted(value) for key, value in vars(args).items()},
+                       "results": results}, file, indent=4)
+        print(f"Stress test report has been saved to: {args.report}.")
+
+
+if __name__ == "__main__":
+    main()
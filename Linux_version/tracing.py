@@ -0,0 +1,88 @@
+import contextlib
+import collections
+import functools
+import threading
+import json
+import time
+import os
+
+TRACE_CAPACITY = 200000
+
+
+class Tracer:
+    def __init__(self, capacity=TRACE_CAPACITY):
+        self.enabled = False
+        self.__start_ns = time.perf_counter_ns()
+        # deque.append is atomic, so the hot paths record spans without taking a lock
+        self.__spans = collections.deque(maxlen=capacity)
+        self.__thread_names = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def record(self, name, start_ns, end_ns):
+        thread_id = threading.get_ident()
+        if thread_id not in self.__thread_names:
+            self.__thread_names[thread_id] = threading.current_thread().name
+        self.__spans.append((name, thread_id, start_ns, end_ns))
+
+    @contextlib.contextmanager
+    def span(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        start_ns = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, start_ns, time.perf_counter_ns())
+
+    def get_spans(self, name, start_ns=0, end_ns=None):
+        # Spans of one name that started in a time window, on the perf_counter_ns clock. The oldest spans are gone once the deque is full
+        return [(span_start_ns, span_end_ns) for span_name, _, span_start_ns, span_end_ns in list(self.__spans)
+                if span_name == name and span_start_ns >= start_ns and (end_ns is None or span_start_ns < end_ns)]
+
+    def get_chrome_trace(self):
+        process_id = os.getpid()
+        events = [{"name": "thread_name", "ph": "M", "pid": process_id, "tid": thread_id, "args": {"name": thread_name}}
+                  for thread_id, thread_name in list(self.__thread_names.items())]
+
+        for name, thread_id, start_ns, end_ns in list(self.__spans):
+            events.append({
+                "name": name,
+                "ph": "X",
+                "pid": process_id,
+                "tid": thread_id,
+                "ts": (start_ns - self.__start_ns) / 1000,
+                "dur": (end_ns - start_ns) / 1000
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, file_name):
+        # Opens in chrome://tracing, Perfetto and speedscope
+        with open(file_name, "w", encoding="utf-8") as file:
+            json.dump(self.get_chrome_trace(), file)
+        print(f"Trace has been saved to: {file_name}.")
+
+
+TRACER = Tracer()
+
+
+def traced(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return function(*args, **kwargs)
+
+            start_ns = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                TRACER.record(name, start_ns, time.perf_counter_ns())
+        return wrapper
+    return decorator
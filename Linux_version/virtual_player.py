@@ -1,19 +1,341 @@
+import sounddevice as sd
 import numpy as np
+import collections
+import asyncio
 import subprocess
 import threading
 import ctypes
+import soundfile
 import openal
+import json
 import time
 import math
+import re
+import os
+
+import portaudio_output
+import parametric_spatializer
+import bass_management
+import room_reverb
+import object_capture
+import realtime
+from pipeline import Pipeline
+from metrics import METRICS, RateGauge
+from tracing import TRACER, traced
+
+STATE_FILE_NAME = "Virtual_Surround_state.json"
+POSE_UPDATE_RATE = 25
+OUTPUT_BACKENDS = ["openal", "portaudio"]
+# hrtf renders the main listener with OpenAL Soft, parametric with a spherical head model that costs far less CPU
+RENDERERS = ["hrtf", "parametric"]
+# Blocks read ahead of the renderer, and rendered blocks waiting for room in the output ring buffer
+CAPTURE_QUEUE_BLOCKS = 2
+RENDERED_QUEUE_BLOCKS = 1
+LOOPBACK_BUFFERS_NUMBER = 2
+# Name of a source slot that no stream plays on, it stays silent until a new name takes it
+FREE_SOURCE_NAME = ""
+
+PULSE_SPEAKER_NAME_TO_MY_DICT = {
+    "front-left": "Front left",
+    "front-right": "Front right",
+    "front-center": "Front center",
+    "rear-left": "Rear left",
+    "rear-right": "Rear right",
+    "lfe": "LFE"
+}
+
+PULSE_AUDIO_CHANNEL_MAPS = {
+    2: ["front-left", "front-right"],
+    3: ["front-left", "front-right", "front-center"],
+    5: ["front-left", "front-right", "front-center", "rear-left", "rear-right"],
+    6: ["front-left", "front-right", "front-center", "lfe", "rear-left", "rear-right"]
+}
+
+# ALC_SOFT_loopback and ALC_SOFT_HRTF, PyOpenAL doesn't define them
+ALC_FORMAT_CHANNELS_SOFT = 0x1990
+ALC_FORMAT_TYPE_SOFT = 0x1991
+ALC_HRTF_SOFT = 0x1992
+ALC_STEREO_SOFT = 0x1501
+ALC_FLOAT_SOFT = 0x1406
+
+
+def get_pulse_channel_order_list(channels_number):
+    return [PULSE_SPEAKER_NAME_TO_MY_DICT.get(speaker_name) for speaker_name in PULSE_AUDIO_CHANNEL_MAPS.get(channels_number)]
+
+
+def get_speaker_position(angle, distance):
+    x = distance * math.sin(math.radians(angle))
+    y = 0.0
+    z = - distance * math.cos(math.radians(angle))
+    return x, y, z
+
+
+def get_loopback_functions():
+    if not openal.alcIsExtensionPresent(None, b"ALC_SOFT_loopback"):
+        raise RuntimeError("Loopback rendering needs OpenAL Soft with the ALC_SOFT_loopback extension")
+    open_device = ctypes.CFUNCTYPE(ctypes.c_void_p, ctypes.c_char_p)(
+        openal.alcGetProcAddress(None, b"alcLoopbackOpenDeviceSOFT"))
+    render_samples = ctypes.CFUNCTYPE(None, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int)(
+        openal.alcGetProcAddress(None, b"alcRenderSamplesSOFT"))
+    return open_device, render_samples
+
+
+def slerp_vector(start, end, fraction):
+    angle = math.acos(min(max(np.dot(start, end), -1.0), 1.0))
+    if math.sin(angle) < 1e-6:
+        return end
+    return (math.sin((1.0 - fraction) * angle) * start + math.sin(fraction * angle) * end) / math.sin(angle)
+
+
+def interpolate_listener_orientation(start, end, fraction):
+    # Rows are slerped one by one, which also works for the mirrored matrices of a calibrated camera
+    at = slerp_vector(start[2], end[2], fraction)
+    up = slerp_vector(start[1], end[1], fraction)
+    up = up - np.dot(up, at) * at
+    return np.array([slerp_vector(start[0], end[0], fraction), up / np.linalg.norm(up), at])
+
+
+def parse_module_arguments(argument):
+    return dict(item.split("=", 1) for item in (argument or "").split() if "=" in item)
+
+
+def is_virtual_sink_name(name, sink_name):
+    # Only the sinks a player loads, f"{sink_name}_{n}ch", another null sink with the same prefix is left alone
+    return re.fullmatch(rf"{re.escape(sink_name)}_\d+ch", name or "") is not None
+
+
+def find_virtual_sink_modules(pulse, sink_name):
+    modules = []
+    for module in pulse.module_list():
+        arguments = parse_module_arguments(module.argument)
+        if module.name == "module-null-sink" and is_virtual_sink_name(arguments.get("sink_name"), sink_name):
+            modules.append((module, arguments))
+    return modules
+
+
+def load_player_state(state_file_name=STATE_FILE_NAME):
+    if os.path.exists(state_file_name):
+        try:
+            with open(state_file_name, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except json.JSONDecodeError:
+            return {}
+    return {}
 
 
-class VirtualPlayer:
-    def __init__(self, pulse, face_tracker, headset_name, media_name, channels_number, speakers_parameters, sink_name, samplerate=44100, dtype=np.int16, buffer_size=1024, buffers_number=5):
+def save_player_state(state, state_file_name=STATE_FILE_NAME):
+    with open(state_file_name, "w", encoding="utf-8") as file:
+        json.dump(state, file, indent=4)
+
+
+def remove_player_state(state_file_name=STATE_FILE_NAME):
+    if os.path.exists(state_file_name):
+        os.remove(state_file_name)
+
+
+def get_saved_headset_name(state_file_name=STATE_FILE_NAME):
+    # The headset of a player that crashed, until the next player restores it its virtual sink may still be the default
+    return load_player_state(state_file_name).get("headset_name")
+
+
+def restore_orphaned_virtual_sinks(pulse, sink_name, state_file_name=STATE_FILE_NAME):
+    # Undoes what a crashed player left behind, the sinks themselves stay loaded so the next player can adopt them
+    state = load_player_state(state_file_name)
+    orphaned_modules = find_virtual_sink_modules(pulse, sink_name)
+    if not orphaned_modules:
+        remove_player_state(state_file_name)
+        return
+
+    sinks = pulse.sink_list()
+    headset_sink = next((sink for sink in sinks if sink.name == state.get("headset_name")), None)
+    virtual_sinks = [sink for sink in sinks if is_virtual_sink_name(sink.name, sink_name)]
+
+    if headset_sink is not None:
+        for module, arguments in orphaned_modules:
+            virtual_sink = next((sink for sink in virtual_sinks if sink.name == arguments.get("sink_name")), None)
+            if module.index == state.get("module_id") and virtual_sink is not None:
+                pulse.volume_set_all_chans(headset_sink, virtual_sink.volume.value_flat)
+
+        if is_virtual_sink_name(pulse.server_info().default_sink_name, sink_name):
+            pulse.default_set(headset_sink)
+
+
+class OpenALListener:
+    # One OpenAL device and context per headset, every call first makes its context current
+    def __init__(self, name, samplerate, dtype, buffer_size, buffers_number, loopback=False):
+        self.__name = name
+        self.__samplerate = samplerate
+        self.__dtype = dtype
+        self.__buffer_size = buffer_size
+        self.__buffers_number = buffers_number
+
+        self.__oal_virtual_speakers = []
+        self.__oal_buffers = []
+        # Loopback sources only: the buffer of every source that the next block goes into
+        self.__oal_spare_buffers = []
+
+        self.__render_samples = None
+        if loopback:
+            # No device behind it, render() pulls the mixed binaural frames instead
+            open_loopback_device, self.__render_samples = get_loopback_functions()
+            self.__oal_device = open_loopback_device(None)
+            attributes = (ctypes.c_int * 9)(openal.ALC_FREQUENCY, samplerate, ALC_FORMAT_CHANNELS_SOFT, ALC_STEREO_SOFT,
+                                            ALC_FORMAT_TYPE_SOFT, ALC_FLOAT_SOFT, ALC_HRTF_SOFT, openal.ALC_TRUE, 0)
+            self.__oal_context = openal.alcCreateContext(self.__oal_device, attributes)
+        else:
+            self.__oal_device = openal.alcOpenDevice(None)
+            self.__oal_context = openal.alcCreateContext(self.__oal_device, None)
+        openal.alcMakeContextCurrent(self.__oal_context)
+        openal.alDistanceModel(openal.AL_INVERSE_DISTANCE_CLAMPED)
+
+        listener_position = (ctypes.c_float * 3)(0.0, 0.0, 0.0)
+        openal.alListenerfv(openal.AL_POSITION, listener_position)
+
+    def is_loopback(self):
+        return self.__render_samples is not None
+
+    def __make_current(self):
+        openal.alcMakeContextCurrent(self.__oal_context)
+
+    def add_virtual_speakers(self, count, play=False):
+        self.__make_current()
+        new_speakers = (openal.ALuint * count)()
+        openal.alGenSources(count, new_speakers)
 
-        self.__default_device_stimulant_process = subprocess.Popen(["python3", "default_device_stimulant.py"])
+        empty_data = np.zeros(self.__buffer_size, dtype=self.__dtype)
+        for speaker in new_speakers:
+            buf = (openal.ALuint * self.__buffers_number)()
+            openal.alGenBuffers(self.__buffers_number, buf)
+            for i in range(self.__buffers_number):
+                openal.alBufferData(buf[i], openal.AL_FORMAT_MONO16, empty_data.tobytes(), empty_data.nbytes, self.__samplerate)
+
+            if self.is_loopback():
+                # One block of silence to render while the first real block is queued behind it, the other buffer is spare
+                openal.alSourceQueueBuffers(speaker, 1, buf)
+                self.__oal_spare_buffers.append(openal.ALuint(buf[1]))
+            else:
+                openal.alSourceQueueBuffers(speaker, self.__buffers_number, buf)
+            if play:
+                openal.alSourcePlay(speaker)
+
+            self.__oal_virtual_speakers.append(speaker)
+            self.__oal_buffers.append(buf)
+
+    def remove_virtual_speakers(self, count):
+        self.__make_current()
+        removed_speakers = self.__oal_virtual_speakers[-count:]
+        removed_buffers = self.__oal_buffers[-count:]
+        del self.__oal_virtual_speakers[-count:]
+        del self.__oal_buffers[-count:]
+        del self.__oal_spare_buffers[-count:]
+
+        for speaker in removed_speakers:
+            openal.alSourceStop(speaker)
+        openal.alDeleteSources(count, (openal.ALuint * count)(*removed_speakers))
+        for buf in removed_buffers:
+            openal.alDeleteBuffers(self.__buffers_number, buf)
+
+    def reset_virtual_speakers(self, indexes, play=False):
+        # A source handed over to another stream drops the blocks still queued for the previous one
+        self.__make_current()
+        empty_data = np.zeros(self.__buffer_size, dtype=self.__dtype)
+        for index in indexes:
+            speaker, buf = self.__oal_virtual_speakers[index], self.__oal_buffers[index]
+            # A stopped source lets go of its whole queue at once
+            openal.alSourceStop(speaker)
+            openal.alSourcei(speaker, openal.AL_BUFFER, 0)
+            for i in range(self.__buffers_number):
+                openal.alBufferData(buf[i], openal.AL_FORMAT_MONO16, empty_data.tobytes(), empty_data.nbytes, self.__samplerate)
+
+            if self.is_loopback():
+                openal.alSourceQueueBuffers(speaker, 1, buf)
+                self.__oal_spare_buffers[index] = openal.ALuint(buf[1])
+            else:
+                openal.alSourceQueueBuffers(speaker, self.__buffers_number, buf)
+            if play:
+                openal.alSourcePlay(speaker)
+
+    def set_speakers_parameters(self, speakers_gains_and_positions):
+        self.__make_current()
+        for speaker, (gain, position) in zip(self.__oal_virtual_speakers, speakers_gains_and_positions):
+            # Without a position the source stays in front of the head, wherever it turns
+            openal.alSourcei(speaker, openal.AL_SOURCE_RELATIVE, openal.AL_FALSE if position else openal.AL_TRUE)
+            openal.alSourcefv(speaker, openal.AL_GAIN, ctypes.c_float(gain))
+            openal.alSourcefv(speaker, openal.AL_POSITION, (ctypes.c_float * 3)(*(position or (0.0, 0.0, -1.0))))
+
+    def set_orientation(self, listener_orientation):
+        self.__make_current()
+        combined_vec = np.concatenate((listener_orientation[2], listener_orientation[1]))
+        openal.alListenerfv(openal.AL_ORIENTATION, (ctypes.c_float * 6)(*combined_vec))
+
+    def play(self):
+        self.__make_current()
+        for speaker in self.__oal_virtual_speakers:
+            openal.alSourcePlay(speaker)
+
+    def queue_block(self, channels_data, speaker_names):
+        self.__make_current()
+        if self.is_loopback():
+            # Lockstep, no polling: every source holds the block render() plays next, the new one goes behind it
+            for speaker, channel_data, buf in zip(self.__oal_virtual_speakers, channels_data, self.__oal_spare_buffers):
+                openal.alBufferData(buf, openal.AL_FORMAT_MONO16, channel_data.tobytes(), channel_data.nbytes, self.__samplerate)
+                openal.alSourceQueueBuffers(speaker, 1, buf)
+            return
+
+        for speaker, channel_data, speaker_name in zip(self.__oal_virtual_speakers, channels_data, speaker_names):
+            processed = openal.ALint()
+            openal.alGetSourcei(speaker, openal.AL_BUFFERS_PROCESSED, processed)
+            METRICS.set_gauge("openal_queue_depth", self.__buffers_number - processed.value, source=speaker_name, listener=self.__name)
+            if processed.value >= self.__buffers_number:
+                METRICS.increment("openal_buffer_underruns_total", source=speaker_name, listener=self.__name)
+
+            if processed.value == 0:
+                METRICS.increment("openal_dropped_blocks_total", source=speaker_name, listener=self.__name)
+            else:
+                buf_to_refill = openal.ALuint()
+                openal.alSourceUnqueueBuffers(speaker, 1, buf_to_refill)
+
+                openal.alBufferData(buf_to_refill, openal.AL_FORMAT_MONO16, channel_data.tobytes(), channel_data.nbytes,
+                                    self.__samplerate)
+                openal.alSourceQueueBuffers(speaker, 1, buf_to_refill)
+
+            # Sometimes SourcePlayer needs to be restarted
+            state = openal.ALint()
+            openal.alGetSourcei(speaker, openal.AL_SOURCE_STATE, state)
+            if state.value not in [openal.AL_PLAYING, openal.AL_PAUSED]:
+                METRICS.increment("openal_source_restarts_total", source=speaker_name, listener=self.__name)
+                openal.alSourcePlay(speaker)
+
+    def render(self, frames):
+        # Plays out exactly the older of the two queued blocks, the source keeps playing the newer one
+        self.__make_current()
+        output = np.empty((frames, 2), dtype=np.float32)
+        self.__render_samples(self.__oal_device, output.ctypes.data, frames)
+        for speaker, buf in zip(self.__oal_virtual_speakers, self.__oal_spare_buffers):
+            openal.alSourceUnqueueBuffers(speaker, 1, buf)
+        return output
+
+    def close(self):
+        self.__make_current()
+        count = len(self.__oal_virtual_speakers)
+        openal.alDeleteSources(count, (openal.ALuint * count)(*self.__oal_virtual_speakers))
+        for buf in self.__oal_buffers:
+            openal.alDeleteBuffers(self.__buffers_number, buf)
+        openal.alcMakeContextCurrent(None)
+        openal.alcDestroyContext(self.__oal_context)
+        openal.alcCloseDevice(self.__oal_device)
+
+
+class VirtualPlayer:
+    def __init__(self, pulse, pulse_events, face_tracker, headset_name, media_name, channels_number, speakers_parameters, sink_name, samplerate=44100, dtype=np.int16, buffer_size=1024, buffers_number=5, state_file_name=STATE_FILE_NAME,
+                 listener_headset_names=(), pose_update_rate=POSE_UPDATE_RATE, loopback_file=None,
+                 output_backend="openal", drift_compensation=True, renderer="hrtf", bass_crossover=None,
+                 room_level=None, room_decay=room_reverb.ROOM_DECAY_SECONDS, objects=False):
 
         self.__face_tracker = face_tracker
         self.__headset_name = headset_name
+        # Extra listeners, face n + 1 of the tracker hears the sound on listener_headset_names[n]
+        self.__listener_headset_names = list(listener_headset_names)
         self.__media_name = media_name
         self.__speakers_parameters = speakers_parameters
 
@@ -23,233 +345,592 @@ class VirtualPlayer:
         self.__samplerate = samplerate
         self.__dtype = dtype
         self.__buffer_size = buffer_size
-        self.__pipe_bufsize = self.__buffer_size * np.dtype(self.__dtype).itemsize * self.__channels_number
+        self.__pipe_bufsize = self.__get_pipe_bufsize(self.__channels_number)
 
         self.__buffers_number = buffers_number
+        self.__pose_interval = 1.0 / pose_update_rate
+        self.__applied_speakers_parameters = None
 
+        # Guards everything that reconfigure() swaps while the threads are running
+        self.__pipeline_lock = threading.RLock()
 
         self.__pulse = pulse
+        self.__pulse_events = pulse_events
+        restore_orphaned_virtual_sinks(self.__pulse, sink_name, state_file_name)
         self.__headset_sink = self.__pulse.get_sink_by_name(self.__headset_name)
 
-        self.__pulse_speaker_name_to_my_dict = {
-            "front-left": "Front left",
-            "front-right": "Front right",
-            "front-center": "Front center",
-            "rear-left": "Rear left",
-            "rear-right": "Rear right"
-        }
-
-        self.__pulse_audio_channel_maps = {
-            2: ["front-left", "front-right"],
-            3: ["front-left", "front-right", "front-center"],
-            5: ["front-left", "front-right", "front-center", "rear-left", "rear-right"]
-        }
-
-        self.__pulse_channel_order_list = [self.__pulse_speaker_name_to_my_dict.get(speaker_name) for speaker_name in self.__pulse_audio_channel_maps.get(self.__channels_number)]
-        self.__oal_device = None
-        self.__oal_context = None
-        self.__oal_virtual_speakers = None
-        self.__oal_buffers = None
+        self.__pulse_channel_order_list = self.__get_pulse_channel_order_list(self.__channels_number)
+        # The channels the renderer gets: the speakers of the layout, or in object mode the applications that are playing
+        self.__object_mixer = None
+        self.__channel_names = [] if objects else self.__pulse_channel_order_list
+        # With a crossover frequency or an LFE channel the lows go to one mono source, the rest to one source per speaker
+        self.__bass_crossover = bass_crossover
+        self.__bass_manager = self.__create_bass_manager(self.__channel_names)
+        # With a room level one shared reverb adds a few room sources, however many speakers there are
+        self.__room_level = room_level
+        self.__room_decay = room_decay
+        self.__room_reverb = self.__create_room_reverb(self.__channel_names)
+        self.__source_names = self.__get_source_names()
+        # The source of every listener that each source name plays on, a name keeps its source for as long as it exists
+        self.__source_slots = list(self.__source_names)
+        self.__listeners = []
+        self.__listener_sink_inputs = []
+        # With a loopback file the main listener renders into the file instead of the headset
+        self.__loopback_file = loopback_file
+        self.__loopback_output = None
+        # With the portaudio backend the main listener renders through loopback too and a device callback pulls the frames
+        self.__output_backend = output_backend
+        # The parametric renderer has no OpenAL device of its own, without a loopback file it always plays through portaudio
+        self.__renderer = renderer
+        if self.__renderer == "parametric" and self.__loopback_file is None:
+            self.__output_backend = "portaudio"
+        self.__drift_compensation = drift_compensation
+        self.__portaudio_output = None
+        self.__output_sink_inputs = []
+        self.__rendered_block = None
+        # Sources added once the listeners play have to be started on their own
+        self.__playing = False
         self.__init_openal()
 
         self.__sink_name = sink_name
+        self.__state_file_name = state_file_name
+        self.__virtual_sink_name = None
         self.__process = None
         self.__module_id = None
+        self.__keepalive_stream = None
         self.__create_virtual_device()
+        if objects:
+            self.__object_mixer = self.__create_object_mixer()
 
         self.__listener_orientation = np.array([
                                         np.array([1.0, 0.0, 0.0]),
                                         np.array([0.0, -1.0, 0.0]),
                                         np.array([0.0, 0.0, -1.0])])
+        # The last two tracker poses of every listener, the renderer interpolates between them on each block
+        self.__listeners_poses = [collections.deque([(0.0, self.__listener_orientation)], maxlen=2) for _ in self.__listeners]
+
+        self.__listener_rate_gauge = RateGauge(METRICS, "listener_updates_per_second")
+
+        # Capture, tracking, rendering and output are stages of one pipeline, each blocking call runs on the executor of its kind
+        self.__pipeline = Pipeline("player")
+        self.__pipeline.add_executor("capture", "audio")
+        self.__pipeline.add_executor("audio", "audio")
+        self.__pipeline.add_executor("output", "audio")
+        self.__pipeline.add_executor("tracker", "tracker")
+        self.__pipeline.add_stage("tracking", self.__track_listeners)
+        self.__pipeline.start()
+
+    def __get_pipe_bufsize(self, channels_number):
+        return self.__buffer_size * np.dtype(self.__dtype).itemsize * channels_number
+
+    def __get_pulse_channel_order_list(self, channels_number):
+        return get_pulse_channel_order_list(channels_number)
+
+    def __create_bass_manager(self, speaker_names):
+        if not speaker_names or self.__bass_crossover is None and bass_management.LFE_SPEAKER_NAME not in speaker_names:
+            return None
+        return bass_management.BassManager(self.__samplerate, speaker_names, self.__dtype, crossover_hz=self.__bass_crossover)
+
+    def __create_room_reverb(self, speaker_names):
+        if not speaker_names or self.__room_level is None:
+            return None
+        return room_reverb.RoomReverb(self.__samplerate, speaker_names, self.__dtype, decay_seconds=self.__room_decay)
+
+    def __get_source_names(self):
+        if self.__bass_manager is None:
+            source_names = list(self.__channel_names)
+        else:
+            source_names = list(self.__bass_manager.get_source_names())
+        if self.__room_reverb is not None:
+            source_names += self.__room_reverb.get_source_names()
+        return source_names
+
+    def __create_object_mixer(self):
+        object_mixer = object_capture.ObjectMixer(self.__pulse_events, self.__samplerate, self.__dtype)
+        object_mixer.set_sink_index(self.__pulse.get_sink_by_name(self.__virtual_sink_name).index)
+        return object_mixer
+
+    def __get_source_slots(self):
+        # Gone names free their slots, new names take free slots before the list grows, so no queued block
+        # ever plays on the source of another name
+        source_names = set(self.__source_names)
+        source_slots = [name if name in source_names else FREE_SOURCE_NAME for name in self.__source_slots]
+        reused_slots = []
+        for name in self.__source_names:
+            if name in source_slots:
+                continue
+            if FREE_SOURCE_NAME in source_slots:
+                reused_slots.append(source_slots.index(FREE_SOURCE_NAME))
+                source_slots[reused_slots[-1]] = name
+            else:
+                source_slots.append(name)
+        while source_slots and source_slots[-1] == FREE_SOURCE_NAME:
+            source_slots.pop()
+        return source_slots, reused_slots
+
+    def __set_channel_names(self, channel_names):
+        slots_number = len(self.__source_slots)
+        self.__channel_names = channel_names
+        self.__bass_manager = self.__create_bass_manager(channel_names)
+        self.__room_reverb = self.__create_room_reverb(channel_names)
+        self.__source_names = self.__get_source_names()
+        self.__source_slots, reused_slots = self.__get_source_slots()
+
+        for listener in self.__listeners:
+            if len(self.__source_slots) > slots_number:
+                listener.add_virtual_speakers(len(self.__source_slots) - slots_number, play=self.__playing)
+            elif len(self.__source_slots) < slots_number:
+                listener.remove_virtual_speakers(slots_number - len(self.__source_slots))
+            if reused_slots:
+                listener.reset_virtual_speakers(reused_slots, play=self.__playing)
+        self.__set_speakers_parameters()
 
-
-        self.__stop_event = threading.Event()
-
-        self.__orientation_thread = threading.Thread(target=self.__update_listener_and_speakers, daemon=True)
-        self.__orientation_thread.start()
-
-        self.__play_sound_thread = threading.Thread(target=self.__play_sound, daemon=True)
+    def __get_slots_data(self, channels_data, frames):
+        if self.__source_slots == self.__source_names:
+            return channels_data
+        sources_data = dict(zip(self.__source_names, channels_data))
+        silence = np.zeros(frames, dtype=self.__dtype)
+        return [sources_data.get(name, silence) for name in self.__source_slots]
+
+    def __get_channel_parameters(self, channel_name):
+        # In object mode the channels are applications, their parameters live in the object mixer
+        if self.__object_mixer is not None:
+            return self.__object_mixer.get_object_parameters(channel_name)
+        return self.__speakers_parameters.get(channel_name)
+
+    def get_objects_parameters(self):
+        # The applications that have a source, in the order of their channels
+        with self.__pipeline_lock:
+            if self.__object_mixer is None:
+                return {}
+            return {name: self.__object_mixer.get_object_parameters(name) for name in self.__channel_names}
+
+    def set_object_parameters(self, object_name, parameters):
+        with self.__pipeline_lock:
+            if self.__object_mixer is None:
+                raise ValueError("The player is not in the Objects mode")
+            self.__object_mixer.set_object_parameters(object_name, parameters)
+
+    def __get_virtual_sink_name(self, channels_number):
+        # Every layout gets its own sink name, so the new sink can be loaded before the old one is unloaded
+        return f"{self.__sink_name}_{channels_number}ch"
 
     def __get_speaker_position(self, speaker_name, distance):
-        angle = self.__speakers_parameters.get(speaker_name).get("angle")
-        x = distance * math.sin(math.radians(angle))
-        y = 0.0
-        z = - distance * math.cos(math.radians(angle))
-        return x, y, z
+        return get_speaker_position(self.__get_channel_parameters(speaker_name).get("angle"), distance)
 
-    def __init_openal(self):
+    def __create_listener(self, name, headset_sink, loopback=False):
         # I don't know why but this step helps to switch headset device for OpenAL
+        if not loopback:
+            self.__pulse.default_set(headset_sink)
+
+        # Loopback sources are rendered in lockstep with the capture, one block behind it: with nothing queued after
+        # the block being rendered OpenAL Soft would stop the source
+        buffers_number = LOOPBACK_BUFFERS_NUMBER if loopback else self.__buffers_number
+        if loopback and self.__renderer == "parametric":
+            listener = parametric_spatializer.ParametricSpatializer(name, self.__samplerate, self.__dtype, self.__buffer_size)
+        else:
+            listener = OpenALListener(name, self.__samplerate, self.__dtype, self.__buffer_size, buffers_number, loopback=loopback)
+        listener.add_virtual_speakers(len(self.__source_slots))
+        self.__listeners.append(listener)
+        return listener
+
+    def __find_new_own_sink_inputs(self, known_sink_input_indexes):
+        process_id = str(os.getpid())
+        return [sink_input.index for sink_input in self.__pulse.sink_input_list()
+                if sink_input.index not in known_sink_input_indexes and sink_input.proplist.get("application.process.id") == process_id]
+
+    def __pin_new_own_sink_inputs(self, open_stream, headset_name):
+        # Streams that don't carry the media name are pinned to their headset by sink input index
+        known_sink_input_indexes = {sink_input.index for sink_input in self.__pulse.sink_input_list()}
+        open_stream()
+        sink_input_indexes = self.__find_new_own_sink_inputs(known_sink_input_indexes)
+        for sink_input_index in sink_input_indexes:
+            self.__pulse_events.set_sink_input_route(sink_input_index, headset_name)
+        return sink_input_indexes
+
+    def __open_portaudio_output(self):
         self.__pulse.default_set(self.__headset_sink)
+        # The ring holds twice the OpenAL queue of the openal backend and starts once it holds about the same latency,
+        # the OpenAL loopback listener adds one block to it
+        self.__portaudio_output = portaudio_output.PortAudioOutput(self.__samplerate, self.__buffer_size,
+                                                                   ring_blocks=2 * self.__buffers_number,
+                                                                   prefill_blocks=max(self.__buffers_number - 1, 1),
+                                                                   drift_compensation=self.__drift_compensation)
+        self.__portaudio_output.start()
 
-
-        # OpenAL
-        self.__oal_device = openal.alcOpenDevice(None)
-        self.__oal_context = openal.alcCreateContext(self.__oal_device, None)
-        openal.alcMakeContextCurrent(self.__oal_context)
-        openal.alDistanceModel(openal.AL_INVERSE_DISTANCE_CLAMPED)
-
-        listener_position = (ctypes.c_float * 3)(0.0, 0.0, 0.0)
-        openal.alListenerfv(openal.AL_POSITION, listener_position)
-
-        self.__oal_virtual_speakers = (openal.ALuint * self.__channels_number)()
-        openal.alGenSources(self.__channels_number, self.__oal_virtual_speakers)
+    def __init_openal(self):
+        loopback = self.__loopback_file is not None or self.__output_backend == "portaudio"
+        # Only the main listener gets the parametric renderer, the extra ones keep their own OpenAL devices
+        self.__create_listener("0", self.__headset_sink, loopback=loopback)
+        if self.__loopback_file is not None:
+            self.__loopback_output = soundfile.SoundFile(self.__loopback_file, "w", samplerate=self.__samplerate, channels=2, subtype="FLOAT")
+        if self.__output_backend == "portaudio":
+            self.__output_sink_inputs = self.__pin_new_own_sink_inputs(self.__open_portaudio_output, self.__headset_name)
+
+        # Every extra listener's stream shares the media name, so it is pinned to its headset by sink input index
+        for i, headset_name in enumerate(self.__listener_headset_names):
+            headset_sink = self.__pulse.get_sink_by_name(headset_name)
+            self.__listener_sink_inputs += self.__pin_new_own_sink_inputs(
+                lambda: self.__create_listener(str(i + 1), headset_sink), headset_name)
 
         self.__set_speakers_parameters()
 
-        self.__oal_buffers = [(openal.ALuint * self.__buffers_number)() for _ in range(self.__channels_number)]
-        for buf in self.__oal_buffers:
-            openal.alGenBuffers(self.__buffers_number, buf)
-
-        empty_data = np.zeros(self.__buffer_size, dtype=self.__dtype)
-        for buf, speaker in zip(self.__oal_buffers, self.__oal_virtual_speakers):
-            for i in range(self.__buffers_number):
-                openal.alBufferData(buf[i], openal.AL_FORMAT_MONO16, empty_data.tobytes(), empty_data.nbytes, self.__samplerate)
+    def __get_virtual_sink_arguments(self, channels_number):
+        return {
+            "sink_name": self.__get_virtual_sink_name(channels_number),
+            "channels": str(channels_number),
+            "channel_map": ','.join(PULSE_AUDIO_CHANNEL_MAPS.get(channels_number)),
+            "rate": str(self.__samplerate)
+        }
 
-            openal.alSourceQueueBuffers(speaker, self.__buffers_number, buf)
+    def __load_virtual_sink(self, channels_number):
+        arguments = self.__get_virtual_sink_arguments(channels_number)
+        module_id = self.__pulse.module_load("module-null-sink",
+                                             f"sink_name={arguments.get('sink_name')} sink_properties=device.description={self.__sink_name} "
+                                             f"channels={arguments.get('channels')} "
+                                             f"channel_map={arguments.get('channel_map')} "
+                                             f"rate={arguments.get('rate')} ")
+        return module_id, arguments.get("sink_name")
+
+    def __adopt_or_load_virtual_sink(self, channels_number):
+        expected_arguments = self.__get_virtual_sink_arguments(channels_number)
+        adopted_module_id = None
+
+        for module, arguments in find_virtual_sink_modules(self.__pulse, self.__sink_name):
+            if adopted_module_id is None and all(arguments.get(key) == value for key, value in expected_arguments.items()):
+                adopted_module_id = module.index
+            else:
+                self.__pulse.module_unload(module.index)
+
+        if adopted_module_id is not None:
+            return adopted_module_id, expected_arguments.get("sink_name")
+        return self.__load_virtual_sink(channels_number)
+
+    def __save_state(self):
+        save_player_state({
+            "module_id": self.__module_id,
+            "virtual_sink_name": self.__virtual_sink_name,
+            "headset_name": self.__headset_name
+        }, self.__state_file_name)
+
+    def __start_monitor_capture(self, virtual_sink_name, channels_number):
+        monitor_source_name = f"{virtual_sink_name}.monitor"
+        command = ["parec", "--latency-msec=1", "-d", f"{monitor_source_name}", f"--channels={channels_number} --rate={self.__samplerate}"]
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, bufsize=self.__get_pipe_bufsize(channels_number))
+        realtime.apply_thread_settings("audio", pid=process.pid)
+        return process
+
+    def __route_media_streams(self):
+        # Existing streams are moved right away, the ones that show up later are moved as soon as they appear
+        self.__pulse_events.set_route(self.__media_name, self.__headset_name)
 
     def __create_virtual_device(self):
-        self.__module_id = self.__pulse.module_load("module-null-sink",
-                                                    f"sink_name={self.__sink_name} sink_properties=device.description={self.__sink_name} "
-                                                    f"channels={self.__channels_number} "
-                                                    f"channel_map={','.join(self.__pulse_audio_channel_maps.get(self.__channels_number))} "
-                                                    f"rate={self.__samplerate} ")
+        self.__module_id, self.__virtual_sink_name = self.__adopt_or_load_virtual_sink(self.__channels_number)
+        self.__save_state()
 
-
-        virtual_device_sink = self.__pulse.get_sink_by_name(self.__sink_name)
+        virtual_device_sink = self.__pulse.get_sink_by_name(self.__virtual_sink_name)
         self.__pulse.default_set(virtual_device_sink)
 
-        time.sleep(0.1)
-        target_property = 'media.name'
-        for sink_input in self.__pulse.sink_input_list():
-            if target_property in sink_input.proplist and sink_input.proplist[target_property] == self.__media_name:
-                command = ['pactl', 'move-sink-input', str(sink_input.index), self.__headset_name]
-                subprocess.run(command)
+        # Opened on the default sink, so it lands on the virtual device and follows it through reconfigure()
+        self.__keepalive_stream = sd.OutputStream(samplerate=self.__samplerate, channels=1, dtype=self.__dtype,
+                                                  callback=self.__keep_virtual_device_alive)
+        self.__keepalive_stream.start()
+
+        self.__route_media_streams()
 
         volume_for_virtual_device = self.__headset_sink.volume.value_flat
         self.__pulse.volume_set_all_chans(virtual_device_sink,volume_for_virtual_device)
 
         self.__pulse.volume_set_all_chans(self.__headset_sink, 1.0)
 
-        monitor_source_name = f"{self.__sink_name}.monitor"
-        command = ["parec", "--latency-msec=1", "-d", f"{monitor_source_name}", f"--channels={self.__channels_number} --rate={self.__samplerate}"]
-        self.__process = subprocess.Popen(command, stdout=subprocess.PIPE, bufsize=self.__pipe_bufsize)
+        self.__process = self.__start_monitor_capture(self.__virtual_sink_name, self.__channels_number)
+
+    def __keep_virtual_device_alive(self, outdata, frames, time_info, status):
+        # Silence keeps the virtual device from being suspended, so parec always gets data
+        outdata.fill(0)
+
+    def reconfigure(self, channels_number=None, headset_name=None, objects=None):
+        if headset_name is not None and headset_name != self.__headset_name:
+            self.__switch_headset(headset_name)
+
+        if channels_number is not None and channels_number != self.__channels_number:
+            self.__switch_channels_number(channels_number)
+
+        if objects is not None and objects != (self.__object_mixer is not None):
+            self.__switch_objects(objects)
+
+    def __switch_objects(self, objects):
+        object_mixer = self.__create_object_mixer() if objects else None
+        with self.__pipeline_lock:
+            old_object_mixer, self.__object_mixer = self.__object_mixer, object_mixer
+            self.__set_channel_names([] if objects else self.__pulse_channel_order_list)
+        if old_object_mixer is not None:
+            old_object_mixer.close()
+
+    def __switch_headset(self, headset_name):
+        virtual_device_sink = self.__pulse.get_sink_by_name(self.__virtual_sink_name)
+        new_headset_sink = self.__pulse.get_sink_by_name(headset_name)
+
+        self.__pulse.volume_set_all_chans(self.__headset_sink, virtual_device_sink.volume.value_flat)
+        self.__pulse.volume_set_all_chans(virtual_device_sink, new_headset_sink.volume.value_flat)
+        self.__pulse.volume_set_all_chans(new_headset_sink, 1.0)
+
+        self.__headset_name = headset_name
+        self.__headset_sink = new_headset_sink
+        self.__save_state()
 
-    def __update_listener_and_speakers(self, seconds_before_recenter=10):
-        while not self.__stop_event.is_set():
-            # Listener
-            self.__face_tracker.calculate_current_orientation()
-            rotation_matrix_opencv = self.__face_tracker.get_current_orientation()
+        # The OpenAL stream keeps playing, it is only moved to the new headset
+        self.__route_media_streams()
+        for sink_input_index in self.__output_sink_inputs:
+            self.__pulse_events.set_sink_input_route(sink_input_index, headset_name)
 
-            self.__listener_orientation[0] = rotation_matrix_opencv[0]
-            self.__listener_orientation[1] = -rotation_matrix_opencv[1]
-            self.__listener_orientation[2] = rotation_matrix_opencv[2]
+    def __switch_channels_number(self, channels_number):
+        old_module_id = self.__module_id
+        old_virtual_device_sink = self.__pulse.get_sink_by_name(self.__virtual_sink_name)
 
-            combined_vec = np.concatenate((self.__listener_orientation[2], self.__listener_orientation[1]))
-            openal.alListenerfv(openal.AL_ORIENTATION, (ctypes.c_float * 6)(*combined_vec))
+        # Make before break: the new sink and its capture are running before applications leave the old sink
+        new_module_id, new_virtual_sink_name = self.__load_virtual_sink(channels_number)
+        new_virtual_device_sink = self.__pulse.get_sink_by_name(new_virtual_sink_name)
+        self.__pulse.volume_set_all_chans(new_virtual_device_sink, old_virtual_device_sink.volume.value_flat)
+        new_process = self.__start_monitor_capture(new_virtual_sink_name, channels_number)
+
+        self.__pulse.default_set(new_virtual_device_sink)
+        for sink_input in self.__pulse.sink_input_list():
+            if sink_input.sink == old_virtual_device_sink.index:
+                self.__pulse.sink_input_move(sink_input.index, new_virtual_device_sink.index)
+
+        with self.__pipeline_lock:
+            old_process = self.__process
+            self.__process = new_process
+            self.__module_id = new_module_id
+            self.__virtual_sink_name = new_virtual_sink_name
+            self.__pipe_bufsize = self.__get_pipe_bufsize(channels_number)
+            self.__previous_data = None
+
+            self.__pulse_channel_order_list = self.__get_pulse_channel_order_list(channels_number)
+            self.__channels_number = channels_number
+            if self.__object_mixer is None:
+                self.__set_channel_names(self.__pulse_channel_order_list)
+            else:
+                self.__object_mixer.set_sink_index(new_virtual_device_sink.index)
+
+        old_process.terminate()
+        old_process.wait()
+        self.__pulse.module_unload(old_module_id)
+        self.__save_state()
+
+    def __update_listener_and_speakers(self):
+        # Listeners, one camera frame gives the orientation of every face
+        self.__face_tracker.calculate_current_orientation()
+        pose_time = time.perf_counter()
+        listeners_orientations = []
+        for i in range(len(self.__listeners)):
+            rotation_matrix_opencv = self.__face_tracker.get_current_orientation(face_index=i)
+            listeners_orientations.append(np.array([rotation_matrix_opencv[0], -rotation_matrix_opencv[1], rotation_matrix_opencv[2]]))
+        self.__listener_orientation = listeners_orientations[0]
+
+        # Starting and stopping the recordings of applications stays out of the audio thread
+        object_mixer = self.__object_mixer
+        if object_mixer is not None:
+            object_mixer.update_streams()
+
+        with self.__pipeline_lock:
+            for poses, listener_orientation in zip(self.__listeners_poses, listeners_orientations):
+                poses.append((pose_time, listener_orientation))
 
             # Speakers
             self.__set_speakers_parameters()
 
-            time.sleep(0.01)
+    async def __track_listeners(self):
+        next_update_time = time.perf_counter()
+        while True:
+            with self.__pipeline.deadline("tracking", self.__pose_interval):
+                await self.__pipeline.run("tracker", self.__update_listener_and_speakers)
+            next_update_time = max(next_update_time + self.__pose_interval, time.perf_counter())
+            await asyncio.sleep(next_update_time - time.perf_counter())
+
+    def __get_source_gain_and_position(self, source_name, distance):
+        if source_name == FREE_SOURCE_NAME:
+            return 0.0, None
+        if source_name == bass_management.BASS_SOURCE_NAME:
+            return 1.0, None
+        if self.__room_reverb is not None and source_name in self.__room_reverb.get_source_names():
+            return self.__room_level, get_speaker_position(self.__room_reverb.get_source_angle(source_name), distance)
+        return self.__get_channel_parameters(source_name).get("volume") / 100, self.__get_speaker_position(source_name, distance)
 
     def __set_speakers_parameters(self, distance = 1.0):
-        for i, speaker_name in enumerate(self.__pulse_channel_order_list):
-            speaker_volume = ctypes.c_float(self.__speakers_parameters.get(speaker_name).get("volume") / 100)
-            openal.alSourcefv(self.__oal_virtual_speakers[i], openal.AL_GAIN, speaker_volume)
-
-            speaker_position = (ctypes.c_float * 3)(*self.__get_speaker_position(speaker_name, distance))
-            openal.alSourcefv(self.__oal_virtual_speakers[i], openal.AL_POSITION, speaker_position)
+        if self.__bass_manager is not None:
+            self.__bass_manager.set_gains([self.__get_channel_parameters(speaker_name).get("volume") / 100
+                                           for speaker_name in self.__channel_names])
+        if self.__room_reverb is not None:
+            self.__room_reverb.set_speakers([(self.__get_channel_parameters(speaker_name).get("volume") / 100,
+                                              self.__get_channel_parameters(speaker_name).get("angle"))
+                                             for speaker_name in self.__channel_names])
+        speakers_gains_and_positions = [self.__get_source_gain_and_position(source_name, distance) for source_name in self.__source_slots]
+        # The settings change rarely, OpenAL only hears about it when they do
+        if speakers_gains_and_positions == self.__applied_speakers_parameters:
+            return
+        self.__applied_speakers_parameters = speakers_gains_and_positions
+        for listener in self.__listeners:
+            listener.set_speakers_parameters(speakers_gains_and_positions)
+
+    def __get_rendered_orientation(self, poses, render_time):
+        (start_time, start), (end_time, end) = poses[0], poses[-1]
+        if end_time <= start_time:
+            return end
+        fraction = min(max((render_time - start_time) / (end_time - start_time), 0.0), 1.0)
+        return interpolate_listener_orientation(start, end, fraction)
+
+    def __update_listeners_orientations(self):
+        # Rendering one pose interval behind the tracker keeps every block between two known poses,
+        # OpenAL Soft then fades its HRTF filters across the block
+        render_time = time.perf_counter() - self.__pose_interval
+        for listener, poses in zip(self.__listeners, self.__listeners_poses):
+            listener.set_orientation(self.__get_rendered_orientation(poses, render_time))
+        self.__listener_rate_gauge.tick()
 
     def get_listener_orientation(self):
         return self.__listener_orientation
 
-    def start_playing(self):
-        self.__play_sound_thread.start()
-
-    def __play_sound(self):
-        for speaker in self.__oal_virtual_speakers:
-            openal.alSourcePlay(speaker)
+    def get_buffers_number(self):
+        return self.__buffers_number
 
-        # Main loop
-        while not self.__stop_event.is_set():
-            data = self.__process.stdout.read(self.__pipe_bufsize)
+    def start_playing(self):
+        captured_blocks = self.__pipeline.create_queue("captured blocks", CAPTURE_QUEUE_BLOCKS)
+        rendered_blocks = self.__pipeline.create_queue("rendered blocks", RENDERED_QUEUE_BLOCKS)
+        self.__pipeline.add_stage("capture", self.__capture_blocks, captured_blocks)
+        self.__pipeline.add_stage("render", self.__render_blocks, captured_blocks, rendered_blocks)
+        if self.__portaudio_output is not None:
+            self.__pipeline.add_stage("output", self.__output_blocks, rendered_blocks)
+
+    def __read_capture(self):
+        with self.__pipeline_lock:
+            process = self.__process
+            pipe_bufsize = self.__pipe_bufsize
+
+        with TRACER.span("VirtualPlayer.read_capture"):
+            return process, process.stdout.read(pipe_bufsize)
+
+    async def __capture_blocks(self, captured_blocks):
+        while True:
+            process, data = await self.__pipeline.run("capture", self.__read_capture)
+            # A full queue leaves the next block in the pipe, the renderer is never more than a few blocks behind
+            await captured_blocks.put((process, data))
+            # An old capture ends when reconfigure() swaps it, the current one only when the player stops
+            if not data and process is self.__process:
+                return
+
+    def __play_listeners(self):
+        with self.__pipeline_lock:
+            for listener in self.__listeners:
+                listener.play()
+            self.__playing = True
+
+    def __render_block(self, process, data):
+        with self.__pipeline_lock:
+            # The capture was swapped by reconfigure() after this block was read
+            if process is not self.__process:
+                return True, None
             if not self.__handle_playing(data):
-                break
-
-        self.__process.terminate()
-        self.__process.wait()
-
+                return False, None
+            rendered_block, self.__rendered_block = self.__rendered_block, None
+            return True, rendered_block
+
+    async def __render_blocks(self, captured_blocks, rendered_blocks):
+        block_seconds = self.__buffer_size / self.__samplerate
+        await self.__pipeline.run("audio", self.__play_listeners)
+        while True:
+            process, data = await captured_blocks.get()
+            with self.__pipeline.deadline("render", block_seconds):
+                playing, rendered_block = await self.__pipeline.run("audio", self.__render_block, process, data)
+            if not playing:
+                return
+            if rendered_block is not None:
+                await rendered_blocks.put(rendered_block)
+
+    async def __output_blocks(self, rendered_blocks):
+        # Waiting for room in the ring buffer is what paces the pipeline, a full queue holds the renderer back
+        while True:
+            rendered_block = await rendered_blocks.get()
+            await self.__pipeline.run("output", self.__portaudio_output.write, rendered_block)
+
+    @traced("VirtualPlayer.handle_playing")
     def __handle_playing(self, data):
         if not data:
             return False
 
+        METRICS.increment("capture_blocks_total")
+        # A loopback listener must render every block, or its output clock would lose them
         if data == self.__previous_data:
-            return True
+            METRICS.increment("capture_duplicate_blocks_total")
+            if not self.__listeners[0].is_loopback() and self.__object_mixer is None:
+                return True
 
         self.__previous_data = data
 
-        samples = np.frombuffer(data, dtype=self.__dtype)
-        channels = len(self.__oal_virtual_speakers)
-        channels_data = [samples[i::channels] for i in range(channels)]
-
-        for i, (speaker, channel_data) in enumerate(zip(self.__oal_virtual_speakers, channels_data)):
-            processed = openal.ALint()
-            openal.alGetSourcei(speaker, openal.AL_BUFFERS_PROCESSED, processed)
-            if processed.value > 0:
-                buf_to_refill = openal.ALuint()
-                openal.alSourceUnqueueBuffers(speaker, 1, buf_to_refill)
-
-                openal.alBufferData(buf_to_refill, openal.AL_FORMAT_MONO16, channel_data.tobytes(), channel_data.nbytes,
-                                    self.__samplerate)
-                openal.alSourceQueueBuffers(speaker, 1, buf_to_refill)
+        self.__update_listeners_orientations()
 
-            # Sometimes SourcePlayer needs to be restarted
-            state = openal.ALint()
-            openal.alGetSourcei(speaker, openal.AL_SOURCE_STATE, state)
-            if state.value not in [openal.AL_PLAYING, openal.AL_PAUSED]:
-                openal.alSourcePlay(speaker)
+        # The capture is read and split once, every listener renders the same channels. The last read of a capture
+        # that ends can stop in the middle of a frame
+        channels = self.__channels_number
+        frames = len(data) // (np.dtype(self.__dtype).itemsize * channels)
+        if frames == 0:
+            return True
+        samples = np.frombuffer(data, dtype=self.__dtype, count=frames * channels)
+        if self.__object_mixer is None:
+            channels_data = [samples[i::channels] for i in range(channels)]
+        else:
+            # The sink capture only paces the loop, every application is read on its own
+            with TRACER.span("VirtualPlayer.read_objects"):
+                object_names, channels_data = self.__object_mixer.read_block(frames)
+            if object_names != self.__channel_names:
+                self.__set_channel_names(object_names)
+        room_data = []
+        if self.__room_reverb is not None:
+            with TRACER.span("VirtualPlayer.room_reverb"):
+                room_data = self.__room_reverb.process(channels_data)
+        if self.__bass_manager is not None:
+            with TRACER.span("VirtualPlayer.bass_management"):
+                channels_data = self.__bass_manager.process(channels_data)
+        channels_data = self.__get_slots_data(channels_data + room_data, frames)
+
+        for listener in self.__listeners:
+            listener.queue_block(channels_data, self.__source_slots)
+
+        # A loopback listener renders right after the new block is queued: OpenAL plays the previous block,
+        # the parametric renderer the new one
+        if self.__listeners[0].is_loopback():
+            with TRACER.span("VirtualPlayer.render_loopback"):
+                rendered_block = self.__listeners[0].render(frames)
+            if self.__loopback_output is not None:
+                self.__loopback_output.write(rendered_block)
+            if self.__portaudio_output is not None:
+                self.__rendered_block = rendered_block
 
         return True
 
 
     def stop(self):
-        self.__stop_event.set()
+        self.__pulse_events.clear_route(self.__media_name)
+        for sink_input_index in self.__listener_sink_inputs + self.__output_sink_inputs:
+            self.__pulse_events.clear_sink_input_route(sink_input_index)
 
-        self.__play_sound_thread.join()
-        self.__orientation_thread.join()
-        self.__pulse.volume_set_all_chans(self.__headset_sink, self.__pulse.get_sink_by_name(self.__sink_name).volume.value_flat)
-        self.__pulse.default_set(self.__pulse.get_sink_by_name(self.__headset_name))
+        # Ending the capture unblocks its read, the stages that still wait are cancelled
         self.__process.terminate()
-        self.__default_device_stimulant_process.terminate()
-        openal.alDeleteSources(self.__channels_number, (openal.ALuint * self.__channels_number)(*self.__oal_virtual_speakers))
-        for buf in self.__oal_buffers:
-            openal.alDeleteBuffers(self.__buffers_number, buf)
-        openal.alcDestroyContext(self.__oal_context)
-        openal.alcCloseDevice(self.__oal_device)
+        self.__process.wait()
+        self.__pipeline.stop()
+        with self.__pipeline_lock:
+            self.__playing = False
+        self.__pulse.volume_set_all_chans(self.__headset_sink, self.__pulse.get_sink_by_name(self.__virtual_sink_name).volume.value_flat)
+        self.__pulse.default_set(self.__pulse.get_sink_by_name(self.__headset_name))
+        self.__keepalive_stream.close()
+        for listener in self.__listeners:
+            listener.close()
+        if self.__loopback_output is not None:
+            self.__loopback_output.close()
+        if self.__portaudio_output is not None:
+            self.__portaudio_output.close()
+        if self.__object_mixer is not None:
+            self.__object_mixer.close()
         self.__pulse.module_unload(self.__module_id)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+        remove_player_state(self.__state_file_name)